@@ -0,0 +1,290 @@
+"""Generates synthetic Pukiwiki dumps to benchmark the exporters with.
+
+python -m bench.dump -n 1000 --max-size 64K dump.tar.gz
+"""
+
+import argparse
+import io
+import random
+import tarfile
+import typing
+
+import pukiwiki
+from encoding.size import parse_size
+from pukiwiki.charset import ENCODINGS
+
+# Relative weights of the kinds of blocks in a page
+DEFAULT_MIX = {
+    "heading": 1,
+    "list": 3,
+    "pre": 1,
+    "codeblock": 1,
+    "link": 2,
+    "text": 4,
+}
+
+DISTRIBUTIONS = ["uniform", "lognormal"]
+
+_ASCII_WORDS = (
+    "alpha beta gamma delta server client config release build deploy"
+    " network storage backup user group schedule report meeting memo"
+).split()
+
+_JAPANESE_WORDS = (
+    "議事録 設定 手順 サーバ 運用 障害 対応 予定 会議 資料 研究室 "
+    "ネットワーク バックアップ 日本語 テスト 環境 構築 メモ"
+).split()
+
+_DATE = "2020-01-01T00:00:00+09:00"
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """Parses weights of block kinds, such as 'heading=1,list=3'"""
+    mix = dict.fromkeys(DEFAULT_MIX, 0)
+
+    for item in text.split(","):
+        kind, sep, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in mix or sep == "":
+            raise argparse.ArgumentTypeError(f"invalid block kind: {item}")
+
+        try:
+            mix[kind] = int(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight: {item}")
+
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("no block kind has a weight")
+
+    return mix
+
+
+class DumpGenerator:
+    """Writes random pages with hierarchical names into a tar dump, encoding
+    names and contents like `index.php?cmd=dump` does"""
+
+    def __init__(
+        self,
+        pages: int,
+        min_size: int = 256,
+        max_size: int = 16 * 1024,
+        distribution: str = "lognormal",
+        depth: int = 3,
+        japanese: float = 0.5,
+        mix: dict[str, int] | None = None,
+        seed: int = 0,
+        encoding: str = pukiwiki.DEFAULT_ENCODING,
+    ):
+        self.pages = pages
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.distribution = distribution
+        self.depth = max(depth, 1)
+        self.japanese = japanese
+        self.mix = mix or DEFAULT_MIX
+        self.encoding = encoding
+
+        self.random = random.Random(seed)
+        self.names: list[str] = []
+
+    def word(self) -> str:
+        if self.random.random() < self.japanese:
+            return self.random.choice(_JAPANESE_WORDS)
+        return self.random.choice(_ASCII_WORDS)
+
+    def words(self, n: int) -> str:
+        return " ".join(self.word() for _ in range(n))
+
+    def name(self) -> str:
+        """Returns a new page name, under an existing page at times"""
+        for _ in range(100):
+            name = self.word() + str(self.random.randrange(1000))
+
+            if self.names and self.random.random() < 0.6:
+                parent = self.random.choice(self.names)
+                if parent.count("/") + 1 < self.depth:
+                    name = f"{parent}/{name}"
+
+            if name not in self.names:
+                return name
+
+        return f"Page{len(self.names)}"
+
+    def size(self) -> int:
+        if self.distribution == "uniform":
+            return self.random.randint(self.min_size, self.max_size)
+
+        # Most pages are small, and a few are large
+        median = self.min_size * 4
+        size = int(self.random.lognormvariate(0, 1) * median)
+        return min(max(size, self.min_size), self.max_size)
+
+    def block(self, kind: str) -> list[str]:
+        r = self.random
+
+        if kind == "heading":
+            level = "*" * r.randint(1, 3)
+            return [f"{level}{self.words(3)} [#{r.getrandbits(32):08x}]"]
+
+        if kind == "list":
+            return [
+                "-" * r.randint(1, 3) + self.words(4)
+                for _ in range(r.randint(1, 5))
+            ]
+
+        if kind == "pre":
+            return [f" {self.words(4)} <br> & x" for _ in range(3)]
+
+        if kind == "codeblock":
+            lines = [f"{self.words(3)} = {i}" for i in range(r.randint(1, 5))]
+            return ["#pre{{", *lines, "}}"]
+
+        if kind == "link":
+            links = [
+                f"[[{self.word()}>https://example.com/{r.randrange(100)}]]"
+            ]
+            if self.names:
+                links.append(f"[[{r.choice(self.names)}]]")
+                links.append(f"[[{self.word()}>{r.choice(self.names)}]]")
+            return [" ".join(links)]
+
+        text = self.words(8)
+        return [f"{text} ''{self.word()}'' %%{self.word()}%% &br;"]
+
+    def content(self, size: int) -> bytes:
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+
+        lines = [f'#author("{_DATE}","","")', "#contents"]
+        length = 0
+        while length < size:
+            kind = self.random.choices(kinds, weights)[0]
+            for line in self.block(kind):
+                lines.append(line)
+                length += len(line.encode(self.encoding)) + 1
+
+        text = "\n".join(lines) + "\n"
+        return text.encode(self.encoding)
+
+    def write(self, tar: tarfile.TarFile):
+        for _ in range(self.pages):
+            name = self.name()
+            self.names.append(name)
+
+            content = self.content(self.size())
+            add_file(tar, f"wiki/{self.encode_name(name)}.txt", content)
+
+        # Files which the exporters skip
+        add_file(tar, f"wiki/{self.encode_name(':config')}.txt")
+        front, a = self.encode_name("FrontPage"), self.encode_name("a")
+        add_file(tar, f"attach/{front}_{a}")
+
+    def encode_name(self, name: str) -> str:
+        """Encodes a page name into a file name like Pukiwiki does"""
+        return name.encode(self.encoding).hex().upper()
+
+
+def add_file(tar: tarfile.TarFile, path: str, content: bytes = b""):
+    info = tarfile.TarInfo(path)
+    info.size = len(content)
+    info.mtime = 0
+    tar.addfile(info, io.BytesIO(content))
+
+
+def write_dump(file: typing.IO[bytes], generator: DumpGenerator, mode: str):
+    with tarfile.open(
+        fileobj=file,
+        mode=mode,
+        format=tarfile.GNU_FORMAT,
+        encoding=pukiwiki.DEFAULT_ENCODING,
+    ) as tar:
+        generator.write(tar)
+
+
+def tar_mode(filename: str) -> str:
+    """Returns the mode to write a tar compressed by its file name"""
+    for suffix, compression in [(".gz", "gz"), (".bz2", "bz2"), (".xz", "xz")]:
+        if filename.endswith(suffix):
+            return f"w:{compression}"
+    return "w"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic Pukiwiki dump for benchmarks."
+    )
+    parser.add_argument(
+        "output",
+        metavar="DUMP_FILE",
+        help="file name of the dump. It is compressed by the suffix .gz, .bz2"
+        " or .xz.",
+    )
+    parser.add_argument(
+        "-n", "--pages", type=int, default=1000, help="number of pages"
+    )
+    parser.add_argument(
+        "--min-size",
+        type=parse_size,
+        default=256,
+        help="minimum size of a page. Default to 256.",
+    )
+    parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        default=16 * 1024,
+        help="maximum size of a page. Default to 16K.",
+    )
+    parser.add_argument(
+        "--distribution",
+        choices=DISTRIBUTIONS,
+        default="lognormal",
+        help="distribution of page sizes. Default to 'lognormal'.",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=3,
+        help="maximum nesting depth of page names. Default to 3.",
+    )
+    parser.add_argument(
+        "--japanese",
+        type=float,
+        default=0.5,
+        help="ratio of Japanese words in names and contents. Default to 0.5.",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="weights of block kinds, such as 'heading=1,list=3,pre=1,"
+        "codeblock=1,link=2,text=4' (the default). Kinds not given get 0.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--encoding",
+        choices=ENCODINGS,
+        default=pukiwiki.DEFAULT_ENCODING,
+        help="encoding of names and contents, which is UTF-8 for the UTF-8"
+        f" builds of Pukiwiki. Default to '{pukiwiki.DEFAULT_ENCODING}'.",
+    )
+
+    args = parser.parse_args()
+
+    generator = DumpGenerator(
+        args.pages,
+        args.min_size,
+        args.max_size,
+        args.distribution,
+        args.depth,
+        args.japanese,
+        args.mix,
+        args.seed,
+        args.encoding,
+    )
+
+    with open(args.output, "wb") as f:
+        write_dump(f, generator, tar_mode(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Measures the throughput of each stage of the exporters on a dump, and
+saves the results as JSON to compare them between commits.
+
+    python -m bench.dump -n 1000 dump.tar
+    python -m bench.run dump.tar -o HEAD.json --compare BASE.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import typing
+
+import pukiwiki
+from encoding.growi.archive import ArchiveWriter
+from encoding.growi.page import Page
+from encoding.growi.revision import Revision
+from encoding.growi.serialize import BACKEND as JSON_BACKEND, encode
+from encoding.growi.user import User
+from encoding.html.renderer import RENDERERS, create_renderer
+
+RESULTS_VERSION = 1
+
+
+class Stage:
+    """Throughput of a stage, from the best of a few runs"""
+
+    def __init__(self, seconds: float, items: int, size: int):
+        self.seconds = seconds
+        self.items = items
+        self.size = size
+
+    def json(self) -> dict:
+        seconds = max(self.seconds, 1e-9)
+        return {
+            "seconds": self.seconds,
+            "items": self.items,
+            "bytes": self.size,
+            "items_per_second": self.items / seconds,
+            "bytes_per_second": self.size / seconds,
+        }
+
+
+def measure(
+    f: typing.Callable[[], typing.Any], items: int, size: int, repeat: int
+) -> Stage:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+
+    return Stage(best, items, size)
+
+
+def read_pages(path: str) -> tuple[list[str], list[bytes], int]:
+    """Returns the names and raw contents of the wiki pages, and the number
+    of members of the dump"""
+    names = []
+    contents = []
+    members = 0
+
+    with open(path, "rb") as f:
+        tar = pukiwiki.open_tar(f)
+        for member in tar:
+            members += 1
+            if not member.isfile() or not pukiwiki.is_wiki_page(member):
+                continue
+
+            r = tar.extractfile(member)
+            if r is None:
+                continue
+
+            names.append(pukiwiki.normalize_path(member.path))
+            contents.append(r.read())
+
+    return names, contents, members
+
+
+def iterate_tar(path: str):
+    with open(path, "rb") as f:
+        tar = pukiwiki.open_tar(f)
+        for member in tar:
+            if member.isfile():
+                r = tar.extractfile(member)
+                if r is not None:
+                    r.read()
+
+
+def run_rules(texts: list[str]) -> dict[str, Stage]:
+    """Measures each rule of the pipeline on the output of the previous one,
+    as the pipeline runs them"""
+    stages = {}
+
+    for rule in pukiwiki.PIPELINE_RULES:
+        size = sum(len(t) for t in texts)
+
+        start = time.perf_counter()
+        texts = [rule(t) for t in texts]
+        seconds = time.perf_counter() - start
+
+        stages[f"rule.{rule.__name__}"] = Stage(seconds, len(texts), size)
+
+    return stages
+
+
+def growi_records(
+    names: list[str], bodies: list[str]
+) -> tuple[list[Page], list[Revision]]:
+    user = User("pukiwiki", "seed")
+    pages = []
+    revisions = []
+
+    for name, body in zip(names, bodies):
+        page = Page(name)
+        revision = Revision(page.id, body, user.id)
+        page.revisionId = revision.id
+
+        pages.append(page)
+        revisions.append(revision)
+
+    return pages, revisions
+
+
+def write_archive(pages: list[Page], revisions: list[Revision]) -> int:
+    f = io.BytesIO()
+    with ArchiveWriter(f, [], {}) as archive:
+        for page, revision in zip(pages, revisions):
+            archive.write(page, revision)
+    return f.tell()
+
+
+def render_html(renderer_name: str, bodies: list[str]):
+    renderer = create_renderer(renderer_name)
+    try:
+        docs = (renderer.parse(body) for body in bodies)
+        for _ in renderer.render(docs):
+            pass
+    finally:
+        renderer.close()
+
+
+def run(
+    path: str, repeat: int = 3, html_pages: int = 20
+) -> dict[str, Stage | str]:
+    stages: dict[str, Stage | str] = {}
+
+    names, contents, members = read_pages(path)
+    raw_size = sum(len(c) for c in contents)
+
+    stages["open_tar"] = measure(
+        lambda: iterate_tar(path), members, os.path.getsize(path), repeat
+    )
+
+    stages["decode"] = measure(
+        lambda: [pukiwiki.decode(c) for c in contents],
+        len(contents),
+        raw_size,
+        repeat,
+    )
+    texts = [pukiwiki.decode(c) for c in contents]
+    text_size = sum(len(t) for t in texts)
+
+    for engine in pukiwiki.ENGINES:
+        stages[f"convert.{engine}"] = measure(
+            lambda: [pukiwiki.convert(t, engine) for t in texts],
+            len(texts),
+            text_size,
+            repeat,
+        )
+
+    stages.update(run_rules(texts))
+
+    bodies = [pukiwiki.convert(t) for t in texts]
+    body_size = sum(len(b) for b in bodies)
+
+    def serialize():
+        pages, revisions = growi_records(names, bodies)
+        return [encode(r) for r in pages + revisions]
+
+    def serialize_dicts():
+        pages, revisions = growi_records(names, bodies)
+        return [json.dumps(r.json()) for r in pages + revisions]
+
+    # The records with their templates, and the dicts `json.dumps` takes
+    stages["json"] = measure(serialize, len(bodies), body_size, repeat)
+    stages["json.dict"] = measure(
+        serialize_dicts, len(bodies), body_size, repeat
+    )
+
+    pages, revisions = growi_records(names, bodies)
+    stages["zip"] = measure(
+        lambda: write_archive(pages, revisions),
+        len(pages),
+        body_size,
+        repeat,
+    )
+
+    sample = bodies[:html_pages]
+    for renderer in RENDERERS:
+        try:
+            stages[f"html.{renderer}"] = measure(
+                lambda: render_html(renderer, sample),
+                len(sample),
+                sum(len(b) for b in sample),
+                1,
+            )
+        except OSError as e:
+            stages[f"html.{renderer}"] = f"skipped: {e}"
+
+    return stages
+
+
+def git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip()
+
+
+def results_json(path: str, stages: dict[str, Stage | str]) -> dict:
+    return {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "json_backend": JSON_BACKEND,
+        "dump": {"path": path, "size": os.path.getsize(path)},
+        "stages": {
+            name: stage.json() if isinstance(stage, Stage) else stage
+            for name, stage in stages.items()
+        },
+    }
+
+
+def print_results(results: dict, base: dict | None = None):
+    base_stages = base["stages"] if base is not None else {}
+
+    for name, stage in results["stages"].items():
+        if isinstance(stage, str):
+            print(f"{name:28} {stage}")
+            continue
+
+        line = (
+            f"{name:28} {stage['bytes_per_second'] / 1024 / 1024:10.2f} MiB/s"
+            f" {stage['items_per_second']:10.1f} items/s"
+        )
+
+        old = base_stages.get(name)
+        if isinstance(old, dict) and old["bytes_per_second"] > 0:
+            ratio = stage["bytes_per_second"] / old["bytes_per_second"]
+            line += f" {ratio:6.2f}x"
+
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the stages of the exporters on a dump."
+    )
+    parser.add_argument("dump", metavar="DUMP_FILE", help="dump to read")
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        default=None,
+        help="file to save the results into as JSON",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        default=None,
+        help="results of an earlier run to print the speedup against",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of runs of each stage, of which the fastest is taken."
+        " Default to 3.",
+    )
+    parser.add_argument(
+        "--html-pages",
+        type=int,
+        default=20,
+        help="number of pages to render into HTML, which is slow. Default to"
+        " 20.",
+    )
+
+    args = parser.parse_args()
+
+    stages = run(args.dump, args.repeat, args.html_pages)
+    results = results_json(args.dump, stages)
+
+    base = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            base = json.load(f)
+
+    print_results(results, base)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import hashlib
+import mimetypes
+import tempfile
+import threading
+import typing
+from typing import Iterator
+
+from encoding.size import format_size
+
+# Attachments are copied in chunks of this size, which is also the chunk size
+# of GridFS where Growi stores them
+CHUNK_SIZE = 255 * 1024
+
+
+class Blob:
+    """The content of one or more identical attachments, in the spool file of
+    an `AttachmentStore`"""
+
+    __slots__ = ("digest", "offset", "size")
+
+    def __init__(self, digest: str, offset: int, size: int):
+        self.digest = digest
+        self.offset = offset
+        self.size = size
+
+
+class Attachment:
+    __slots__ = ("page", "file", "blob")
+
+    def __init__(self, page: str, file: str, blob: Blob):
+        self.page = page
+        self.file = file
+        self.blob = blob
+
+    def content_type(self) -> str:
+        t, _ = mimetypes.guess_type(self.file, strict=False)
+        return t or "application/octet-stream"
+
+
+class AttachmentStore:
+    """Keeps the attachments of a dump until the output is written, since
+    they come after the pages in a dump.
+
+    They are copied in fixed-size chunks into a temporary file, so that no
+    attachment is ever read into memory as a whole, and identical contents
+    are kept once by their hash. Once they are added, they may be read back
+    from several threads."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.spool = tempfile.TemporaryFile()
+
+        # Reading seeks the spool, which is shared by the readers
+        self.lock = threading.Lock()
+
+        self.blobs: dict[str, Blob] = {}
+        self.attachments: dict[tuple[str, str], Attachment] = {}
+
+        self.duplicates = 0
+        self.duplicate_size = 0
+
+    def add(self, page: str, file: str, f: typing.IO[bytes]) -> Attachment:
+        offset = self.spool.seek(0, 2)
+        m = hashlib.sha256()
+
+        while chunk := f.read(self.chunk_size):
+            m.update(chunk)
+            self.spool.write(chunk)
+
+        digest = m.hexdigest()
+        size = self.spool.tell() - offset
+
+        blob = self.blobs.get(digest)
+        if blob is None:
+            blob = self.blobs[digest] = Blob(digest, offset, size)
+        else:
+            # Drop the copy of a content stored already
+            self.spool.truncate(offset)
+            self.duplicates += 1
+            self.duplicate_size += size
+
+        attachment = Attachment(page, file, blob)
+        self.attachments[(page, file)] = attachment
+        return attachment
+
+    def find(self, page: str, file: str) -> Attachment | None:
+        return self.attachments.get((page, file))
+
+    def __iter__(self) -> Iterator[Attachment]:
+        return iter(self.attachments.values())
+
+    def chunks(self, blob: Blob) -> Iterator[bytes]:
+        """Reads a blob back in chunks"""
+        end = blob.offset + blob.size
+        position = blob.offset
+
+        while position < end:
+            with self.lock:
+                self.spool.seek(position)
+                chunk = self.spool.read(min(self.chunk_size, end - position))
+            position += len(chunk)
+            yield chunk
+
+    def copy(self, blob: Blob, out: typing.IO[bytes]):
+        for chunk in self.chunks(blob):
+            out.write(chunk)
+
+    def report(self) -> str:
+        stored = sum(blob.size for blob in self.blobs.values())
+        s = (
+            f"Attachments: {len(self.attachments)} files,"
+            f" {len(self.blobs)} stored ({format_size(stored)})"
+        )
+        if self.duplicates > 0:
+            s += (
+                f", {self.duplicates} duplicates"
+                f" ({format_size(self.duplicate_size)}) stored once"
+            )
+        return s
+
+    def close(self):
+        self.spool.close()
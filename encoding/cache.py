@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pukiwiki
+from encoding.profile import Profiler, convert_page
+from encoding.size import format_size
+
+DEFAULT_MAX_SIZE = 1024**3
+
+# Evict down to this ratio of the maximum size, so that a full cache is not
+# scanned on every write
+_EVICT_RATIO = 0.9
+
+_DATABASE_FILENAME = "cache.sqlite3"
+
+KIND_MARKDOWN = "markdown"
+KIND_HTML = "html"
+
+# Version of the values of markdown entries, which have the decode errors of
+# their page since 2
+_MARKDOWN_VERSION = "2"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+"""
+
+
+def _hash(*parts: bytes) -> str:
+    m = hashlib.sha256()
+    for part in parts:
+        # Prefix lengths so that the boundaries of parts are unambiguous
+        m.update(b"%d:" % len(part))
+        m.update(part)
+    return m.hexdigest()
+
+
+class Cache:
+    """An on-disk cache of converted pages shared between runs.
+
+    Entries are addressed by a hash of their source and the version of the
+    code producing them, and the least recently used ones are evicted once
+    the cache grows over `max_size` bytes."""
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        os.makedirs(directory, exist_ok=True)
+
+        self.max_size = max_size
+        self.db = sqlite3.connect(os.path.join(directory, _DATABASE_FILENAME))
+        self.db.executescript(_SCHEMA)
+
+        row = self.db.execute("SELECT SUM(size) FROM entries").fetchone()
+        self.size = row[0] or 0
+        if self.size > self.max_size:
+            self.evict()
+
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    def get(self, kind: str, key: str) -> bytes | None:
+        row = self.db.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+            return None
+
+        self.hits[kind] = self.hits.get(kind, 0) + 1
+        self.db.execute(
+            "UPDATE entries SET used = ? WHERE key = ?", (time.time(), key)
+        )
+        return row[0]
+
+    def put(self, key: str, value: bytes):
+        old = self.db.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if old is not None:
+            self.size -= old[0]
+
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()),
+        )
+        self.size += len(value)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        rows = self.db.execute(
+            "SELECT key, size FROM entries ORDER BY used"
+        ).fetchall()
+
+        target = self.max_size * _EVICT_RATIO
+        for key, size in rows:
+            if self.size <= target:
+                break
+
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.size -= size
+
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def get_markdown(
+        self,
+        content: bytes,
+        engine: str = pukiwiki.DEFAULT_ENGINE,
+        encoding: str | None = None,
+    ) -> tuple[str, str | None] | None:
+        """Returns the converted body and the date of a raw page, decoded in
+        `encoding` or that of the dump. A page which had undecodable bytes is
+        counted in `pukiwiki.decode_errors` again, as when it is converted."""
+        key = self.markdown_key(content, engine, encoding)
+        value = self.get(KIND_MARKDOWN, key)
+        if value is None:
+            return None
+
+        body, date, errors = json.loads(value)
+        pukiwiki.decode_errors.add(errors)
+        return body, date
+
+    def put_markdown(
+        self,
+        content: bytes,
+        converted: tuple[str, str | None],
+        engine: str = pukiwiki.DEFAULT_ENGINE,
+        encoding: str | None = None,
+        errors: int = 0,
+    ):
+        """Stores a converted page, with whether it had undecodable bytes"""
+        key = self.markdown_key(content, engine, encoding)
+        body, date = converted
+        value = json.dumps([body, date, errors]).encode()
+        self.put(key, value)
+
+    def get_html(self, markdown: str, renderer_version: str) -> str | None:
+        key = self.html_key(markdown, renderer_version)
+        value = self.get(KIND_HTML, key)
+        if value is None:
+            return None
+
+        return value.decode()
+
+    def put_html(self, markdown: str, renderer_version: str, html: str):
+        key = self.html_key(markdown, renderer_version)
+        self.put(key, html.encode())
+
+    @staticmethod
+    def markdown_key(
+        content: bytes, engine: str, encoding: str | None = None
+    ) -> str:
+        encoding = encoding or pukiwiki.get_encoding()
+        return _hash(
+            KIND_MARKDOWN.encode(),
+            _MARKDOWN_VERSION.encode(),
+            pukiwiki.CONVERTER_VERSION.encode(),
+            engine.encode(),
+            encoding.encode(),
+            content,
+        )
+
+    @staticmethod
+    def html_key(markdown: str, renderer_version: str) -> str:
+        return _hash(
+            KIND_HTML.encode(),
+            renderer_version.encode(),
+            markdown.encode(),
+        )
+
+    def report(self) -> str:
+        kinds = sorted(set(self.hits) | set(self.misses))
+        stats = ", ".join(
+            f"{kind} {self.hits.get(kind, 0)} hits"
+            f" / {self.misses.get(kind, 0)} misses"
+            for kind in kinds
+        )
+
+        return f"Cache: {stats or 'unused'} ({format_size(self.size)} stored)"
+
+
+def open_cache(
+    directory: str | None, max_size: int = DEFAULT_MAX_SIZE
+) -> Cache | None:
+    if directory is None:
+        return None
+
+    return Cache(directory, max_size)
+
+
+def convert_cached(
+    content: bytes,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    cache: Cache | None = None,
+    profiler: Profiler | None = None,
+    name: str = "",
+) -> tuple[str, str | None]:
+    """`pukiwiki.convert_page` looking up `cache` first"""
+    if cache is None:
+        return convert_page(content, engine, profiler, name)
+
+    converted = cache.get_markdown(content, engine)
+    if converted is None:
+        errors = pukiwiki.decode_errors.pages
+        converted = convert_page(content, engine, profiler, name)
+        errors = pukiwiki.decode_errors.pages - errors
+        cache.put_markdown(content, converted, engine, errors=errors)
+
+    return converted
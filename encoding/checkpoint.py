@@ -0,0 +1,240 @@
+import json
+import os
+import random
+import tarfile
+import typing
+from typing import Iterable, Iterator
+
+import pukiwiki
+from pukiwiki.dumpindex import detect_compression
+
+CHECKPOINT_VERSION = 2
+
+# Pages exported between two checkpoints
+DEFAULT_INTERVAL = 1000
+
+_STATE_FILE = "state.json"
+_RECORDS_FILE = "records.jsonl"
+
+M = typing.TypeVar("M")
+
+
+def data_end(member: tarfile.TarInfo) -> int:
+    """Offset of the header following a member"""
+    blocks = -(-member.size // tarfile.BLOCKSIZE)
+    return member.offset_data + blocks * tarfile.BLOCKSIZE
+
+
+def dump_fingerprint(source: typing.IO[bytes] | pukiwiki.DataDirectory):
+    """Identifies a dump, so that a checkpoint is not resumed on another"""
+    if isinstance(source, pukiwiki.DataDirectory):
+        return {"directory": os.path.abspath(source.root)}
+
+    st = os.fstat(source.fileno())
+    return {
+        "file": os.path.abspath(source.name),
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+    }
+
+
+def random_state() -> list:
+    version, internal, gauss = random.getstate()
+    return [version, list(internal), gauss]
+
+
+def set_random_state(state: list):
+    """IDs are random, so restoring the generator gives the pages after a
+    checkpoint the IDs of an uninterrupted export"""
+    version, internal, gauss = state
+    random.setstate((version, tuple(internal), gauss))
+
+
+class Position:
+    """The members of a dump read so far, and the offset of the next one in a
+    tar. A resumed tar is read from that offset when it is not compressed,
+    and other dumps by reading over the members read before."""
+
+    def __init__(self, members: int = 0, offset: int | None = None):
+        self.members = members
+        self.offset = offset
+
+        # Members to read over, and the offset the tar was opened at
+        self.skip = 0
+        self.base = 0
+
+    def iterate(self, members: Iterable[M]) -> Iterator[M]:
+        for member in members:
+            if self.skip > 0:
+                self.skip -= 1
+                continue
+
+            self.members += 1
+            if isinstance(member, tarfile.TarInfo):
+                self.offset = self.base + data_end(member)
+            yield member
+
+    def seek(self, source: typing.IO[bytes] | pukiwiki.DataDirectory):
+        """Moves a dump which is not opened yet to the position"""
+        if self.members == 0:
+            return
+
+        if (
+            isinstance(source, pukiwiki.DataDirectory)
+            or self.offset is None
+            or detect_compression(source) is not None
+        ):
+            self.skip = self.members
+            return
+
+        source.seek(self.offset)
+        self.base = self.offset
+
+    def json(self) -> dict:
+        return {"members": self.members, "offset": self.offset}
+
+
+class Checkpoint:
+    """Progress of an export saved in a directory, to resume it when it is
+    interrupted.
+
+    The records written into the output are spooled to a file, and every
+    `interval` pages the state of the export is saved with the position in
+    the dump. A resumed export writes the spooled records again, and goes on
+    from the position. The state is replaced atomically, and records spooled
+    after it are dropped on resume.
+
+    `options` are those of the export which change the records, which have
+    to be the same to resume it."""
+
+    def __init__(
+        self,
+        directory: str,
+        fingerprint: dict,
+        interval: int = DEFAULT_INTERVAL,
+        options: dict | None = None,
+    ):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.options = options or {}
+
+        os.makedirs(directory, exist_ok=True)
+        self.state = self.load()
+
+        self.position = Position()
+        mode = "wb"
+        if self.state is not None:
+            self.position = Position(**self.state["position"])
+            mode = "r+b"
+
+        self.spool = open(self.path(_RECORDS_FILE), mode)
+        if self.state is not None:
+            self.spool.truncate(self.state["records"])
+            self.spool.seek(0, os.SEEK_END)
+
+        # Pages recorded, of which `resumed` were before a resume
+        self.pages = self.state["pages"] if self.state is not None else 0
+        self.resumed = self.pages
+        self.saved = self.pages
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self) -> dict | None:
+        path = self.path(_STATE_FILE)
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            state = json.load(f)
+
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise RuntimeError(f"unsupported checkpoint version in {path}")
+        if state["fingerprint"] != self.fingerprint:
+            raise RuntimeError(
+                f"the checkpoint in {self.directory} is of another export"
+            )
+
+        options = state["options"]
+        changed = [
+            name
+            for name in sorted(options.keys() | self.options.keys())
+            if options.get(name) != self.options.get(name)
+        ]
+        if changed:
+            raise RuntimeError(
+                f"the checkpoint in {self.directory} was saved with other"
+                f" options: {', '.join(changed)}"
+            )
+
+        return state
+
+    def replay(self) -> Iterator[list]:
+        """The records spooled until the saved state"""
+        if self.state is None:
+            return
+
+        end = self.state["records"]
+        with open(self.path(_RECORDS_FILE), "rb") as f:
+            while f.tell() < end:
+                yield json.loads(f.readline())
+
+    def record(self, values: list, page: bool = True):
+        self.spool.write(json.dumps(values, ensure_ascii=False).encode())
+        self.spool.write(b"\n")
+        if page:
+            self.pages += 1
+
+    def due(self) -> bool:
+        return self.pages - self.saved >= self.interval
+
+    def save(self, state: dict):
+        self.spool.flush()
+        os.fsync(self.spool.fileno())
+
+        d = {
+            "version": CHECKPOINT_VERSION,
+            "fingerprint": self.fingerprint,
+            "options": self.options,
+            "records": self.spool.tell(),
+            "pages": self.pages,
+            "position": self.position.json(),
+        }
+        d.update(state)
+
+        # Replace the old state only once the new one is complete
+        path = self.path(_STATE_FILE)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(d, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        self.saved = self.pages
+
+    def remove(self):
+        """Drops the checkpoint of a finished export"""
+        self.spool.close()
+        for name in (_STATE_FILE, _RECORDS_FILE):
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+    def close(self):
+        self.spool.close()
+
+    def report(self) -> str:
+        if self.state is None:
+            return (
+                f"Checkpoint: {self.pages} pages, saved every {self.interval}"
+            )
+        return (
+            f"Checkpoint: resumed after {self.resumed} of {self.pages} pages,"
+            " the other reports cover the pages after it"
+        )
@@ -0,0 +1,392 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+import shutil
+import tempfile
+import time
+import typing
+import zipfile
+
+from encoding.growi.attachment import GrowiAttachments
+from encoding.growi.page import Page
+from encoding.growi.revision import Revision
+from encoding.growi.serialize import encode
+from encoding.profile import Profiler, STAGE_JSON, STAGE_ZIP, stage
+
+META_JSON = "meta.json"
+PAGES_JSON = "pages.json"
+REVISIONS_JSON = "revisions.json"
+USERS_JSON = "users.json"
+ATTACHMENTS_JSON = "attachments.json"
+ATTACHMENT_FILES_JSON = "attachmentFiles.files.json"
+ATTACHMENT_CHUNKS_JSON = "attachmentFiles.chunks.json"
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Archives being finished in threads while the next one is written
+DEFAULT_CLOSE_WORKERS = 2
+
+
+def encode_timed(obj, profiler: Profiler | None = None) -> bytes:
+    with stage(profiler, STAGE_JSON):
+        s = encode(obj)
+
+    if profiler is not None:
+        profiler.count(STAGE_JSON, len(s))
+
+    return s
+
+
+class JsonArrayWriter:
+    """Writes a JSON array element by element. The output is the same as
+    `json.dumps` of the whole list. Elements are dicts, or records encoding
+    themselves with `json_bytes`."""
+
+    def __init__(
+        self, file: typing.IO[bytes], profiler: Profiler | None = None
+    ):
+        self.file = file
+        self.profiler = profiler
+        self.count = 0
+        self.size = 0
+
+        self.file.write(b"[")
+
+    def write(self, obj):
+        self.write_encoded(encode_timed(obj, self.profiler))
+
+    def write_encoded(self, s: bytes):
+        if self.count > 0:
+            self.file.write(b", ")
+
+        with stage(self.profiler, STAGE_ZIP, len(s)):
+            self.file.write(s)
+
+        self.count += 1
+        self.size += len(s)
+
+    def close(self):
+        self.file.write(b"]")
+
+
+class ArchiveWriter:
+    """Streams pages and revisions into a Growi archive.
+
+    A zip file can only have one entry open for writing, so `revisions.json`,
+    which holds the page bodies, is written directly into the archive while
+    the small page records are spooled to a temporary file and copied into
+    `pages.json` on close."""
+
+    def __init__(
+        self,
+        file: typing.IO[bytes],
+        users: list[dict],
+        meta: dict,
+        pages_filename: str = PAGES_JSON,
+        revisions_filename: str = REVISIONS_JSON,
+        users_filename: str = USERS_JSON,
+        meta_filename: str = META_JSON,
+        profiler: Profiler | None = None,
+        attachments: GrowiAttachments | None = None,
+    ):
+        self.users = users
+        self.meta = meta
+        self.pages_filename = pages_filename
+        self.users_filename = users_filename
+        self.meta_filename = meta_filename
+        self.profiler = profiler
+        self.attachments = attachments
+
+        self.file = file
+        self.zip = zipfile.ZipFile(file, "x")
+        self.attachments_size = 0
+
+        self.pages_spool = tempfile.TemporaryFile()
+        self.pages = JsonArrayWriter(self.pages_spool, profiler)
+
+        # The final size is unknown while streaming, so allow it to exceed
+        # the plain zip limits.
+        self.revisions_file = self.zip.open(
+            self.zip_info(revisions_filename), "w", force_zip64=True
+        )
+        self.revisions = JsonArrayWriter(self.revisions_file, profiler)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, page: Page | dict | None, revision: Revision | dict):
+        """Writes a page with its revision, or an old revision alone"""
+        p = encode_timed(page, self.profiler) if page is not None else None
+        self.write_encoded(p, encode_timed(revision, self.profiler))
+
+    def write_encoded(
+        self, page: bytes | None, revision: bytes, page_id: str | None = None
+    ):
+        if page is not None:
+            self.pages.write_encoded(page)
+        self.revisions.write_encoded(revision)
+
+    @property
+    def page_count(self) -> int:
+        return self.pages.count
+
+    @property
+    def size(self) -> int:
+        """Bytes of JSON written for the pages, revisions and attachments"""
+        return self.pages.size + self.revisions.size + self.attachments_size
+
+    def close(self):
+        self.revisions.close()
+        self.revisions_file.close()
+
+        self.pages.close()
+        self.write_spool(self.pages_filename, self.pages_spool)
+
+        if self.attachments is not None:
+            self.write_array(ATTACHMENTS_JSON, self.attachments.json())
+            self.write_array(
+                ATTACHMENT_FILES_JSON, self.attachments.files_json()
+            )
+            self.write_array(
+                ATTACHMENT_CHUNKS_JSON, self.attachments.chunks_json()
+            )
+
+        u = json.dumps(self.users)
+        self.zip.writestr(self.users_filename, u)
+
+        m = json.dumps(self.meta)
+        self.zip.writestr(self.meta_filename, m)
+
+        self.zip.close()
+
+    def abort(self):
+        self.revisions_file.close()
+        self.pages_spool.close()
+        self.zip.close()
+
+    def zip_info(self, filename: str) -> zipfile.ZipInfo:
+        date_time = time.localtime(time.time())[:6]
+        info = zipfile.ZipInfo(filename, date_time)
+        info.compress_type = self.zip.compression
+        return info
+
+    def write_array(self, filename: str, items: typing.Iterable[dict]):
+        """Streams a JSON array into the archive, element by element"""
+        info = self.zip_info(filename)
+        with self.zip.open(info, "w", force_zip64=True) as f:
+            array = JsonArrayWriter(f, self.profiler)
+            for item in items:
+                array.write(item)
+            array.close()
+
+        self.attachments_size += array.size
+
+    def write_spool(self, filename: str, spool: typing.IO[bytes]):
+        info = self.zip_info(filename)
+        info.file_size = spool.tell()
+
+        spool.seek(0)
+        with stage(self.profiler, STAGE_ZIP, info.file_size):
+            with self.zip.open(info, "w") as f:
+                shutil.copyfileobj(spool, f, _COPY_CHUNK_SIZE)
+
+        spool.close()
+
+
+def shard_path(path: str, i: int) -> str:
+    """The file of the `i`th archive after the first, which is at `path`"""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{i + 1}{ext}"
+
+
+class ShardedArchiveWriter:
+    """Splits the pages into several archives, each complete with its users
+    and meta, so that they can be imported one at a time.
+
+    A new archive is started when the next page would take the current one
+    over `max_size` bytes of JSON or `max_pages` pages. The finished archive
+    is closed in a thread while the next one is written.
+
+    With `grouped`, the old revisions and attachments of a page go into the
+    archive of the page, so that each archive is complete with them. They
+    come after all pages in a dump, so the records are spooled to a
+    temporary file, and the archives are written on close once the size of
+    each page with them is known, then finished in threads. Attachments are
+    always grouped."""
+
+    def __init__(
+        self,
+        open_archive: typing.Callable[[int], ArchiveWriter],
+        max_size: int | None = None,
+        max_pages: int | None = None,
+        profiler: Profiler | None = None,
+        attachments: GrowiAttachments | None = None,
+        workers: int = DEFAULT_CLOSE_WORKERS,
+        grouped: bool = False,
+    ):
+        self.open_archive = open_archive
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.profiler = profiler
+        self.attachments = attachments
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.closing: list[Future] = []
+
+        self.archives: list[ArchiveWriter] = []
+
+        # Records of a grouped writer, and the bytes of each page with its
+        # old revisions by page ID, in the order of the pages
+        self.spool: typing.IO[bytes] | None = None
+        self.sizes: dict[str, int] = {}
+
+        if grouped or attachments is not None:
+            self.spool = tempfile.TemporaryFile()
+        else:
+            self.archives.append(open_archive(0))
+
+    def __enter__(self) -> "ShardedArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def current(self) -> ArchiveWriter:
+        return self.archives[-1]
+
+    def full(self, count: int, size: int) -> bool:
+        """Whether an archive of `count` pages and `size` bytes is full"""
+        if count == 0:
+            return False
+
+        if self.max_pages is not None and count >= self.max_pages:
+            return True
+
+        return self.max_size is not None and size > self.max_size
+
+    def write(self, page: Page | dict | None, revision: Revision | dict):
+        p = encode_timed(page, self.profiler) if page is not None else None
+        r = encode_timed(revision, self.profiler)
+
+        if isinstance(revision, Revision):
+            page_id = str(revision.pageId)
+        else:
+            page_id = revision["pageId"]
+
+        self.write_encoded(p, r, page_id)
+
+    def write_encoded(
+        self, page: bytes | None, revision: bytes, page_id: str | None = None
+    ):
+        if self.spool is not None:
+            if page_id is None:
+                raise RuntimeError("grouped records need their page ID")
+            self.spool_record(page, revision, page_id)
+            return
+
+        # Old revisions alone stay with the archive being written
+        archive = self.current
+        if page is not None and self.full(
+            archive.page_count, archive.size + len(page) + len(revision)
+        ):
+            self.rotate()
+
+        self.current.write_encoded(page, revision)
+
+    def spool_record(self, page: bytes | None, revision: bytes, page_id: str):
+        assert self.spool is not None
+
+        header = [
+            page_id,
+            len(page) if page is not None else -1,
+            len(revision),
+        ]
+        self.spool.write(json.dumps(header).encode() + b"\n")
+        if page is not None:
+            self.spool.write(page)
+        self.spool.write(revision)
+
+        size = len(revision) + (len(page) if page is not None else 0)
+        self.sizes[page_id] = self.sizes.get(page_id, 0) + size
+
+    def rotate(self):
+        archive = self.current
+        self.closing.append(self.executor.submit(self.finish, archive))
+        self.archives.append(self.open_archive(len(self.archives)))
+
+    def finish(self, archive: ArchiveWriter):
+        archive.close()
+        archive.file.close()
+
+    def assign(self) -> dict[str, int]:
+        """Gives the pages of a grouped writer, with their old revisions and
+        attachments, their archive in the order of the pages"""
+        sizes = self.sizes
+        if self.attachments is not None:
+            for page_id, size in self.attachments.sizes().items():
+                sizes[page_id] = sizes.get(page_id, 0) + size
+
+        shards = {}
+        i, count, total = 0, 0, 0
+        for page_id, size in sizes.items():
+            if self.full(count, total + size):
+                i, count, total = i + 1, 0, 0
+
+            shards[page_id] = i
+            count += 1
+            total += size
+
+        return shards
+
+    def write_grouped(self):
+        """Writes the spooled records into the archives of their pages"""
+        assert self.spool is not None
+
+        shards = self.assign()
+        n = max(shards.values(), default=0) + 1
+        self.archives = [self.open_archive(i) for i in range(n)]
+
+        self.spool.seek(0)
+        while line := self.spool.readline():
+            page_id, page_size, revision_size = json.loads(line)
+            page = self.spool.read(page_size) if page_size >= 0 else None
+            revision = self.spool.read(revision_size)
+
+            archive = self.archives[shards[page_id]]
+            archive.write_encoded(page, revision)
+
+        self.spool.close()
+
+        for i, archive in enumerate(self.archives):
+            if self.attachments is not None:
+                ids = {p for p, shard in shards.items() if shard == i}
+                archive.attachments = self.attachments.of_pages(ids)
+            self.closing.append(self.executor.submit(self.finish, archive))
+
+    def close(self):
+        try:
+            if self.spool is not None:
+                self.write_grouped()
+            else:
+                self.finish(self.current)
+            for future in self.closing:
+                future.result()
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        if self.spool is not None:
+            self.spool.close()
+        for archive in self.archives[len(self.closing) :]:
+            archive.abort()
+        self.executor.shutdown(cancel_futures=True)
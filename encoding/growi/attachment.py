@@ -0,0 +1,153 @@
+import base64
+import copy
+import os
+import typing
+from typing import Iterator
+
+from encoding.attachment import Attachment, AttachmentStore, Blob
+from encoding.growi.date import now_iso
+from encoding.growi.id import Id
+from encoding.growi.page import Page
+from encoding.growi.user import User
+
+
+class GrowiAttachments:
+    """Attachments of the exported pages, written into an archive as the
+    attachments of Growi and the GridFS collections holding their files.
+
+    References are resolved while pages are converted, before the
+    attachments are read, so IDs are given out on the first reference to an
+    attachment and used once it is read."""
+
+    def __init__(self, store: AttachmentStore, user: User):
+        self.store = store
+        self.user = user
+
+        self.pages: dict[str, Page] = {}
+        self.ids: dict[tuple[str, str], Id] = {}
+
+        # GridFS files, one per distinct content
+        self.file_ids: dict[str, Id] = {}
+        self.file_names: dict[str, str] = {}
+
+        self.orphans = 0
+
+        # IDs of the pages whose attachments are written, or None for all
+        self.page_ids: set[str] | None = None
+
+    def add_page(self, name: str, page: Page):
+        self.pages[name] = page
+
+    def id(self, page: str, file: str) -> Id:
+        id = self.ids.get((page, file))
+        if id is None:
+            id = self.ids[(page, file)] = Id()
+        return id
+
+    def url(self, path: str, page: str, file: str) -> str:
+        return f"/attachment/{self.id(page, file)}"
+
+    def add(self, page: str, file: str, f: typing.IO[bytes]):
+        if page not in self.pages:
+            self.orphans += 1
+            return
+
+        blob = self.store.add(page, file, f).blob
+        if blob.digest not in self.file_ids:
+            _, ext = os.path.splitext(file)
+            self.file_ids[blob.digest] = Id()
+            self.file_names[blob.digest] = blob.digest + ext.lower()
+
+    def of_pages(self, page_ids: set[str]) -> "GrowiAttachments":
+        """The attachments of some pages alone, with the same IDs, to be
+        written into the archive of the pages"""
+        attachments = copy.copy(self)
+        attachments.page_ids = page_ids
+        return attachments
+
+    def attachments(self) -> Iterator[Attachment]:
+        for attachment in self.store:
+            page = self.pages[attachment.page]
+            if self.page_ids is None or str(page.id) in self.page_ids:
+                yield attachment
+
+    def sizes(self) -> dict[str, int]:
+        """Bytes of the attachments of each page by page ID, as their files
+        are written in base64"""
+        sizes: dict[str, int] = {}
+        for attachment in self.attachments():
+            page_id = str(self.pages[attachment.page].id)
+            size = -(-attachment.blob.size // 3) * 4
+            sizes[page_id] = sizes.get(page_id, 0) + size
+        return sizes
+
+    def json(self) -> Iterator[dict]:
+        """Elements of attachments.json"""
+        for attachment in self.attachments():
+            page = self.pages[attachment.page]
+            file_name = self.file_names[attachment.blob.digest]
+
+            yield {
+                "_id": str(self.id(attachment.page, attachment.file)),
+                "page": str(page.id),
+                "creator": str(self.user.id),
+                "filePath": f"attachment/{page.id}/{file_name}",
+                "fileName": file_name,
+                "originalName": attachment.file,
+                "fileFormat": attachment.content_type(),
+                "fileSize": attachment.blob.size,
+                "createdAt": page.updatedAt,
+                "__v": 0,
+            }
+
+    def blobs(self) -> Iterator[tuple[Blob, Attachment]]:
+        """Each stored content with the first attachment having it"""
+        seen = set()
+        for attachment in self.attachments():
+            blob = attachment.blob
+            if blob.digest not in seen:
+                seen.add(blob.digest)
+                yield blob, attachment
+
+    def files_json(self) -> Iterator[dict]:
+        uploaded = now_iso()
+
+        for blob, attachment in self.blobs():
+            yield {
+                "_id": str(self.file_ids[blob.digest]),
+                "length": blob.size,
+                "chunkSize": self.store.chunk_size,
+                "uploadDate": uploaded,
+                "filename": self.file_names[blob.digest],
+                "contentType": attachment.content_type(),
+            }
+
+    def chunks_json(self) -> Iterator[dict]:
+        """Chunks of the files, read back from the store one at a time"""
+        for blob, _ in self.blobs():
+            files_id = str(self.file_ids[blob.digest])
+
+            for n, chunk in enumerate(self.store.chunks(blob)):
+                data = base64.b64encode(chunk).decode()
+                yield {
+                    "_id": str(Id()),
+                    "files_id": files_id,
+                    "n": n,
+                    "data": {"$binary": {"base64": data, "subType": "00"}},
+                }
+
+    def missing(self) -> int:
+        """Number of referenced attachments which were not in the dump"""
+        return sum(
+            1 for page, file in self.ids if self.store.find(page, file) is None
+        )
+
+    def report(self) -> str:
+        s = self.store.report()
+        if self.orphans > 0:
+            s += f", {self.orphans} of pages not exported"
+
+        missing = self.missing()
+        if missing > 0:
+            s += f"\n{missing} referenced attachments are not in the dump"
+        return s
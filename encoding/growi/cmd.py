@@ -1,30 +1,79 @@
 import argparse
 from argparse import ArgumentParser, Namespace as ArgNamespace
 
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+import heapq
 import json
-import tarfile
+import os
+import tempfile
+import time
 import typing
-import zipfile
-from typing import Tuple
+from typing import Iterator, Tuple
 
 import pukiwiki
+from encoding.attachment import AttachmentStore
+from encoding.cache import Cache, convert_cached, open_cache
+from encoding.checkpoint import (
+    Checkpoint,
+    Position,
+    dump_fingerprint,
+    random_state,
+    set_random_state,
+)
+from encoding.growi.archive import (
+    ArchiveWriter,
+    META_JSON,
+    PAGES_JSON,
+    REVISIONS_JSON,
+    ShardedArchiveWriter,
+    USERS_JSON,
+    encode_timed,
+    shard_path,
+)
+from encoding.growi.attachment import GrowiAttachments
 from encoding.growi.date import now_iso
+from encoding.growi.history import History
+from encoding.growi.id import Id
+from encoding.growi.manifest import (
+    IncrementalExport,
+    Manifest,
+    MANIFEST_SUFFIX,
+)
 from encoding.growi.page import Page
 from encoding.growi.revision import Revision
 from encoding.growi.user import User
 from encoding.growi.password import random_seed
+from encoding.pipeline import DEFAULT_QUEUE_SIZE, Pipeline
+from encoding.profile import (
+    Profiler,
+    STAGE_CONVERT,
+    STAGE_READ,
+    iterate,
+    stage,
+)
+from encoding.progress import Progress
+from encoding.size import format_size, parse_size
+from pukiwiki.attach import RefResolver, attachment_name, is_attachment
+from pukiwiki.backup import is_backup
+from pukiwiki.links import LinkResolver
 
 
 EUC_JP_SLASH = "2F"
 FILE_SUFFIX = ".txt"
 
-META_JSON = "meta.json"
-PAGES_JSON = "pages.json"
-REVISIONS_JSON = "revisions.json"
-USERS_JSON = "users.json"
-
 DEFAULT_RGOWI_VERSION = "5.0.2"
 
+# A page to export with its name, raw content and content hash, and the date
+# of the version for old versions from backup/
+PageSource = Tuple[Page, str, bytes, str | None, str | None]
+
 
 def set_args(parser: ArgumentParser):
     parser.add_argument(
@@ -68,37 +117,166 @@ def set_args(parser: ArgumentParser):
         help="version of the destination Growi server. Default to 5.0.2",
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=parse_positive,
+        required=False,
+        default=1,
+        help="number of worker processes to convert pages. Default to 1, which"
+        " converts pages in the main process.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="reuse the IDs recorded in the manifest of the previous export"
+        " and only export new or changed pages. The manifest is updated"
+        " after the export.",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        metavar="FILE",
+        type=str,
+        required=False,
+        default=None,
+        help="manifest file for --incremental. Default to the output file"
+        f" name followed by '{MANIFEST_SUFFIX}'.",
+    )
+
+    parser.add_argument(
+        "--history",
+        dest="history",
+        action="store_true",
+        help="also export the old versions of pages kept in backup/ of the"
+        " dump as older revisions of the pages.",
+    )
+
+    parser.add_argument(
+        "--max-archive-size",
+        dest="max_archive_size",
+        metavar="SIZE",
+        type=parse_positive_size,
+        default=None,
+        help="split the output into several archives of at most SIZE bytes"
+        " of page, revision and attachment JSON each, such as '256M'. Each"
+        " archive has the old revisions and attachments of its pages. The"
+        " archives after the first are named after the output file, like"
+        " 'export.growi-2.zip'.",
+    )
+
+    parser.add_argument(
+        "--pages-per-archive",
+        dest="pages_per_archive",
+        metavar="N",
+        type=parse_positive,
+        default=None,
+        help="split the output into several archives of at most N pages"
+        " each.",
+    )
+
     parser.set_defaults
 
 
-def create_page(tarinfo: tarfile.TarInfo, path_prefix: str):
+def parse_positive(text: str) -> int:
+    """Parses a number of worker processes or pages, which is at least 1"""
+    n = int(text)
+    if n < 1:
+        raise ValueError(f"invalid number: {text!r}")
+    return n
+
+
+def parse_positive_size(text: str) -> int:
+    """`parse_size` for sizes which are at least 1 byte"""
+    size = parse_size(text)
+    if size < 1:
+        raise ValueError(f"invalid size: {text!r}")
+    return size
+
+
+def create_page(
+    tarinfo: pukiwiki.DumpMember,
+    path_prefix: str,
+    index: pukiwiki.NameIndex | None = None,
+):
     if not tarinfo.isfile():
         raise RuntimeError("Given TarInfo was not a file")
 
     path = tarinfo.path
-    path = pukiwiki.normalize_path(path, path_prefix)
+    path = pukiwiki.normalize_path(path, path_prefix, index)
 
     page = Page(path)
 
     return page
 
 
+def read_content(
+    tar: pukiwiki.Dump,
+    member: pukiwiki.DumpMember,
+    profiler: Profiler | None = None,
+) -> bytes:
+    with stage(profiler, STAGE_READ, member.size):
+        f = tar.extractfile(member)
+
+        if f is None:
+            raise RuntimeError("attempt to extract non-regular file")
+
+        content = f.read()
+
+    return content
+
+
+def convert_content(
+    content: bytes, engine: str = pukiwiki.DEFAULT_ENGINE
+) -> Tuple[str, str | None]:
+    """Returns the converted body and the date of a raw page. This runs in
+    worker processes, so it must stay a picklable module level function."""
+    return pukiwiki.convert_page(content, engine)
+
+
+def convert_content_timed(
+    content: bytes, engine: str = pukiwiki.DEFAULT_ENGINE
+) -> Tuple[Tuple[str, str | None], float, int]:
+    """`convert_content` also returning the seconds it took, and whether the
+    page had undecodable bytes, as counted in the worker process"""
+    errors = pukiwiki.decode_errors.pages
+    start = time.perf_counter()
+    converted = convert_content(content, engine)
+    seconds = time.perf_counter() - start
+    return converted, seconds, pukiwiki.decode_errors.pages - errors
+
+
+def create_executor(jobs: int) -> ProcessPoolExecutor:
+    """Worker processes decoding pages in the encoding of the dump"""
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=pukiwiki.set_encoding,
+        initargs=(pukiwiki.get_encoding(),),
+    )
+
+
 def create_revision(
-    tar: tarfile.TarFile,
-    member: tarfile.TarInfo,
+    tar: pukiwiki.Dump,
+    member: pukiwiki.DumpMember,
     page: Page,
     author: User,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    cache: Cache | None = None,
 ) -> Revision:
-    f = tar.extractfile(member)
+    content = read_content(tar, member)
+    body, date = convert_cached(content, engine, cache)
 
-    if f is None:
-        raise RuntimeError("attempt to extract non-regular file")
+    return create_revision_from_body(page, author, body, date)
 
-    content = f.read()
-    original = pukiwiki.decode(content)
-    body = pukiwiki.convert(original)
 
-    date = pukiwiki.get_date(original)
+def create_revision_from_body(
+    page: Page, author: User, body: str, date: str | None
+) -> Revision:
     date = date or page.createdAt
 
     revision = Revision(
@@ -115,6 +293,21 @@ def create_revision(
     return revision
 
 
+def create_old_revision(
+    page: Page, author: User, body: str, date: str, id: Id | None = None
+) -> Revision:
+    """An old version of `page`, which is not its current revision"""
+    revision = Revision(
+        page.id,
+        body,
+        author.id,
+        id=id,
+        createdAt=date,
+    )
+
+    return revision
+
+
 def create_user(password_seed: str, name: str = "pukiwiki") -> User:
     user = User(name, password_seed)
     return user
@@ -142,32 +335,471 @@ def get_meta_json(
     return d
 
 
+def iter_wiki_members(
+    tar_file: pukiwiki.Dump,
+    index: pukiwiki.NameIndex | None = None,
+    progress: Progress | None = None,
+    profiler: Profiler | None = None,
+    backups: bool = False,
+    attachments: bool = False,
+    position: Position | None = None,
+) -> Iterator[pukiwiki.DumpMember]:
+    """Yields the wiki pages of a dump, and its backups and attachments with
+    `backups` and `attachments`. The members read are counted in `position`,
+    and a dump resumed from it reads over the ones read before."""
+    members = iterate(profiler, STAGE_READ, tar_file)
+    if position is not None:
+        members = position.iterate(members)
+
+    for member in members:
+        if not member.isfile():
+            if progress is not None:
+                progress.skip("not a file")
+            continue
+
+        if backups and is_backup(member):
+            yield member
+            continue
+
+        if attachments and is_attachment(member):
+            yield member
+            continue
+
+        if not pukiwiki.is_wiki_page(member, index):
+            if progress is not None:
+                progress.skip("not a wiki page")
+            continue
+
+        yield member
+
+
 def get_data_json(
-    tar_file: tarfile.TarFile, path_prefix: str, user: User
+    tar_file: pukiwiki.Dump,
+    path_prefix: str,
+    user: User,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    jobs: int = 1,
+    cache: Cache | None = None,
+    incremental: IncrementalExport | None = None,
+    index: pukiwiki.NameIndex | None = None,
+    links: LinkResolver | None = None,
 ) -> Tuple[list[dict], list[dict]]:
     """Returns three dictionary, pages.json, revisions.json"""
 
     pages = []
     revisions = []
 
-    for member in tar_file:
-        if not member.isfile():
+    data = iter_data_json(
+        tar_file,
+        path_prefix,
+        user,
+        engine,
+        jobs,
+        cache,
+        incremental,
+        index,
+        links,
+    )
+    for p, r in data:
+        if p is not None:
+            pages.append(p.json())
+        revisions.append(r.json())
+
+    return pages, revisions
+
+
+def iter_pages(
+    tar_file: pukiwiki.Dump,
+    path_prefix: str,
+    incremental: IncrementalExport | None = None,
+    index: pukiwiki.NameIndex | None = None,
+    progress: Progress | None = None,
+    profiler: Profiler | None = None,
+    history: History | None = None,
+    attachments: GrowiAttachments | None = None,
+    position: Position | None = None,
+) -> Iterator[PageSource]:
+    """Yields pages to be exported with their name and raw content. With
+    `incremental`, unchanged pages are skipped and the content hash of the
+    others is given. With `history`, the old versions of the exported pages
+    follow as their backups are read. Attachments of the exported pages are
+    put into `attachments`."""
+    if index is None:
+        index = pukiwiki.NameIndex()
+
+    members = iter_wiki_members(
+        tar_file,
+        index,
+        progress,
+        profiler,
+        history is not None,
+        attachments is not None,
+        position,
+    )
+    for member in members:
+        if attachments is not None and is_attachment(member):
+            page_name, file = attachment_name(
+                member.path, pukiwiki.decode_path
+            )
+            with stage(profiler, STAGE_READ, member.size):
+                f = tar_file.extractfile(member)
+                if f is None:
+                    raise RuntimeError("attempt to extract non-regular file")
+                attachments.add(page_name, file, f)
+            continue
+
+        name = index.name(member.path)
+
+        if history is not None and is_backup(member):
+            versions = history.iter_versions(tar_file, member, name, profiler)
+            for page, content, date in versions:
+                if incremental is not None and incremental.skip_version(
+                    page, date
+                ):
+                    continue
+                yield page, name, content, None, date
             continue
 
-        if not pukiwiki.is_wiki_page(member):
-            print("skipping", member.path)
+        page = create_page(member, path_prefix, index)
+        content = read_content(tar_file, member, profiler)
+
+        if progress is not None:
+            progress.update(len(content))
+
+        digest = None
+        if incremental is not None:
+            digest = incremental.check(page, content)
+            if digest is None:
+                continue
+
+        if history is not None:
+            history.add(name, page)
+        if attachments is not None:
+            attachments.add_page(name, page)
+
+        yield page, name, content, digest, None
+
+
+def iter_data_json(
+    tar_file: pukiwiki.Dump,
+    path_prefix: str,
+    user: User,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    jobs: int = 1,
+    cache: Cache | None = None,
+    incremental: IncrementalExport | None = None,
+    index: pukiwiki.NameIndex | None = None,
+    links: LinkResolver | None = None,
+    progress: Progress | None = None,
+    profiler: Profiler | None = None,
+    pipeline: Pipeline | None = None,
+    history: History | None = None,
+    attachments: GrowiAttachments | None = None,
+    refs: RefResolver | None = None,
+    position: Position | None = None,
+) -> Iterator[Tuple[Page | None, Revision]]:
+    """Yields the records of each page and its revision for pages.json and
+    revisions.json, in tar order. Old versions from `history` come without a
+    page. With `pipeline`, the dump is read in a thread ahead of the
+    conversion, and worker processes convert pages as they come."""
+
+    pages = iter_pages(
+        tar_file,
+        path_prefix,
+        incremental,
+        index,
+        progress,
+        profiler,
+        history,
+        attachments,
+        position,
+    )
+
+    inflight = DEFAULT_QUEUE_SIZE
+    if pipeline is not None:
+        pages = pipeline.read_ahead(pages, "reader", "converter")
+        inflight = pipeline.queue_size
+
+    converted = iter_converted(pages, engine, jobs, cache, profiler, inflight)
+    for page, name, digest, old, (body, date) in converted:
+        if links is not None:
+            body = links.resolve(name, body)
+        if refs is not None:
+            body = refs.resolve(name, body)
+
+        if old is not None:
+            id = None
+            if incremental is not None:
+                id = incremental.version_id(page, old)
+
+            revision = create_old_revision(page, user, body, old, id)
+            if incremental is not None:
+                incremental.record_version(page, old, revision.id)
+
+            yield None, revision
             continue
 
-        page = create_page(member, path_prefix)
-        revision = create_revision(tar_file, member, page, user)
-        page.revisionId = revision.id
+        revision = create_revision_from_body(page, user, body, date)
 
-        p = page.json()
-        pages.append(p)
-        r = revision.json()
-        revisions.append(r)
+        if incremental is not None and digest is not None:
+            incremental.record(page, digest)
 
-    return pages, revisions
+        yield page, revision
+
+
+def iter_converted(
+    pages: typing.Iterable[PageSource],
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    jobs: int = 1,
+    cache: Cache | None = None,
+    profiler: Profiler | None = None,
+    inflight: int = DEFAULT_QUEUE_SIZE,
+) -> Iterator[
+    Tuple[Page, str, str | None, str | None, Tuple[str, str | None]]
+]:
+    """Converts pages from `iter_pages` as they come, and yields them with
+    their body and date in order. With `jobs` > 1 they are converted by
+    worker processes, keeping at most `inflight` pages read ahead, of which
+    the largest are submitted first."""
+    if jobs <= 1:
+        for page, name, content, digest, old in pages:
+            converted = convert_cached(content, engine, cache, profiler, name)
+            yield page, name, digest, old, converted
+        return
+
+    Pending = Tuple[PageSource, Conversion | Tuple[str, str | None]]
+
+    def finish(pending: Pending):
+        (page, name, content, digest, old), result = pending
+        if not isinstance(result, Conversion):
+            return page, name, digest, old, result
+
+        converted, seconds, errors = scheduler.result(result)
+        pukiwiki.decode_errors.add(errors)
+        if cache is not None:
+            cache.put_markdown(content, converted, engine, errors=errors)
+        if profiler is not None:
+            profiler.add(STAGE_CONVERT, seconds, 0.0, len(content))
+            profiler.page(name, seconds, content)
+
+        return page, name, digest, old, converted
+
+    queued: deque[Pending] = deque()
+    with create_executor(jobs) as executor:
+        scheduler = LargestFirst(executor, engine, 2 * jobs)
+
+        for source in pages:
+            content = source[2]
+
+            result = None
+            if cache is not None:
+                result = cache.get_markdown(content, engine)
+            if result is None:
+                result = Conversion(content)
+                scheduler.add(result)
+
+            queued.append((source, result))
+            if len(queued) >= inflight:
+                yield finish(queued.popleft())
+
+        while queued:
+            yield finish(queued.popleft())
+
+
+class Conversion:
+    """A page to be converted by a worker process"""
+
+    __slots__ = ("content", "future")
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.future: Future | None = None
+
+
+class LargestFirst:
+    """Submits the pages read ahead to worker processes, the largest first,
+    so that a huge page does not start last and keep a single worker busy
+    at the end. At most `running` pages are submitted and not done at a
+    time, and the others wait here to be ordered."""
+
+    def __init__(self, executor: Executor, engine: str, running: int):
+        self.executor = executor
+        self.engine = engine
+        self.limit = running
+
+        # Min-heap of (-size, order, conversion) of the waiting pages
+        self.waiting: list[tuple[int, int, Conversion]] = []
+        self.running: set[Future] = set()
+        self.order = 0
+
+    def add(self, conversion: Conversion):
+        entry = (-len(conversion.content), self.order, conversion)
+        heapq.heappush(self.waiting, entry)
+        self.order += 1
+        self.fill()
+
+    def fill(self):
+        self.running = {f for f in self.running if not f.done()}
+        while self.waiting and len(self.running) < self.limit:
+            _, _, conversion = heapq.heappop(self.waiting)
+            # Pages waited for are submitted before their turn
+            if conversion.future is None:
+                self.submit(conversion)
+
+    def submit(self, conversion: Conversion):
+        conversion.future = self.executor.submit(
+            convert_content_timed, conversion.content, self.engine
+        )
+        self.running.add(conversion.future)
+
+    def result(
+        self, conversion: Conversion
+    ) -> Tuple[Tuple[str, str | None], float, int]:
+        """Waits for a page, submitting it at once if it is still waiting,
+        and submits the next pages as the workers finish others"""
+        if conversion.future is None:
+            self.submit(conversion)
+
+        future = conversion.future
+        assert future is not None
+        while not future.done():
+            wait(self.running, return_when=FIRST_COMPLETED)
+            self.fill()
+
+        return future.result()
+
+
+def _run_largest_first_test():
+    class Recorder(Executor):
+        def __init__(self):
+            self.sizes: list[int] = []
+            self.futures: list[Future] = []
+
+        def submit(self, fn, /, *args, **kwargs):
+            self.sizes.append(len(args[0]))
+            future: Future = Future()
+            self.futures.append(future)
+            return future
+
+    executor = Recorder()
+    scheduler = LargestFirst(executor, pukiwiki.DEFAULT_ENGINE, 2)
+    for size in [1, 5, 3, 9, 2]:
+        scheduler.add(Conversion(b"x" * size))
+
+    for future in executor.futures[:2]:
+        future.set_result(None)
+    scheduler.fill()
+    for future in executor.futures[2:]:
+        future.set_result(None)
+    scheduler.fill()
+
+    want = [1, 5, 9, 3, 2]
+    if executor.sizes == want:
+        print("ok")
+    else:
+        print("failed", executor.sizes, "want", want)
+
+
+def growi_link_url(path_prefix: str) -> typing.Callable[[str, str], str]:
+    """Links point to the absolute Growi paths of the exported pages"""
+
+    def url(name: str, target: str) -> str:
+        path = os.path.join(path_prefix, target)
+        return Page(path).path
+
+    return url
+
+
+def page_root(path_prefix: str) -> str:
+    """The start of the paths of the exported pages, before their names"""
+    root = os.path.join(path_prefix, "")
+    return root if root.startswith("/") else f"/{root}"
+
+
+def checkpoint_state(
+    user: User,
+    users: list[dict],
+    meta: dict,
+    attachments: GrowiAttachments | None = None,
+) -> dict:
+    """What a resumed export restores besides the records: the IDs of the
+    user and of the attachments referenced so far, and the generator of the
+    next IDs"""
+    d = {
+        "random": random_state(),
+        "user": str(user.id),
+        "users": users,
+        "meta": meta,
+    }
+    if attachments is not None:
+        d["attachments"] = [
+            [page, file, str(id)]
+            for (page, file), id in attachments.ids.items()
+        ]
+    return d
+
+
+def resume_checkpoint(
+    checkpoint: Checkpoint,
+    archive: ArchiveWriter | ShardedArchiveWriter,
+    path_prefix: str,
+    history: History | None = None,
+    attachments: GrowiAttachments | None = None,
+):
+    """Writes the records of a checkpoint into the archive again, and
+    restores the pages which later backups and attachments belong to"""
+    state = checkpoint.state
+    if state is None:
+        return
+
+    root = page_root(path_prefix)
+    for p, r in checkpoint.replay():
+        if p is None:
+            archive.write_encoded(None, r.encode(), json.loads(r)["pageId"])
+            continue
+
+        page = Page.parse(json.loads(p))
+        archive.write_encoded(p.encode(), r.encode(), str(page.id))
+
+        name = page.path.removeprefix(root)
+        if history is not None:
+            history.add(name, page)
+        if attachments is not None:
+            attachments.add_page(name, page)
+
+    if attachments is not None:
+        for page_name, file, id in state["attachments"]:
+            attachments.ids[(page_name, file)] = Id.parse(id)
+
+    set_random_state(state["random"])
+
+
+def write_checkpointed(
+    data: typing.Iterable[Tuple[Page | None, Revision]],
+    archive: ArchiveWriter | ShardedArchiveWriter,
+    checkpoint: Checkpoint,
+    state: typing.Callable[[], dict | None],
+    profiler: Profiler | None = None,
+):
+    """Writes the records into the archive and spools them to the
+    checkpoint, saving it every `checkpoint.interval` pages. `state` gives
+    None once the export cannot be resumed anymore."""
+
+    def save():
+        d = state()
+        if d is not None:
+            checkpoint.save(d)
+
+    for page, revision in data:
+        p = encode_timed(page, profiler) if page is not None else None
+        r = encode_timed(revision, profiler)
+        archive.write_encoded(p, r, str(revision.pageId))
+
+        checkpoint.record([p and p.decode(), r.decode()], p is not None)
+        if p is not None and checkpoint.due():
+            save()
+
+    save()
 
 
 def write_zip(
@@ -181,18 +813,17 @@ def write_zip(
     users_filename: str = USERS_JSON,
     meta_filename: str = META_JSON,
 ):
-    with zipfile.ZipFile(file, "x") as f:
-        p = json.dumps(pages)
-        f.writestr(pages_filename, p)
-
-        r = json.dumps(revisions)
-        f.writestr(revisions_filename, r)
-
-        u = json.dumps(users)
-        f.writestr(users_filename, u)
-
-        m = json.dumps(meta)
-        f.writestr(meta_filename, m)
+    with ArchiveWriter(
+        file,
+        users,
+        meta,
+        pages_filename,
+        revisions_filename,
+        users_filename,
+        meta_filename,
+    ) as archive:
+        for page, revision in zip(pages, revisions):
+            archive.write(page, revision)
 
 
 def main(parsed_args: ArgNamespace):
@@ -202,13 +833,265 @@ def main(parsed_args: ArgNamespace):
     prefix = parsed_args.prefix
     user_name = parsed_args.name
     growi_version = parsed_args.growi_version
+    engine = parsed_args.engine
+    jobs = parsed_args.jobs
+    cache = open_cache(parsed_args.cache_dir, parsed_args.cache_size)
+
+    profiler = None
+    if parsed_args.profile is not None:
+        profiler = Profiler(parsed_args.profile_top)
+
+    manifest_path = None
+    incremental = None
+    if parsed_args.incremental:
+        manifest_path = parsed_args.manifest
+        manifest_path = manifest_path or output_file.name + MANIFEST_SUFFIX
+        incremental = IncrementalExport(
+            Manifest.load(manifest_path), output_options(parsed_args)
+        )
+
+    checkpoint = None
+    if parsed_args.checkpoint_dir is not None:
+        checkpoint = Checkpoint(
+            parsed_args.checkpoint_dir,
+            dump_fingerprint(dump_file),
+            parsed_args.checkpoint_interval,
+            checkpoint_options(parsed_args),
+        )
 
     password_seed = random_seed()
     meta = get_meta_json(password_seed, growi_version)
     user = create_user(password_seed, user_name)
+    if incremental is not None:
+        user.id = incremental.user_id() or user.id
+        incremental.set_user_id(user.id)
     users = get_users_json_from_user(user)
 
-    tar = pukiwiki.open_tar(dump_file)
-    pages, revisions = get_data_json(tar, prefix, user)
+    if checkpoint is not None and checkpoint.state is not None:
+        meta = checkpoint.state["meta"]
+        users = checkpoint.state["users"]
+        user.id = Id.parse(checkpoint.state["user"])
+
+    index = pukiwiki.NameIndex()
+    links = None
+    if parsed_args.resolve_links:
+        pukiwiki.scan_names(dump_file, index)
+        links = LinkResolver(index, growi_link_url(prefix))
+
+    position = None
+    if checkpoint is not None:
+        position = checkpoint.position
+        position.seek(dump_file)
+
+    reader = None
+    if not isinstance(dump_file, pukiwiki.MemberDump):
+        reader = pukiwiki.CountingReader(dump_file)
+        if position is not None:
+            reader.consumed = position.base
+        dump_file = reader
+
+    progress = Progress(reader)
+
+    history = None
+    if parsed_args.history:
+        history = History()
+
+    attachments = None
+    refs = None
+    if parsed_args.attachments:
+        attachments = GrowiAttachments(AttachmentStore(), user)
+        refs = RefResolver(index, attachments.url)
+
+    pipeline = None
+    if parsed_args.pipelined:
+        pipeline = Pipeline(parsed_args.queue_size)
+
+    tar = pukiwiki.open_dump(dump_file)
+    data = iter_data_json(
+        tar,
+        prefix,
+        user,
+        engine,
+        jobs,
+        cache,
+        incremental,
+        index,
+        links,
+        progress,
+        profiler,
+        pipeline,
+        history,
+        attachments,
+        refs,
+        position,
+    )
+
+    archive: ArchiveWriter | ShardedArchiveWriter
+    sharded = (
+        parsed_args.max_archive_size is not None
+        or parsed_args.pages_per_archive is not None
+    )
+    if sharded:
+
+        def open_archive(i: int) -> ArchiveWriter:
+            f = output_file
+            if i > 0:
+                f = open(shard_path(output_file.name, i), "wb")
+            return ArchiveWriter(f, users, meta, profiler=profiler)
+
+        archive = ShardedArchiveWriter(
+            open_archive,
+            parsed_args.max_archive_size,
+            parsed_args.pages_per_archive,
+            profiler,
+            attachments,
+            grouped=history is not None,
+        )
+    else:
+        archive = ArchiveWriter(
+            output_file,
+            users,
+            meta,
+            profiler=profiler,
+            attachments=attachments,
+        )
+
+    def state() -> dict | None:
+        # Backups and attachments read are not kept in the checkpoint
+        if history is not None and history.backups > 0:
+            return None
+        if attachments is not None and attachments.store.attachments:
+            return None
+        return checkpoint_state(user, users, meta, attachments)
+
+    try:
+        with archive:
+            if checkpoint is not None:
+                resume_checkpoint(
+                    checkpoint, archive, prefix, history, attachments
+                )
+                write_checkpointed(data, archive, checkpoint, state, profiler)
+            elif pipeline is None:
+                for page, revision in data:
+                    archive.write(page, revision)
+            else:
+                # Compress into the archive while the next pages convert
+                with pipeline.write_behind(
+                    lambda item: archive.write(*item), "converter", "writer"
+                ) as writer:
+                    for item in data:
+                        writer.put(item)
+        progress.finish()
+    finally:
+        if cache is not None:
+            cache.close()
+        if attachments is not None:
+            attachments.store.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    if checkpoint is not None:
+        print(checkpoint.report())
+        checkpoint.remove()
+
+    if isinstance(archive, ShardedArchiveWriter):
+        print_shards_report(archive)
+
+    if incremental is not None and manifest_path is not None:
+        incremental.current.save(manifest_path)
+        print(incremental.report())
+
+    if links is not None:
+        print(links.report())
+
+    if history is not None:
+        print(history.report())
+
+    if attachments is not None:
+        print(attachments.report())
+
+    if cache is not None:
+        print(cache.report())
+
+    if pipeline is not None:
+        print(pipeline.report())
+
+    if profiler is not None:
+        profiler.save(
+            parsed_args.profile,
+            command="growi",
+            engine=engine,
+            jobs=jobs,
+            queues=pipeline.json() if pipeline is not None else None,
+        )
+        print(f"Profile written to {parsed_args.profile}")
+
+
+def output_options(parsed_args: ArgNamespace) -> dict:
+    """The options changing the exported pages, as saved with a manifest"""
+    return {
+        "engine": parsed_args.engine,
+        "encoding": pukiwiki.get_encoding(),
+        "prefix": parsed_args.prefix,
+        "resolveLinks": parsed_args.resolve_links,
+        "attachments": parsed_args.attachments,
+        "history": parsed_args.history,
+    }
+
+
+def checkpoint_options(parsed_args: ArgNamespace) -> dict:
+    """The options changing the records of a checkpoint, which a resumed
+    export has to be run with again"""
+    return {
+        **output_options(parsed_args),
+        "userName": parsed_args.name,
+        "growiVersion": parsed_args.growi_version,
+        "maxArchiveSize": parsed_args.max_archive_size,
+        "pagesPerArchive": parsed_args.pages_per_archive,
+    }
+
+
+def print_shards_report(archive: ShardedArchiveWriter):
+    print(f"Wrote {len(archive.archives)} archives")
+    for shard in archive.archives:
+        print(
+            f"  {shard.file.name}: {shard.page_count} pages,"
+            f" {format_size(shard.size)}"
+        )
+
+
+def _run_checkpoint_options_test():
+    args = ArgNamespace(
+        engine=pukiwiki.DEFAULT_ENGINE,
+        prefix="pukiwiki",
+        resolve_links=False,
+        attachments=False,
+        history=False,
+        name="pukiwiki",
+        growi_version=DEFAULT_RGOWI_VERSION,
+        max_archive_size=None,
+        pages_per_archive=None,
+    )
+    fingerprint = {"file": "dump.tar"}
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = Checkpoint(
+            directory, fingerprint, options=checkpoint_options(args)
+        )
+        checkpoint.save({})
+        checkpoint.close()
+
+        args.history = True
+        try:
+            Checkpoint(
+                directory, fingerprint, options=checkpoint_options(args)
+            )
+        except RuntimeError as e:
+            print("ok" if "history" in str(e) else f"failed: {e}")
+        else:
+            print("failed: resumed with another --history")
+
 
-    write_zip(output_file, pages, revisions, users, meta)
+if __name__ == "__main__":
+    _run_largest_first_test()
+    _run_checkpoint_options_test()
@@ -13,3 +13,9 @@ def epoch_iso():
     dt = datetime.fromtimestamp(0, tz=DEFAULT_TZ)
     iso = dt.isoformat()
     return iso
+
+
+def timestamp_iso(seconds: int):
+    dt = datetime.fromtimestamp(seconds, tz=DEFAULT_TZ)
+    iso = dt.isoformat()
+    return iso
@@ -0,0 +1,64 @@
+from typing import Iterator
+
+import pukiwiki
+from encoding.growi.date import timestamp_iso
+from encoding.growi.page import Page
+from encoding.profile import Profiler, STAGE_READ, stage
+from pukiwiki.backup import read_versions
+
+
+class History:
+    """Old versions of the exported pages, read from the backups of a dump.
+
+    Dumps have the backups after the pages, so a backup is only exported if
+    its page was exported before it."""
+
+    def __init__(self):
+        self.pages: dict[str, Page] = {}
+
+        self.versions = 0
+        self.backups = 0
+        self.orphans = 0
+
+    def add(self, name: str, page: Page):
+        self.pages[name] = page
+
+    def iter_versions(
+        self,
+        tar: pukiwiki.Dump,
+        member: pukiwiki.DumpMember,
+        name: str,
+        profiler: Profiler | None = None,
+    ) -> Iterator[tuple[Page, bytes, str]]:
+        """Yields the page of a backup with the raw content and the date of
+        each old version, reading the backup as they are consumed"""
+        page = self.pages.get(name)
+        if page is None:
+            self.orphans += 1
+            return
+
+        f = tar.extractfile(member)
+        if f is None:
+            raise RuntimeError("attempt to extract non-regular file")
+
+        self.backups += 1
+        versions = read_versions(member.path, f)
+
+        while True:
+            with stage(profiler, STAGE_READ):
+                version = next(versions, None)
+            if version is None:
+                return
+
+            time, content = version
+            if profiler is not None:
+                profiler.count(STAGE_READ, len(content))
+
+            self.versions += 1
+            yield page, content, timestamp_iso(time)
+
+    def report(self) -> str:
+        s = f"History: {self.versions} old versions of {self.backups} pages"
+        if self.orphans > 0:
+            s += f", {self.orphans} backups of pages not exported"
+        return s
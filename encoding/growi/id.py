@@ -7,6 +7,8 @@ ID_MIN = 0b1 << (ID_BITS - 1)
 
 
 class Id():
+    __slots__ = ("intId",)
+
     def __init__(self,
                  min: int = ID_MIN,
                  max: int = ID_MAX,
@@ -16,6 +18,10 @@ class Id():
 
         self.intId = intId
 
+    @classmethod
+    def parse(cls, s: str) -> "Id":
+        return cls(intId=int(s, 16))
+
     def __str__(self):
         return f"{self.intId:x}"
 
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+
+import pukiwiki
+from encoding.growi.id import Id
+from encoding.growi.page import Page
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def content_hash(content: bytes) -> str:
+    m = hashlib.sha256()
+    m.update(pukiwiki.CONVERTER_VERSION.encode())
+    m.update(b"\0")
+    m.update(content)
+    return m.hexdigest()
+
+
+class ManifestEntry:
+    """A page exported before, with the revision IDs of its old versions by
+    their date"""
+
+    __slots__ = ("hash", "pageId", "revisionId", "versions")
+
+    def __init__(
+        self,
+        hash: str,
+        pageId: str,
+        revisionId: str,
+        versions: dict[str, str] | None = None,
+    ):
+        self.hash = hash
+        self.pageId = pageId
+        self.revisionId = revisionId
+        self.versions = versions or {}
+
+    def json(self):
+        d = {
+            "hash": self.hash,
+            "pageId": self.pageId,
+            "revisionId": self.revisionId,
+        }
+        if self.versions:
+            d["versions"] = self.versions
+        return d
+
+
+class Manifest:
+    """Records what a Growi archive contains, so that the next export can
+    reuse the IDs and skip the pages which did not change"""
+
+    def __init__(
+        self,
+        pages: dict[str, ManifestEntry] | None = None,
+        userId: str | None = None,
+        options: dict | None = None,
+    ):
+        self.pages = pages or {}
+        self.userId = userId
+
+        # Options the pages were converted with
+        self.options = options
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        if not os.path.exists(path):
+            return cls()
+
+        with open(path) as f:
+            d = json.load(f)
+
+        if d.get("version") != MANIFEST_VERSION:
+            raise RuntimeError(f"unsupported manifest version in {path}")
+
+        pages = {
+            p: ManifestEntry(
+                e["hash"], e["pageId"], e["revisionId"], e.get("versions")
+            )
+            for p, e in d["pages"].items()
+        }
+        return cls(pages, d.get("userId"), d.get("options"))
+
+    def save(self, path: str):
+        d = {
+            "version": MANIFEST_VERSION,
+            "userId": self.userId,
+            "options": self.options,
+            "pages": {p: e.json() for p, e in self.pages.items()},
+        }
+
+        # Replace the old manifest only once the new one is complete
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(d, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+class IncrementalExport:
+    """Compares pages against the manifest of the previous export. Pages keep
+    their previous ID, and unchanged ones are not exported again. Old
+    versions of the pages exported before are not exported again either.
+
+    `options` are those of the export which change the converted pages. All
+    pages are exported again when they differ from the previous ones."""
+
+    def __init__(self, previous: Manifest, options: dict | None = None):
+        self.previous = previous
+        self.current = Manifest(userId=previous.userId, options=options)
+        self.outdated = bool(previous.pages) and previous.options != options
+
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.versions = 0
+
+    def user_id(self) -> Id | None:
+        if self.previous.userId is None:
+            return None
+
+        return Id.parse(self.previous.userId)
+
+    def set_user_id(self, id: Id):
+        self.current.userId = str(id)
+
+    def check(self, page: Page, content: bytes) -> str | None:
+        """Returns the hash of the page content if the page has to be
+        exported, or None if it is unchanged"""
+        digest = content_hash(content)
+        entry = self.previous.pages.get(page.path)
+
+        if entry is None:
+            self.new += 1
+            return digest
+
+        page.id = Id.parse(entry.pageId)
+
+        if entry.hash == digest and not self.outdated:
+            self.current.pages[page.path] = entry
+            self.unchanged += 1
+            return None
+
+        self.changed += 1
+        return digest
+
+    def record(self, page: Page, digest: str):
+        versions = None
+        previous = self.previous.pages.get(page.path)
+        if previous is not None:
+            versions = dict(previous.versions)
+
+        entry = ManifestEntry(
+            digest, str(page.id), str(page.revisionId), versions
+        )
+        self.current.pages[page.path] = entry
+
+    def version_id(self, page: Page, date: str) -> Id | None:
+        """The revision ID an old version of a page was exported with"""
+        entry = self.previous.pages.get(page.path)
+        if entry is None or date not in entry.versions:
+            return None
+        return Id.parse(entry.versions[date])
+
+    def skip_version(self, page: Page, date: str) -> bool:
+        """Whether an old version was exported before. It is exported again
+        with its previous ID when the options changed."""
+        if self.outdated or self.version_id(page, date) is None:
+            return False
+
+        self.versions += 1
+        return True
+
+    def record_version(self, page: Page, date: str, id: Id):
+        self.current.pages[page.path].versions[date] = str(id)
+
+    def removed(self) -> int:
+        removed = self.previous.pages.keys() - self.current.pages.keys()
+        return len(removed)
+
+    def report(self) -> str:
+        s = (
+            f"Incremental: {self.new} new, {self.changed} changed,"
+            f" {self.unchanged} unchanged, {self.removed()} removed pages"
+        )
+        if self.versions > 0:
+            s += f", {self.versions} old versions exported before"
+        if self.outdated:
+            s += "\nThe options changed, so all pages were exported again"
+        return s
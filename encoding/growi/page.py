@@ -1,8 +1,27 @@
 from encoding.growi.date import epoch_iso
 from encoding.growi.id import Id
+from encoding.growi.serialize import Template
+
+_CONSTANTS = {
+    "parent": None,
+    "descendantCount": 0,
+    "isEmpty": False,
+    "status": "published",
+    "grant": 1,
+    "grantedUsers": [],
+    "liker": [],
+    "seenUsers": [],
+    "commentCount": 0,
+    "grantedGroup": None,
+    "__v": 0,
+}
+_FIELDS = ["_id", "revision", "path", "createdAt", "updatedAt"]
+_TEMPLATE = Template(_CONSTANTS, _FIELDS)
 
 
 class Page:
+    __slots__ = ("path", "revisionId", "id", "createdAt", "updatedAt")
+
     def __init__(
         self,
         path: str,
@@ -21,25 +40,35 @@ class Page:
         self.createdAt = createdAt
         self.updatedAt = updatedAt
 
+    @classmethod
+    def parse(cls, d: dict) -> "Page":
+        """A page back from its record in pages.json"""
+        return cls(
+            d["path"],
+            Id.parse(d["revision"]),
+            Id.parse(d["_id"]),
+            d["createdAt"],
+            d["updatedAt"],
+        )
+
+    def values(self) -> tuple:
+        return (
+            str(self.id),
+            str(self.revisionId),
+            self.path,
+            self.createdAt,
+            self.updatedAt,
+        )
+
     def json(self):
-        data = {
-            "parent": None,
-            "descendantCount": 0,
-            "isEmpty": False,
-            "status": "published",
-            "grant": 1,
-            "grantedUsers": [],
-            "liker": [],
-            "seenUsers": [],
-            "commentCount": 0,
-            "grantedGroup": None,
-            "__v": 0,
-        }
-
-        data["_id"] = str(self.id)
-        data["revision"] = str(self.revisionId)
-        data["path"] = self.path
-        data["createdAt"] = self.createdAt
-        data["updatedAt"] = self.updatedAt
+        data = dict(_CONSTANTS)
+        # Each page gets its own lists, as the constants are shared
+        data["grantedUsers"] = []
+        data["liker"] = []
+        data["seenUsers"] = []
+        data.update(zip(_FIELDS, self.values()))
 
         return data
+
+    def json_bytes(self) -> bytes:
+        return _TEMPLATE.encode(*self.values())
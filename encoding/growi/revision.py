@@ -1,8 +1,17 @@
 from encoding.growi.date import epoch_iso
 from encoding.growi.id import Id
+from encoding.growi.serialize import Template
+
+_CONSTANTS = {
+    "__v": 0,
+}
+_FIELDS = ["_id", "format", "createdAt", "pageId", "author", "body"]
+_TEMPLATE = Template(_CONSTANTS, _FIELDS)
 
 
 class Revision:
+    __slots__ = ("id", "pageId", "body", "authorId", "format", "createdAt")
+
     def __init__(
         self,
         pageId: Id,
@@ -22,16 +31,21 @@ class Revision:
             createdAt = epoch_iso()
         self.createdAt = createdAt
 
-    def json(self):
-        data = {
-            "__v": 0,
-        }
+    def values(self) -> tuple:
+        return (
+            str(self.id),
+            str(self.format),
+            self.createdAt,
+            str(self.pageId),
+            str(self.authorId),
+            self.body,
+        )
 
-        data["_id"] = str(self.id)
-        data["format"] = str(self.format)
-        data["createdAt"] = self.createdAt
-        data["pageId"] = str(self.pageId)
-        data["author"] = str(self.authorId)
-        data["body"] = self.body
+    def json(self):
+        data = dict(_CONSTANTS)
+        data.update(zip(_FIELDS, self.values()))
 
         return data
+
+    def json_bytes(self) -> bytes:
+        return _TEMPLATE.encode(*self.values())
@@ -0,0 +1,72 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+# orjson encodes much faster than the standard library when it is installed.
+# Its output keeps non-ASCII characters as UTF-8 instead of escaping them,
+# which is the same JSON.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def encode_string(s: str) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(s)
+    return encode_basestring_ascii(s).encode()
+
+
+def encode_value(value) -> bytes:
+    if isinstance(value, str):
+        return encode_string(value)
+    if value is None:
+        return b"null"
+    if value is True:
+        return b"true"
+    if value is False:
+        return b"false"
+    return dumps(value)
+
+
+def encode(obj) -> bytes:
+    """Encodes a dict, or a record with a `json_bytes` method"""
+    if isinstance(obj, dict):
+        return dumps(obj)
+    return obj.json_bytes()
+
+
+class Template:
+    """The JSON of objects sharing their keys and a part of their values.
+
+    The constant fields and the keys of the others are encoded once, and
+    only the values of the variable fields are encoded for each object. The
+    output is that of `json.dumps` of a dict with the constant fields first,
+    apart from the escaping of non-ASCII characters by orjson."""
+
+    def __init__(self, constants: dict, fields: list[str]):
+        head = json.dumps(constants)[:-1]
+        if constants:
+            head += ", "
+
+        self.fields = fields
+        self.fragments = []
+        for i, field in enumerate(fields):
+            prefix = head if i == 0 else ", "
+            self.fragments.append(f"{prefix}{json.dumps(field)}: ".encode())
+
+    def encode(self, *values) -> bytes:
+        parts = []
+        for fragment, value in zip(self.fragments, values):
+            parts.append(fragment)
+            parts.append(encode_value(value))
+        parts.append(b"}")
+
+        return b"".join(parts)
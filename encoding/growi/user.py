@@ -1,9 +1,41 @@
 from encoding.growi.id import Id
 from encoding.growi.date import now_iso, epoch_iso
 from encoding.growi.password import random_password, hash_password
+from encoding.growi.serialize import Template
+
+_CONSTANTS = {
+    "isGravatarEnabled": False,
+    "isEmailPublished": True,
+    "lang": "ja_JP",
+    "status": 2,
+    "isInvitationEmailSended": False,
+    "__v": 0,
+    "imageUrlCached": "/images/icons/user.svg",
+    "lastLoginAt": epoch_iso(),
+}
+_FIELDS = [
+    "_id",
+    "admin",
+    "createdAt",
+    "name",
+    "username",
+    "email",
+    "password",
+]
+_TEMPLATE = Template(_CONSTANTS, _FIELDS)
 
 
 class User:
+    __slots__ = (
+        "name",
+        "password",
+        "username",
+        "email",
+        "isAdmin",
+        "id",
+        "createdAt",
+    )
+
     def __init__(
         self,
         name: str,
@@ -29,24 +61,22 @@ class User:
         self.id = id or Id()
         self.createdAt = createdAt
 
+    def values(self) -> tuple:
+        return (
+            str(self.id),
+            self.isAdmin,
+            self.createdAt,
+            self.name,
+            self.username,
+            self.email,
+            self.password,
+        )
+
     def json(self):
-        d = {
-            "isGravatarEnabled": False,
-            "isEmailPublished": True,
-            "lang": "ja_JP",
-            "status": 2,
-            "isInvitationEmailSended": False,
-            "__v": 0,
-            "imageUrlCached": "/images/icons/user.svg",
-            "lastLoginAt": epoch_iso(),
-        }
-
-        d["_id"] = str(self.id)
-        d["admin"] = self.isAdmin
-        d["createdAt"] = self.createdAt
-        d["name"] = self.name
-        d["username"] = self.username
-        d["email"] = self.email
-        d["password"] = self.password
+        d = dict(_CONSTANTS)
+        d.update(zip(_FIELDS, self.values()))
 
         return d
+
+    def json_bytes(self) -> bytes:
+        return _TEMPLATE.encode(*self.values())
@@ -0,0 +1,69 @@
+import posixpath
+import zipfile
+from typing import Iterable
+
+from encoding.attachment import AttachmentStore
+from encoding.html.page import Page
+from encoding.profile import Profiler, STAGE_ZIP, stage
+
+_FILES_SUFFIX = "_files"
+
+
+def files_dir(path: str) -> str:
+    """The directory next to a page holding its attachments"""
+    return path + _FILES_SUFFIX
+
+
+class HtmlAttachments:
+    """Attachments written next to the pages they are attached to. Identical
+    files are written once, and references to the others point to that
+    copy."""
+
+    def __init__(self, store: AttachmentStore):
+        self.store = store
+
+        # Paths in the archive by the digest of their content
+        self.paths: dict[str, str] = {}
+
+        self.orphans = 0
+
+    def place(self, pages: Iterable[Page]):
+        """Decides where the attachments go, once the pages are laid out"""
+        locations = {page.name: page.path for page in pages}
+
+        for attachment in self.store:
+            page_path = locations.get(attachment.page)
+            if page_path is None:
+                self.orphans += 1
+                continue
+
+            digest = attachment.blob.digest
+            if digest not in self.paths:
+                self.paths[digest] = posixpath.join(
+                    files_dir(page_path), attachment.file
+                )
+
+    def url(self, path: str, page: str, file: str) -> str | None:
+        """Links are relative, so that the archive can be browsed anywhere"""
+        attachment = self.store.find(page, file)
+        if attachment is None or attachment.blob.digest not in self.paths:
+            return None
+
+        start = posixpath.dirname(path) or "."
+        return posixpath.relpath(self.paths[attachment.blob.digest], start)
+
+    def write(self, zip: zipfile.ZipFile, profiler: Profiler | None = None):
+        for blob in self.store.blobs.values():
+            path = self.paths.get(blob.digest)
+            if path is None:
+                continue
+
+            with stage(profiler, STAGE_ZIP, blob.size):
+                with zip.open(path, "w", force_zip64=True) as f:
+                    self.store.copy(blob, f)
+
+    def report(self) -> str:
+        s = self.store.report()
+        if self.orphans > 0:
+            s += f", {self.orphans} of pages not exported"
+        return s
@@ -1,11 +1,29 @@
 import argparse
 from argparse import ArgumentParser, Namespace as ArgNamespace
-import sys
-import tarfile
+import posixpath
+import typing
 
 
+from encoding.attachment import AttachmentStore
+from encoding.cache import Cache, convert_cached, open_cache
+from encoding.checkpoint import Checkpoint, Position, dump_fingerprint
+from encoding.html.attachment import HtmlAttachments
 from encoding.html.markdown import Converter
+from encoding.html.page import INDEX_FILENAME
+from encoding.pipeline import Pipeline
+from encoding.profile import Profiler, STAGE_READ, iterate, stage
+from encoding.progress import Progress
+from encoding.html.search import SearchIndex
+from encoding.html.renderer import (
+    DEFAULT_RENDERER,
+    DEFAULT_WORKERS,
+    RENDERERS,
+    create_renderer,
+)
+from encoding.size import format_size, parse_size
 import pukiwiki
+from pukiwiki.attach import RefResolver, attachment_name, is_attachment
+from pukiwiki.links import LinkResolver
 
 
 def set_args(parser: ArgumentParser):
@@ -19,55 +37,319 @@ def set_args(parser: ArgumentParser):
         "'export.zip`",
     )
 
+    parser.add_argument(
+        "-r",
+        "--renderer",
+        dest="renderer",
+        choices=RENDERERS,
+        default=DEFAULT_RENDERER,
+        help="how to render pages into HTML. 'pandoc' runs pandoc twice per"
+        " page, 'pandoc-worker' keeps long-lived `pandoc lua` processes,"
+        " 'native' renders in-process without pandoc. "
+        f"Default to '{DEFAULT_RENDERER}'.",
+    )
+
+    parser.add_argument(
+        "--pandoc-workers",
+        dest="pandoc_workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="number of pandoc processes to render pages concurrently with "
+        "the 'pandoc-worker' renderer. Default to the number of CPUs.",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        dest="max_memory",
+        type=parse_size,
+        default=None,
+        help="amount of converted Markdown to keep in memory until pages are"
+        " written, such as '512M'. The rest is spilled to a temporary file."
+        " Default to unlimited.",
+    )
+
+    parser.add_argument(
+        "--search-index",
+        dest="search_index",
+        action="store_true",
+        help="also write an index of the words of all pages, and a search"
+        " page using it at 'search.html' of the archive.",
+    )
+
     parser.set_defaults(func=main)
 
 
-def read_tar(tar: tarfile.TarFile) -> Converter:
+def read_tar(
+    tar: pukiwiki.Dump,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    converter: Converter | None = None,
+    cache: Cache | None = None,
+    reader: pukiwiki.CountingReader | None = None,
+    index: pukiwiki.NameIndex | None = None,
+    links: LinkResolver | None = None,
+    profiler: Profiler | None = None,
+    pipeline: Pipeline | None = None,
+    checkpoint: Checkpoint | None = None,
+) -> Converter:
+    """With `pipeline`, the dump is read in a thread ahead of the
+    conversion. With `checkpoint`, the pages converted before it are added
+    again, and the reading goes on after them."""
     print("Start reading tar file...")
 
-    converter = Converter()
+    converter = converter or Converter()
+    if index is None:
+        index = pukiwiki.NameIndex()
+
+    progress = Progress(reader)
 
-    n = len(tar.getmembers())
+    attachments = None
+    if converter.attachments is not None:
+        attachments = converter.attachments.store
 
-    def print_progress(i: int, info: str):
-        prog = f"\33[2K\rReading file {i:5} / {n:6} ({info})"
-        sys.stdout.write(prog)
-        sys.stdout.flush()
+    position = None
+    if checkpoint is not None:
+        position = checkpoint.position
+        for name, body in checkpoint.replay():
+            converter.append(name, body)
 
-    for i, member in enumerate(tar):
-        i = i + 1
+    pages = iter_wiki_pages(
+        tar, index, progress, profiler, attachments, position
+    )
+    if pipeline is not None:
+        pages = pipeline.read_ahead(pages, "reader", "converter")
+
+    for name, content in pages:
+        body, _ = convert_cached(content, engine, cache, profiler, name)
+
+        if links is not None:
+            body = links.resolve(name, body)
+
+        converter.append(name, body)
+
+        if checkpoint is not None:
+            checkpoint.record([name, body])
+            if checkpoint.due():
+                save_checkpoint(checkpoint, attachments)
+
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, attachments)
+
+    progress.finish()
+
+    return converter
+
+
+def iter_wiki_pages(
+    tar: pukiwiki.Dump,
+    index: pukiwiki.NameIndex,
+    progress: Progress,
+    profiler: Profiler | None = None,
+    attachments: AttachmentStore | None = None,
+    position: Position | None = None,
+) -> typing.Iterator[tuple[str, bytes]]:
+    """Yields the name and raw content of each wiki page. Attachments are put
+    into `attachments` if it is given. The members read are counted in
+    `position`, and a dump resumed from it reads over the ones read
+    before."""
+    members = iterate(profiler, STAGE_READ, tar)
+    if position is not None:
+        members = position.iterate(members)
+
+    for member in members:
         if not member.isfile():
-            print_progress(i, "Skipped: not a file")
+            progress.skip("not a file")
             continue
 
-        if not pukiwiki.is_wiki_page(member):
-            print_progress(i, "Skipped: not a wiki page")
+        if attachments is not None and is_attachment(member):
+            page, file = attachment_name(member.path, pukiwiki.decode_path)
+            with stage(profiler, STAGE_READ, member.size):
+                f = tar.extractfile(member)
+                if f is None:
+                    raise RuntimeError("attempt to extract non-regular file")
+                attachments.add(page, file, f)
             continue
 
-        path = pukiwiki.normalize_path(member.path)
+        if not pukiwiki.is_wiki_page(member, index):
+            progress.skip("not a wiki page")
+            continue
 
-        f = tar.extractfile(member)
-        if f is None:
-            raise RuntimeError("attempt to extract non-regular file")
+        path = pukiwiki.normalize_path(member.path, index=index)
 
-        content = f.read()
+        with stage(profiler, STAGE_READ, member.size):
+            f = tar.extractfile(member)
+            if f is None:
+                raise RuntimeError("attempt to extract non-regular file")
 
-        print_progress(i, f"{len(content):6} bytes")
+            content = f.read()
 
-        original = pukiwiki.decode(content)
-        body = pukiwiki.convert(original)
+        progress.update(len(content))
 
-        converter.append(path, body)
+        yield path, content
 
-    return converter
+
+def save_checkpoint(
+    checkpoint: Checkpoint, attachments: AttachmentStore | None = None
+):
+    """Attachments read are not kept in the checkpoint, so that it is not
+    saved past them"""
+    if attachments is None or not attachments.attachments:
+        checkpoint.save({})
+
+
+def page_file(index: pukiwiki.NameIndex, name: str) -> str:
+    """Returns the path of a page in the archive, which `PageTree` gives it
+    once all pages are read. Pages with children are moved to `index` under
+    their own directory."""
+    if index.has_children(name):
+        return posixpath.join(name, INDEX_FILENAME)
+    return name
+
+
+def html_link_url(
+    index: pukiwiki.NameIndex,
+) -> typing.Callable[[str, str], str]:
+    """Links are relative, so that the archive can be browsed anywhere"""
+
+    def url(name: str, target: str) -> str:
+        start = posixpath.dirname(page_file(index, name)) or "."
+        return posixpath.relpath(page_file(index, target), start)
+
+    return url
+
+
+def checkpoint_options(parsed_args: ArgNamespace) -> dict:
+    """The options changing the Markdown of the pages in a checkpoint. The
+    others only change the rendering, which is done after reading."""
+    return {
+        "engine": parsed_args.engine,
+        "encoding": pukiwiki.get_encoding(),
+        "resolveLinks": parsed_args.resolve_links,
+    }
 
 
 def main(parsed_args: ArgNamespace):
     dump_file = parsed_args.pukiwiki_dump
 
-    tar = pukiwiki.open_tar(dump_file)
+    index = pukiwiki.NameIndex()
+    links = None
+    if parsed_args.resolve_links:
+        pukiwiki.scan_names(dump_file, index)
+        links = LinkResolver(index, html_link_url(index))
+
+    checkpoint = None
+    if parsed_args.checkpoint_dir is not None:
+        checkpoint = Checkpoint(
+            parsed_args.checkpoint_dir,
+            dump_fingerprint(dump_file),
+            parsed_args.checkpoint_interval,
+            checkpoint_options(parsed_args),
+        )
+        checkpoint.position.seek(dump_file)
+
+    reader = None
+    if not isinstance(dump_file, pukiwiki.MemberDump):
+        reader = pukiwiki.CountingReader(dump_file)
+        if checkpoint is not None:
+            reader.consumed = checkpoint.position.base
+        dump_file = reader
+
+    tar = pukiwiki.open_dump(dump_file)
+
+    renderer = create_renderer(
+        parsed_args.renderer, parsed_args.pandoc_workers
+    )
+    cache = open_cache(parsed_args.cache_dir, parsed_args.cache_size)
+
+    profiler = None
+    if parsed_args.profile is not None:
+        profiler = Profiler(parsed_args.profile_top)
+
+    pipeline = None
+    if parsed_args.pipelined:
+        pipeline = Pipeline(parsed_args.queue_size)
+
+    attachments = None
+    refs = None
+    if parsed_args.attachments:
+        attachments = HtmlAttachments(AttachmentStore())
+        refs = RefResolver(index, attachments.url)
+
+    search = None
+    if parsed_args.search_index:
+        search = SearchIndex()
+
+    converter = Converter(
+        renderer,
+        parsed_args.max_memory,
+        cache,
+        profiler,
+        pipeline,
+        attachments,
+        refs,
+        search,
+    )
+    try:
+        read_tar(
+            tar,
+            parsed_args.engine,
+            converter,
+            cache,
+            reader,
+            index,
+            links,
+            profiler,
+            pipeline,
+            checkpoint,
+        )
 
-    converter = read_tar(tar)
+        f = parsed_args.output_file
+        converter.write_zip(f)
+    finally:
+        converter.close()
+        renderer.close()
+        if cache is not None:
+            cache.close()
+        if attachments is not None:
+            attachments.store.close()
+        if checkpoint is not None:
+            checkpoint.close()
 
-    f = parsed_args.output_file
-    converter.write_zip(f)
+    if checkpoint is not None:
+        print(checkpoint.report())
+        checkpoint.remove()
+
+    print_spill_report(converter)
+    if links is not None:
+        print(links.report())
+    if attachments is not None:
+        print(attachments.report())
+    if refs is not None:
+        print(refs.report())
+    if search is not None:
+        print(search.report())
+    if cache is not None:
+        print(cache.report())
+    if pipeline is not None:
+        print(pipeline.report())
+
+    if profiler is not None:
+        profiler.save(
+            parsed_args.profile,
+            command="html",
+            engine=parsed_args.engine,
+            renderer=parsed_args.renderer,
+            queues=pipeline.json() if pipeline is not None else None,
+        )
+        print(f"Profile written to {parsed_args.profile}")
+
+
+def print_spill_report(converter: Converter):
+    store = converter.store
+    if store.max_memory is None:
+        return
+
+    print(
+        f"Spilled {store.spilled_pages} of {len(converter.tree)} pages"
+        f" ({format_size(store.spilled)}) to disk, kept"
+        f" {format_size(store.memory)} in memory"
+    )
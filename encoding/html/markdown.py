@@ -1,76 +1,175 @@
-import os
-from typing import IO
+from typing import IO, Iterator
 import zipfile
 
-import pandoc
-
+from encoding.cache import Cache
+from encoding.html.attachment import HtmlAttachments
 from encoding.html.page import Page
+from encoding.profile import (
+    Profiler,
+    STAGE_INDEX,
+    STAGE_RENDER,
+    STAGE_ZIP,
+    stage,
+)
+from encoding.html.renderer import PandocRenderer, Renderer
+from encoding.html.search import SearchIndex
+from encoding.html.store import MarkdownStore
+from encoding.html.tree import PageTree
+from encoding.pipeline import Pipeline
+from pukiwiki.attach import RefResolver
+
+# Number of pages looked up in the cache before rendering the missing ones
+_RENDER_CHUNK_SIZE = 64
 
-_PANDOC_FORMAT_MARKDOWN = "markdown"
-_PANDOC_FORMAT_HTML = "html"
-
-
-def possible_paths(paths: list[str]) -> list[str]:
-    if len(paths) <= 1:
-        return paths
 
-    me = paths[0]
-    children = possible_paths(paths[1:])
-
-    out = [me]
+class Converter:
+    tree: PageTree
+    renderer: Renderer
+    store: MarkdownStore
+    cache: Cache | None
+    profiler: Profiler | None
+    pipeline: Pipeline | None
+    attachments: HtmlAttachments | None
+    refs: RefResolver | None
+    search: SearchIndex | None
+
+    def __init__(
+        self,
+        renderer: Renderer | None = None,
+        max_memory: int | None = None,
+        cache: Cache | None = None,
+        profiler: Profiler | None = None,
+        pipeline: Pipeline | None = None,
+        attachments: HtmlAttachments | None = None,
+        refs: RefResolver | None = None,
+        search: SearchIndex | None = None,
+    ):
+        self.tree = PageTree()
+        self.renderer = renderer or PandocRenderer()
+        self.store = MarkdownStore(max_memory)
+        self.cache = cache
+        self.profiler = profiler
+        self.pipeline = pipeline
+        self.attachments = attachments
+        self.refs = refs
+        self.search = search
+
+    def append(self, name: str, markdown: str) -> Page:
+        """Pages are put in place once all of them are known"""
+        page = self.parse(name, markdown)
+        self.tree.add(page)
+
+        if self.search is not None:
+            with stage(self.profiler, STAGE_INDEX, len(markdown)):
+                self.search.add(name, markdown)
 
-    for child in children:
-        path = os.path.join(me, child)
-        out.append(path)
+        return page
 
-    return out
+    def layout(self) -> list[Page]:
+        """Places the pages, and adds the generated indexes of directories
+        and the sitemap"""
+        pages, listings = self.tree.place()
+        if self.attachments is not None:
+            self.attachments.place(pages)
 
+        for listing in listings:
+            pages.append(
+                self.parse(listing.path, listing.markdown(), listing.name)
+            )
 
-class Converter:
-    results: dict[str, Page]
+        return pages
 
-    def __init__(self):
-        self.results = {}
+    def write_zip(self, file: IO[bytes]):
+        pages = self.layout()
+        contents = self.render(pages)
 
-    def append(self, path: str, markdown: str) -> Page:
-        page = self.parse(path, markdown)
+        with zipfile.ZipFile(file, "x") as f:
 
-        parents = self.find_parent_path(page.path)
-        for p in parents:
-            parent_page = self.results[p]
-            del self.results[p]
+            def write(item: tuple[Page, str]):
+                page, content = item
+                with stage(self.profiler, STAGE_ZIP, len(content)):
+                    self.write_page(f, page, content)
 
-            new_page = parent_page.to_index()
-            self.results[new_page] = new_page
+            rendered = self.iter_rendered(pages, contents)
 
-        self.results[path] = page
+            if self.pipeline is None:
+                for item in rendered:
+                    write(item)
+            else:
+                # Compress into the archive while the next pages render
+                with self.pipeline.write_behind(
+                    write, "renderer", "writer"
+                ) as writer:
+                    for item in rendered:
+                        writer.put(item)
 
-        return page
+            if self.attachments is not None:
+                self.attachments.write(f, self.profiler)
 
-    def find_parent_path(self, path: str) -> list[str]:
-        parents = []
-        paths = list(os.path.split(path))
-        possible_parents = possible_paths(paths)
+            if self.search is not None:
+                self.search.write(f, pages)
 
-        for p in possible_parents:
-            if self.results.get(p) is not None:
-                parents.append(p)
+    def iter_rendered(
+        self, pages: list[Page], contents: Iterator[str]
+    ) -> Iterator[tuple[Page, str]]:
+        for page in pages:
+            # Pages are rendered lazily, so time the next one here
+            with stage(self.profiler, STAGE_RENDER):
+                content = next(contents)
 
-        return parents
+            if self.profiler is not None:
+                self.profiler.count(STAGE_RENDER, len(content))
 
-    def write_zip(self, file: IO[bytes]):
-        with zipfile.ZipFile(file, "x") as f:
-            for page in self.results.values():
-                self.write_page(f, page)
+            yield page, content
 
-    def write_page(self, zip: zipfile.ZipFile, page: Page):
-        content = pandoc.write(
-            page.doc, format=_PANDOC_FORMAT_HTML, options=["-s"]
-        )
+    def write_page(self, zip: zipfile.ZipFile, page: Page, content: str):
         path = page.path
         zip.writestr(path, content)
 
-    @classmethod
-    def parse(_cls, path: str, markdown: str) -> Page:
-        doc = pandoc.read(markdown, format=_PANDOC_FORMAT_MARKDOWN)
-        return Page(path, doc)
+    def render(self, pages: list[Page]) -> Iterator[str]:
+        if self.cache is None:
+            docs = (self.load(page) for page in pages)
+            yield from self.renderer.render(docs)
+            return
+
+        version = self.renderer.version()
+        for i in range(0, len(pages), _RENDER_CHUNK_SIZE):
+            chunk = pages[i : i + _RENDER_CHUNK_SIZE]
+            yield from self.render_cached(chunk, self.cache, version)
+
+    def render_cached(
+        self, pages: list[Page], cache: Cache, version: str
+    ) -> Iterator[str]:
+        markdowns = [self.markdown(page) for page in pages]
+        contents = [cache.get_html(m, version) for m in markdowns]
+
+        missing = [i for i, content in enumerate(contents) if content is None]
+        docs = (self.renderer.parse(markdowns[i]) for i in missing)
+        for i, content in zip(missing, self.renderer.render(docs)):
+            cache.put_html(markdowns[i], version, content)
+            contents[i] = content
+
+        for content in contents:
+            yield content or ""
+
+    def load(self, page: Page):
+        """Parses a page for the renderer. This is deferred until the page is
+        written, so that only its Markdown is kept until then."""
+        markdown = self.markdown(page)
+        doc = self.renderer.parse(markdown)
+        return doc
+
+    def markdown(self, page: Page) -> str:
+        """The Markdown of a page, with references to attachments resolved
+        now that the pages and attachments have their place"""
+        markdown = self.store.get(page.markdown)
+        if self.refs is not None:
+            markdown = self.refs.resolve(page.name, markdown, page.path)
+        return markdown
+
+    def parse(self, path: str, markdown: str, name: str | None = None) -> Page:
+        stored = self.store.put(markdown)
+        return Page(path, stored, name)
+
+    def close(self):
+        self.store.close()
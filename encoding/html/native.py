@@ -0,0 +1,278 @@
+import html
+import re
+from typing import Iterable, Iterator
+
+# Bumped when the output changes, as it keys the cached pages
+NATIVE_VERSION = "1"
+
+_pat_heading = re.compile(r"(#{1,6}) +(.*?)(?: +#+)? *$")
+_pat_item = re.compile(r"( *)- +(.*)$")
+_pat_table_delimiter = re.compile(r"\|(?: *:?-+:? *\|)+ *$")
+
+# Markup of the lines, which are HTML escaped already. The first group names
+# the kind of a match.
+_pat_inline = re.compile(
+    r"(?P<image>!\[([^\]]*)\]\(([^)\s]*)\))"
+    r"|(?P<link>\[([^\]]*)\]\(([^)\s]*)\))"
+    r"|(?P<strong>\*\*(?=\S)(.+?)(?<=\S)\*\*)"
+    r"|(?P<strike>~~(?=\S)(.+?)(?<=\S)~~)"
+    r"|(?P<emphasis>\*(?=\S)(.+?)(?<=\S)\*)"
+)
+_INLINE_MARKS = ("*", "~~", "[")
+
+_pat_tag = re.compile(r"<[^>]*>")
+
+_ALIGNMENTS = {
+    (True, False): "left",
+    (False, True): "right",
+    (True, True): "center",
+}
+
+_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+  <title>{title}</title>
+  <style>
+    body {{ margin: 0 auto; max-width: 40em; padding: 0 50px 50px;
+      line-height: 1.5; color: #1a1a1a; background-color: #fdfdfd; }}
+    pre {{ overflow: auto; padding: 1em; background-color: #f2f2f2; }}
+    table {{ border-collapse: collapse; }}
+    th, td {{ padding: 0.25em 0.5em; border: 1px solid #cccccc; }}
+    img {{ max-width: 100%; }}
+  </style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def attribute(value: str) -> str:
+    """Escapes a link destination, which may be escaped already"""
+    return html.escape(html.unescape(value))
+
+
+def render_inline(text: str) -> str:
+    if not any(mark in text for mark in _INLINE_MARKS):
+        return text
+
+    def replace(m: re.Match) -> str:
+        kind = m.lastgroup
+        if kind == "image":
+            alt, url = m.group(2), m.group(3)
+            return f'<img src="{attribute(url)}" alt="{attribute(alt)}" />'
+        if kind == "link":
+            text, url = m.group(5), m.group(6)
+            return f'<a href="{attribute(url)}">{render_inline(text)}</a>'
+        if kind == "strong":
+            return f"<strong>{render_inline(m.group(8))}</strong>"
+        if kind == "strike":
+            return f"<del>{render_inline(m.group(10))}</del>"
+        return f"<em>{render_inline(m.group(12))}</em>"
+
+    return _pat_inline.sub(replace, text)
+
+
+def heading_id(text: str) -> str:
+    """The identifier pandoc gives to a heading"""
+    plain = html.unescape(_pat_tag.sub("", text)).lower()
+    chars = []
+    for c in plain:
+        if c.isspace():
+            chars.append("-")
+        elif c.isalnum() or c in "_-.":
+            chars.append(c)
+
+    id = "".join(chars)
+    for i, c in enumerate(id):
+        if c.isalpha():
+            return id[i:]
+
+    return "section"
+
+
+class BodyRenderer:
+    """Renders the Markdown of one page, which has the blocks `convert`
+    writes: headings, lists, code fences, tables and paragraphs, one kind per
+    line. The text is HTML already, so that it is written as it is."""
+
+    def __init__(self, markdown: str):
+        self.lines = markdown.split("\n")
+        self.i = 0
+        self.out: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.title: str | None = None
+
+    def render(self) -> str:
+        lines = self.lines
+        while self.i < len(lines):
+            line = lines[self.i]
+
+            if line.strip() == "":
+                self.i += 1
+            elif line.startswith("```"):
+                self.fence()
+            elif line.startswith("#") and (m := _pat_heading.match(line)):
+                self.heading(len(m.group(1)), m.group(2))
+            elif _pat_item.match(line):
+                self.bullets()
+            elif line.startswith("|") and self.is_table():
+                self.table()
+            else:
+                self.paragraph()
+
+        return "\n".join(self.out)
+
+    def fence(self):
+        start = self.i + 1
+        end = start
+        while end < len(self.lines) and not self.lines[end].startswith("```"):
+            end += 1
+
+        code = "\n".join(self.lines[start:end])
+        self.out.append(f"<pre><code>{code}</code></pre>")
+        self.i = end + 1
+
+    def heading(self, level: int, text: str):
+        content = render_inline(text)
+        if self.title is None:
+            self.title = html.unescape(_pat_tag.sub("", content))
+
+        id = heading_id(content)
+        n = self.ids.get(id, 0)
+        self.ids[id] = n + 1
+        if n > 0:
+            id = f"{id}-{n}"
+
+        self.out.append(f'<h{level} id="{id}">{content}</h{level}>')
+        self.i += 1
+
+    def bullets(self):
+        out = self.out
+        # Indents of the open lists, innermost last
+        indents: list[int] = []
+
+        while self.i < len(self.lines):
+            m = _pat_item.match(self.lines[self.i])
+            if m is None:
+                break
+
+            indent = len(m.group(1))
+            if not indents or indent > indents[-1]:
+                out.append("<ul>")
+                indents.append(indent)
+            else:
+                while len(indents) > 1 and indent < indents[-1]:
+                    indents.pop()
+                    out[-1] += "</li>"
+                    out.append("</ul>")
+                out[-1] += "</li>"
+
+            out.append(f"<li>{render_inline(m.group(2))}")
+            self.i += 1
+
+        for _ in indents:
+            out[-1] += "</li>"
+            out.append("</ul>")
+
+    def is_table(self) -> bool:
+        i = self.i + 1
+        return i < len(self.lines) and bool(
+            _pat_table_delimiter.match(self.lines[i])
+        )
+
+    def table(self):
+        header = self.cells(self.lines[self.i])
+        aligns = [
+            _ALIGNMENTS.get((cell.startswith(":"), cell.endswith(":")))
+            for cell in self.cells(self.lines[self.i + 1])
+        ]
+        self.i += 2
+
+        def row(cells: list[str], tag: str) -> str:
+            out = ["<tr>"]
+            for i, cell in enumerate(cells):
+                align = aligns[i] if i < len(aligns) else None
+                style = f' style="text-align: {align};"' if align else ""
+                out.append(f"<{tag}{style}>{render_inline(cell)}</{tag}>")
+            out.append("</tr>")
+            return "\n".join(out)
+
+        self.out.append("<table>")
+        # Tables without a header have an empty one in Markdown
+        if any(header):
+            self.out.append(f"<thead>\n{row(header, 'th')}\n</thead>")
+
+        self.out.append("<tbody>")
+        while self.i < len(self.lines):
+            line = self.lines[self.i]
+            if not line.startswith("|"):
+                break
+            self.out.append(row(self.cells(line), "td"))
+            self.i += 1
+        self.out.append("</tbody>\n</table>")
+
+    def cells(self, line: str) -> list[str]:
+        line = line.strip()
+        if line.endswith("|"):
+            line = line[:-1]
+        return [cell.strip() for cell in line[1:].split("|")]
+
+    def paragraph(self):
+        lines = []
+        while self.i < len(self.lines):
+            line = self.lines[self.i]
+            if (
+                line.strip() == ""
+                or line.startswith("```")
+                or (line.startswith("#") and _pat_heading.match(line))
+                or _pat_item.match(line)
+                or (line.startswith("|") and self.is_table())
+            ):
+                break
+
+            lines.append(line)
+            self.i += 1
+
+        # Two spaces at the end of a line break it
+        text = "\n".join(
+            line.rstrip() + "<br />" if line.endswith("  ") else line
+            for line in lines[:-1]
+        )
+        last = lines[-1].rstrip()
+        text = f"{text}\n{last}" if text else last
+
+        self.out.append(f"<p>{render_inline(text)}</p>")
+
+
+def render_page(markdown: str) -> str:
+    """Renders a page into a standalone HTML document. Its title is its first
+    heading, or "input" as the pandoc renderers name it."""
+    renderer = BodyRenderer(markdown)
+    body = renderer.render()
+    title = renderer.title or "input"
+
+    return _TEMPLATE.format(title=html.escape(title), body=body)
+
+
+class NativeRenderer:
+    """Renders pages in-process, without pandoc. Only the Markdown which
+    `pukiwiki.convert` writes is supported, but it is read the way the wiki
+    meant it: headings and lists need no blank line before them, and code is
+    not escaped a second time."""
+
+    def version(self) -> str:
+        return f"native {NATIVE_VERSION}"
+
+    def parse(self, markdown: str) -> str:
+        return markdown
+
+    def render(self, docs: Iterable[str]) -> Iterator[str]:
+        for doc in docs:
+            yield render_page(doc)
+
+    def close(self):
+        pass
@@ -1,18 +1,19 @@
-import os
+from encoding.html.store import SpilledMarkdown
 
-from pandoc.types import Pandoc
-
-_INDEX_FILENAME = "index"
+INDEX_FILENAME = "index"
 
 
 class Page:
     path: str
-    doc: Pandoc
+    markdown: str | SpilledMarkdown
+    name: str
 
-    def __init__(self, path: str, doc: Pandoc):
+    def __init__(
+        self,
+        path: str,
+        markdown: str | SpilledMarkdown,
+        name: str | None = None,
+    ):
         self.path = path
-        self.doc = doc
-
-    def to_index(self) -> "Page":
-        path = os.path.join(self.path, _INDEX_FILENAME)
-        return Page(path, self.doc)
+        self.markdown = markdown
+        self.name = name or path
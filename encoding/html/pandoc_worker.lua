@@ -0,0 +1,40 @@
+-- Long-lived pandoc worker used by encoding.html.renderer.PandocWorkerRenderer.
+--
+-- Run with `pandoc lua pandoc_worker.lua`. Reads Markdown documents framed as
+-- "<byte length>\n<bytes>" from stdin, and writes each one back as a
+-- standalone HTML document framed as "<ok|error> <byte length>\n<bytes>".
+-- The output is the same as the `pandoc` renderer, which reads the Markdown
+-- and writes it with `pandoc -s`.
+
+local template = pandoc.template.compile(pandoc.template.default("html"))
+
+local function render(markdown)
+  local doc = pandoc.read(markdown, "markdown")
+  local options = { template = template }
+  -- Match the `pandoc` Python package, which converts a file named "input".
+  if doc.meta.title == nil and doc.meta.pagetitle == nil then
+    options.variables = { pagetitle = "input" }
+  end
+  return pandoc.write(doc, "html", options)
+end
+
+while true do
+  local header = io.read("l")
+  if header == nil then
+    break
+  end
+
+  -- Reading zero bytes would block to look for the end of the input.
+  local length = tonumber(header)
+  local markdown = ""
+  if length > 0 then
+    markdown = io.read(length)
+  end
+
+  local ok, result = pcall(render, markdown)
+  local status = ok and "ok" or "error"
+  result = tostring(result)
+
+  io.write(status, " ", #result, "\n", result)
+  io.flush()
+end
@@ -0,0 +1,189 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import queue
+import subprocess
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from encoding.html.native import NativeRenderer
+
+# Only the pandoc renderer needs the pandoc package
+try:
+    import pandoc
+except ImportError:
+    pandoc = None
+
+if TYPE_CHECKING:
+    from pandoc.types import Pandoc
+
+_PANDOC_FORMAT_MARKDOWN = "markdown"
+_PANDOC_FORMAT_HTML = "html"
+
+_PANDOC_EXECUTABLE = "pandoc"
+_PANDOC_WORKER_SCRIPT = os.path.join(
+    os.path.dirname(__file__), "pandoc_worker.lua"
+)
+
+RENDERER_PANDOC = "pandoc"
+RENDERER_PANDOC_WORKER = "pandoc-worker"
+RENDERER_NATIVE = "native"
+RENDERERS = [RENDERER_PANDOC, RENDERER_PANDOC_WORKER, RENDERER_NATIVE]
+DEFAULT_RENDERER = RENDERER_PANDOC
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def pandoc_version(executable: str = _PANDOC_EXECUTABLE) -> str:
+    """Returns the first line of `pandoc --version`, such as 'pandoc 3.1.11.1'.
+    Both renderers produce the same output for the same pandoc."""
+    result = subprocess.run(
+        [executable, "--version"], capture_output=True, check=True, text=True
+    )
+    lines = result.stdout.splitlines()
+    return lines[0] if lines else executable
+
+
+class PandocRenderer:
+    """Renders pages with the `pandoc` package, which runs a pandoc process to
+    read each page and another one to write it."""
+
+    def __init__(self):
+        if pandoc is None:
+            raise RuntimeError("the pandoc renderer needs the pandoc package")
+
+    def version(self) -> str:
+        return pandoc_version()
+
+    def parse(self, markdown: str) -> "Pandoc":
+        doc = pandoc.read(markdown, format=_PANDOC_FORMAT_MARKDOWN)
+        return doc
+
+    def render(self, docs: Iterable["Pandoc"]) -> Iterator[str]:
+        for doc in docs:
+            content = pandoc.write(
+                doc, format=_PANDOC_FORMAT_HTML, options=["-s"]
+            )
+            yield content
+
+    def close(self):
+        pass
+
+
+class PandocWorker:
+    """A `pandoc lua` process running `pandoc_worker.lua`, which converts
+    Markdown documents sent through its stdin until it is closed."""
+
+    def __init__(self, executable: str = _PANDOC_EXECUTABLE):
+        self.process = subprocess.Popen(
+            [executable, "lua", _PANDOC_WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def render(self, markdown: str) -> str:
+        stdin, stdout = self.process.stdin, self.process.stdout
+        if stdin is None or stdout is None:
+            raise RuntimeError("pandoc worker has no pipe")
+
+        data = markdown.encode()
+        stdin.write(b"%d\n" % len(data))
+        stdin.write(data)
+        stdin.flush()
+
+        header = stdout.readline()
+        if not header:
+            raise RuntimeError("pandoc worker exited unexpectedly")
+
+        status, length = header.split()
+        content = stdout.read(int(length)).decode()
+
+        if status != b"ok":
+            raise RuntimeError(f"pandoc worker failed to render: {content}")
+
+        return content
+
+    def close(self):
+        if self.process.stdin is not None:
+            self.process.stdin.close()
+        self.process.wait()
+
+
+class PandocWorkerRenderer:
+    """Renders pages with a pool of long-lived pandoc workers, so that no
+    process is spawned per page. Pages are rendered concurrently by `workers`
+    processes and yielded in the given order."""
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        executable: str = _PANDOC_EXECUTABLE,
+    ):
+        self.workers = max(workers, 1)
+        self.executable = executable
+
+        self.pool: list[PandocWorker] = []
+        self.idle: queue.Queue[PandocWorker] = queue.Queue()
+        self.executor: ThreadPoolExecutor | None = None
+
+    def version(self) -> str:
+        return pandoc_version(self.executable)
+
+    def parse(self, markdown: str) -> str:
+        # Workers read the Markdown themselves
+        return markdown
+
+    def start(self) -> ThreadPoolExecutor:
+        if self.executor is not None:
+            return self.executor
+
+        for _ in range(self.workers):
+            worker = PandocWorker(self.executable)
+            self.pool.append(worker)
+            self.idle.put(worker)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    def render_one(self, markdown: str) -> str:
+        worker = self.idle.get()
+        try:
+            return worker.render(markdown)
+        finally:
+            self.idle.put(worker)
+
+    def render(self, docs: Iterable[str]) -> Iterator[str]:
+        executor = self.start()
+
+        # Keep a few pages queued per worker, but not all of them
+        pending: deque[Future[str]] = deque()
+        for doc in docs:
+            pending.append(executor.submit(self.render_one, doc))
+
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        for worker in self.pool:
+            worker.close()
+        self.pool = []
+
+
+Renderer = PandocRenderer | PandocWorkerRenderer | NativeRenderer
+
+
+def create_renderer(
+    name: str = DEFAULT_RENDERER, workers: int = DEFAULT_WORKERS
+) -> Renderer:
+    if name == RENDERER_PANDOC_WORKER:
+        return PandocWorkerRenderer(workers)
+    if name == RENDERER_NATIVE:
+        return NativeRenderer()
+
+    return PandocRenderer()
@@ -0,0 +1,278 @@
+import html
+import json
+import re
+import unicodedata
+import zipfile
+
+from encoding.html.page import Page
+from encoding.size import format_size
+
+SEARCH_PAGE = "search.html"
+SEARCH_DIR = "search"
+
+# Approximate size of a shard of the postings
+SHARD_SIZE = 64 * 1024
+
+# Runs of CJK characters are cut into overlapping bigrams, as they are not
+# separated by spaces. Other letters and digits form words. The pattern is
+# shared with the search page, so it must read the same in JavaScript.
+TOKEN_PATTERN = (
+    r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+)"
+    r"|[0-9a-z\u00c0-\u024f\u0370-\u03ff\u0400-\u04ff]+"
+)
+_pat_token = re.compile(TOKEN_PATTERN)
+
+# Destinations of links and images, which are not text of the page
+_pat_destination = re.compile(r"\]\([^)]*\)")
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKC", text).lower()
+
+    tokens = []
+    for m in _pat_token.finditer(text):
+        run = m.group(1)
+        if run is None:
+            tokens.append(m.group())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens += [run[i : i + 2] for i in range(len(run) - 1)]
+
+    return tokens
+
+
+def shard_of(token: str, shards: int) -> int:
+    """FNV-1a of the UTF-16 code units of a token, as the search page
+    computes it"""
+    h = 0x811C9DC5
+    data = token.encode("utf-16-le")
+    for i in range(0, len(data), 2):
+        h = ((h ^ (data[i] | data[i + 1] << 8)) * 0x01000193) & 0xFFFFFFFF
+    return h % shards
+
+
+def shard_path(i: int) -> str:
+    return f"{SEARCH_DIR}/{i}.js"
+
+
+class SearchIndex:
+    """An inverted index of the pages, built as they are converted, and
+    written into the archive with a search page.
+
+    The postings of a token are the pairs of the pages it occurs in and the
+    number of times. They are split into shards by the hash of the tokens,
+    so that the search page loads only the shards of the tokens of a query.
+    Shards are scripts calling the search page with their JSON, since pages
+    opened from files may not fetch other files."""
+
+    def __init__(self, shard_size: int = SHARD_SIZE):
+        self.shard_size = shard_size
+        self.names: list[str] = []
+        self.postings: dict[str, list[int]] = {}
+        self.size = 0
+        self.shards = 0
+
+    def add(self, name: str, markdown: str):
+        doc = len(self.names)
+        self.names.append(name)
+
+        text = _pat_destination.sub("]", html.unescape(markdown))
+        counts: dict[str, int] = {}
+        for token in tokenize(name) + tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        for token, count in counts.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = []
+            postings += (doc, count)
+
+    def shard_count(self) -> int:
+        """A power of two keeping shards around `shard_size`"""
+        size = sum(
+            len(token) + 8 * len(postings)
+            for token, postings in self.postings.items()
+        )
+
+        shards = 1
+        while size > shards * self.shard_size:
+            shards *= 2
+        return shards
+
+    def write(self, zip: zipfile.ZipFile, pages: list[Page]):
+        paths = {page.name: page.path for page in pages}
+        docs = [[name, paths.get(name)] for name in self.names]
+        self.write_script(zip, f"{SEARCH_DIR}/docs.js", "docs", docs)
+
+        self.shards = self.shard_count()
+        shards: list[dict[str, list[int]]] = [{} for _ in range(self.shards)]
+        for token, postings in self.postings.items():
+            shards[shard_of(token, self.shards)][token] = postings
+
+        for i, shard in enumerate(shards):
+            self.write_script(zip, shard_path(i), "shard", i, shard)
+
+        page = _SEARCH_PAGE.replace("@SHARDS@", str(self.shards))
+        page = page.replace("@PATTERN@", TOKEN_PATTERN)
+        zip.writestr(SEARCH_PAGE, page)
+        self.size += len(page)
+
+    def write_script(self, zip: zipfile.ZipFile, path: str, f: str, *args):
+        data = ",".join(json.dumps(arg, separators=(",", ":")) for arg in args)
+        script = f"search.{f}({data});\n"
+        zip.writestr(path, script)
+        self.size += len(script)
+
+    def report(self) -> str:
+        return (
+            f"Search index: {len(self.names)} pages, {len(self.postings)}"
+            f" tokens in {self.shards} shards ({format_size(self.size)})"
+        )
+
+
+_SEARCH_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+  <title>Search</title>
+  <style>
+    body { margin: 0 auto; max-width: 40em; padding: 0 50px 50px;
+      line-height: 1.5; color: #1a1a1a; background-color: #fdfdfd; }
+    input { width: 100%; font-size: 1.2em; }
+  </style>
+</head>
+<body>
+<h1>Search</h1>
+<form id="form"><input id="query" type="search" autofocus /></form>
+<p id="status"></p>
+<ol id="results"></ol>
+<script>
+var SHARDS = @SHARDS@;
+var PATTERN = /@PATTERN@/g;
+
+var search = { names: [], paths: [], shards: {}, waiting: {} };
+
+search.docs = function (docs) {
+  docs.forEach(function (doc) {
+    search.names.push(doc[0]);
+    search.paths.push(doc[1]);
+  });
+};
+
+search.shard = function (i, postings) {
+  search.shards[i] = postings;
+  (search.waiting[i] || []).forEach(function (f) { f(); });
+  delete search.waiting[i];
+};
+
+function load(src) {
+  var script = document.createElement("script");
+  script.src = src;
+  document.head.appendChild(script);
+}
+
+function tokenize(text) {
+  var tokens = [];
+  var m;
+  text = text.normalize("NFKC").toLowerCase();
+  PATTERN.lastIndex = 0;
+  while ((m = PATTERN.exec(text)) !== null) {
+    var run = m[1];
+    if (run === undefined) {
+      tokens.push(m[0]);
+    } else if (run.length === 1) {
+      tokens.push(run);
+    } else {
+      for (var i = 0; i + 1 < run.length; i++) {
+        tokens.push(run.slice(i, i + 2));
+      }
+    }
+  }
+  return tokens;
+}
+
+function shardOf(token) {
+  var h = 0x811c9dc5;
+  for (var i = 0; i < token.length; i++) {
+    h = Math.imul(h ^ token.charCodeAt(i), 0x01000193) >>> 0;
+  }
+  return h % SHARDS;
+}
+
+function withShard(i, f) {
+  if (search.shards[i] !== undefined) {
+    f();
+  } else if (search.waiting[i] !== undefined) {
+    search.waiting[i].push(f);
+  } else {
+    search.waiting[i] = [f];
+    load("search/" + i + ".js");
+  }
+}
+
+// Pages having all tokens, by the number of times they occur
+function find(tokens) {
+  var scores = null;
+  tokens.forEach(function (token) {
+    var postings = search.shards[shardOf(token)][token] || [];
+    var next = {};
+    for (var i = 0; i < postings.length; i += 2) {
+      var doc = postings[i];
+      if (scores === null || doc in scores) {
+        next[doc] = (scores === null ? 0 : scores[doc]) + postings[i + 1];
+      }
+    }
+    scores = next;
+  });
+
+  return Object.keys(scores || {}).sort(function (a, b) {
+    return scores[b] - scores[a];
+  });
+}
+
+function show(docs) {
+  var results = document.getElementById("results");
+  results.textContent = "";
+  docs.slice(0, 100).forEach(function (doc) {
+    var a = document.createElement("a");
+    a.textContent = search.names[doc];
+    if (search.paths[doc] !== null) {
+      a.href = search.paths[doc].split("/").map(encodeURIComponent).join("/");
+    }
+    var li = document.createElement("li");
+    li.appendChild(a);
+    results.appendChild(li);
+  });
+  document.getElementById("status").textContent = docs.length + " pages";
+}
+
+function run() {
+  var tokens = tokenize(document.getElementById("query").value);
+  if (tokens.length === 0) {
+    show([]);
+    return;
+  }
+
+  var pending = tokens.length;
+  tokens.forEach(function (token) {
+    withShard(shardOf(token), function () {
+      pending -= 1;
+      if (pending === 0) {
+        show(find(tokens));
+      }
+    });
+  });
+}
+
+document.getElementById("form").onsubmit = function (e) {
+  e.preventDefault();
+  run();
+};
+
+load("search/docs.js");
+</script>
+</body>
+</html>
+"""
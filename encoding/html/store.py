@@ -0,0 +1,70 @@
+import tempfile
+from typing import IO
+
+
+class SpilledMarkdown:
+    """A reference to Markdown written to the spill file of a
+    `MarkdownStore`"""
+
+    __slots__ = ("offset", "length")
+
+    def __init__(self, offset: int, length: int):
+        self.offset = offset
+        self.length = length
+
+
+class MarkdownStore:
+    """Keeps the Markdown of pages until they are rendered. Once the Markdown
+    held in memory exceeds `max_memory` bytes, further pages are appended to a
+    temporary file instead."""
+
+    def __init__(self, max_memory: int | None = None):
+        self.max_memory = max_memory
+
+        self.memory = 0
+        self.spilled = 0
+        self.spilled_pages = 0
+
+        self.spill_file: IO[bytes] | None = None
+
+    def put(self, markdown: str) -> str | SpilledMarkdown:
+        size = len(markdown.encode())
+
+        if self.max_memory is None or self.memory + size <= self.max_memory:
+            self.memory += size
+            return markdown
+
+        return self.spill(markdown)
+
+    def spill(self, markdown: str) -> SpilledMarkdown:
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+
+        data = markdown.encode()
+
+        f = self.spill_file
+        offset = f.seek(0, 2)
+        f.write(data)
+
+        self.spilled += len(data)
+        self.spilled_pages += 1
+
+        return SpilledMarkdown(offset, len(data))
+
+    def get(self, markdown: str | SpilledMarkdown) -> str:
+        if isinstance(markdown, str):
+            return markdown
+
+        if self.spill_file is None:
+            raise RuntimeError("no Markdown has been spilled")
+
+        f = self.spill_file
+        f.seek(markdown.offset)
+        data = f.read(markdown.length)
+
+        return data.decode()
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
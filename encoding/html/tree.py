@@ -0,0 +1,130 @@
+import html
+import posixpath
+
+from encoding.html.page import INDEX_FILENAME, Page
+from pukiwiki.links import url_path
+
+SITEMAP_TITLE = "Sitemap"
+
+
+class Node:
+    """A component of page names, which is a page, a directory of pages, or
+    both"""
+
+    __slots__ = ("children", "page")
+
+    def __init__(self):
+        self.children: dict[str, Node] = {}
+        self.page: Page | None = None
+
+
+def node_path(name: str, node: Node) -> str:
+    """Pages with children are moved to `index` under their own directory,
+    as `encoding.html.cmd.page_file` expects"""
+    if node.children:
+        return posixpath.join(name, INDEX_FILENAME)
+    return name
+
+
+def children(name: str, node: Node) -> list[tuple[str, Node]]:
+    """Children of a node with their full names, in the order of the names"""
+    prefix = f"{name}/" if name else ""
+    return [
+        (prefix + part, node.children[part]) for part in sorted(node.children)
+    ]
+
+
+class Listing:
+    """A generated page listing pages, with the depth, title and path of each
+    of them. Entries without a path are directories with no page."""
+
+    def __init__(self, path: str, name: str, title: str):
+        self.path = path
+        self.name = name
+        self.title = title
+        self.entries: list[tuple[int, str, str | None]] = []
+
+    def markdown(self) -> str:
+        start = posixpath.dirname(self.path) or "."
+        lines = [f"# {html.escape(self.title)}", ""]
+
+        for depth, title, path in self.entries:
+            text = html.escape(title)
+            if path is not None:
+                url = url_path(posixpath.relpath(path, start))
+                text = f"[{text}]({url})"
+            lines.append(f"{'    ' * depth}- {text}")
+
+        return "\n".join(lines)
+
+
+class PageTree:
+    """Pages by the components of their names, built as pages arrive. Adding
+    a page walks its name once, and the layout of all pages is decided in
+    one traversal when they are written."""
+
+    def __init__(self):
+        self.root = Node()
+        self.count = 0
+
+    def add(self, page: Page):
+        node = self.root
+        for part in page.name.split("/"):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = Node()
+            node = child
+
+        if node.page is None:
+            self.count += 1
+        node.page = page
+
+    def __len__(self) -> int:
+        return self.count
+
+    def place(self) -> tuple[list[Page], list[Listing]]:
+        """Sets the path of each page, and returns the pages in the order of
+        their names with the listings to generate: an index of each directory
+        with no page of its own, and a sitemap of all pages at the top."""
+        pages: list[Page] = []
+        listings: list[Listing] = []
+
+        sitemap = None
+        if INDEX_FILENAME not in self.root.children:
+            sitemap = Listing(INDEX_FILENAME, "", SITEMAP_TITLE)
+
+        # Nodes to visit with their name and depth, the next one last
+        stack = [(name, node, 0) for name, node in children("", self.root)]
+        stack.reverse()
+        while stack:
+            name, node, depth = stack.pop()
+            path = node_path(name, node)
+            link: str | None = path
+
+            if node.page is not None:
+                node.page.path = path
+                pages.append(node.page)
+            elif INDEX_FILENAME not in node.children:
+                listing = Listing(path, name, name)
+                for child_name, child in children(name, node):
+                    child_path = node_path(child_name, child)
+                    title = posixpath.basename(child_name)
+                    listing.entries.append((0, title, child_path))
+                listings.append(listing)
+            else:
+                # Taken by a page named `index`
+                link = None
+
+            if sitemap is not None:
+                title = posixpath.basename(name)
+                sitemap.entries.append((depth, title, link))
+
+            stack.extend(
+                (child_name, child, depth + 1)
+                for child_name, child in reversed(children(name, node))
+            )
+
+        if sitemap is not None:
+            listings.append(sitemap)
+
+        return pages, listings
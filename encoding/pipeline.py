@@ -0,0 +1,236 @@
+import queue
+import threading
+import time
+import typing
+
+DEFAULT_QUEUE_SIZE = 64
+
+# Seconds between checks whether the other end of a queue stopped
+_POLL_SECONDS = 0.1
+
+T = typing.TypeVar("T")
+
+
+class _End:
+    """Put into a queue after the last item, with the error which ended the
+    producer if any"""
+
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class QueueStats:
+    """Depth of a queue between two stages, sampled on every put. A queue
+    which is mostly full means that its consumer is the bottleneck, and one
+    which is mostly empty that its producer is."""
+
+    def __init__(self, producer: str, consumer: str, maxsize: int):
+        self.producer = producer
+        self.consumer = consumer
+        self.maxsize = maxsize
+
+        self.items = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.full = 0
+
+        # Seconds each end was blocked on the other
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    def sample(self, depth: int):
+        self.items += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+        if depth >= self.maxsize:
+            self.full += 1
+
+    def mean_depth(self) -> float:
+        return self.depth_sum / self.items if self.items else 0.0
+
+    def json(self) -> dict:
+        return {
+            "producer": self.producer,
+            "consumer": self.consumer,
+            "maxsize": self.maxsize,
+            "items": self.items,
+            "mean_depth": self.mean_depth(),
+            "max_depth": self.max_depth,
+            "full_puts": self.full,
+            "producer_wait_seconds": self.put_wait,
+            "consumer_wait_seconds": self.get_wait,
+        }
+
+    def report(self) -> str:
+        full = self.full * 100 // self.items if self.items else 0
+        return (
+            f"Queue {self.producer} -> {self.consumer}:"
+            f" mean depth {self.mean_depth():.1f} / {self.maxsize},"
+            f" full on {full}% of {self.items} items,"
+            f" {self.producer} waited {self.put_wait:.1f}s,"
+            f" {self.consumer} waited {self.get_wait:.1f}s"
+        )
+
+
+class StageQueue:
+    """A bounded queue between two threads. Either end may stop it, which
+    makes the other end give up instead of blocking forever."""
+
+    def __init__(self, stats: QueueStats):
+        self.queue: queue.Queue = queue.Queue(stats.maxsize)
+        self.stats = stats
+        self.stopped = threading.Event()
+
+    def put(self, item) -> bool:
+        """Returns False if the queue was stopped before `item` fit in"""
+        if not isinstance(item, _End):
+            self.stats.sample(self.queue.qsize())
+
+        start = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stats.put_wait += time.perf_counter() - start
+
+    def get(self):
+        """Returns the next item, or an `_End` if the queue was stopped"""
+        start = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    return self.queue.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+            return _End()
+        finally:
+            self.stats.get_wait += time.perf_counter() - start
+
+    def stop(self):
+        self.stopped.set()
+
+
+class WriteBehind:
+    """Calls `write` on the items put into it in a thread of its own, so that
+    the caller goes on while they are written"""
+
+    def __init__(self, write: typing.Callable[[T], typing.Any], q: StageQueue):
+        self.write = write
+        self.queue = q
+        self.error: BaseException | None = None
+
+        self.thread = threading.Thread(
+            target=self.consume, name=q.stats.consumer, daemon=True
+        )
+        self.thread.start()
+
+    def __enter__(self) -> "WriteBehind":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def consume(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, _End):
+                return
+
+            try:
+                self.write(item)
+            except BaseException as e:
+                self.error = e
+                self.queue.stop()
+                return
+
+    def put(self, item):
+        if not self.queue.put(item):
+            raise self.error or RuntimeError("writer stopped")
+
+    def close(self):
+        """Waits until every item is written"""
+        self.queue.put(_End())
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        self.queue.stop()
+        self.thread.join()
+
+
+class Pipeline:
+    """Runs the stages of an export in threads connected by bounded queues,
+    so that reading the dump, converting pages and writing the output
+    overlap. A stage which is too slow fills the queue before it, which
+    blocks the stages before that instead of buffering the whole dump."""
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = max(queue_size, 1)
+        self.queues: list[QueueStats] = []
+
+    def stage_queue(self, producer: str, consumer: str) -> StageQueue:
+        stats = QueueStats(producer, consumer, self.queue_size)
+        self.queues.append(stats)
+        return StageQueue(stats)
+
+    def read_ahead(
+        self, items: typing.Iterable[T], producer: str, consumer: str
+    ) -> typing.Iterator[T]:
+        """Yields `items`, which are produced in a thread ahead of time. The
+        thread starts right away."""
+        q = self.stage_queue(producer, consumer)
+
+        def produce():
+            try:
+                for item in items:
+                    if not q.put(item):
+                        return
+            except BaseException as e:
+                q.put(_End(e))
+            else:
+                q.put(_End())
+
+        thread = threading.Thread(target=produce, name=producer, daemon=True)
+        thread.start()
+
+        return self.drain(q, thread)
+
+    def drain(
+        self, q: StageQueue, thread: threading.Thread
+    ) -> typing.Iterator:
+        try:
+            while True:
+                item = q.get()
+                if isinstance(item, _End):
+                    if item.error is not None:
+                        raise item.error
+                    return
+
+                yield item
+        finally:
+            q.stop()
+            thread.join()
+
+    def write_behind(
+        self,
+        write: typing.Callable[[T], typing.Any],
+        producer: str,
+        consumer: str,
+    ) -> WriteBehind:
+        return WriteBehind(write, self.stage_queue(producer, consumer))
+
+    def json(self) -> list[dict]:
+        return [stats.json() for stats in self.queues]
+
+    def report(self) -> str:
+        return "\n".join(stats.report() for stats in self.queues)
@@ -0,0 +1,243 @@
+import contextlib
+import heapq
+import json
+import sys
+import threading
+import time
+import typing
+
+import pukiwiki
+
+STAGE_READ = "read"
+STAGE_DECODE = "decode"
+STAGE_CONVERT = "convert"
+STAGE_JSON = "json"
+STAGE_ZIP = "zip"
+STAGE_RENDER = "render"
+STAGE_INDEX = "index"
+
+DEFAULT_TOP = 10
+
+T = typing.TypeVar("T")
+
+
+class StageStats:
+    __slots__ = ("wall", "cpu", "size", "count")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.size = 0
+        self.count = 0
+
+    def json(self) -> dict:
+        return {
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "bytes": self.size,
+            "count": self.count,
+            "bytes_per_second": self.size / self.wall if self.wall else None,
+        }
+
+
+class Profiler:
+    """Collects the time spent in each stage of an export and the slowest
+    pages to convert, to be saved as a JSON report.
+
+    CPU time is that of the whole process, so it includes other threads
+    running during a stage. Conversions in worker processes and pandoc are
+    accounted to the children in the report."""
+
+    def __init__(self, top: int = DEFAULT_TOP):
+        self.top = top
+        self.stages: dict[str, StageStats] = {}
+
+        # Min-heap of (seconds, order, name, source) of the slowest pages
+        self.pages: list[tuple[float, int, str, str | bytes]] = []
+
+        # Stages may run in threads of a pipeline
+        self.lock = threading.Lock()
+
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def stats(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    def add(self, name: str, wall: float, cpu: float, size: int = 0):
+        with self.lock:
+            stats = self.stats(name)
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.size += size
+            stats.count += 1
+
+    def count(self, name: str, size: int):
+        """Adds bytes known only after a stage ran to its stats"""
+        with self.lock:
+            self.stats(name).size += size
+
+    @contextlib.contextmanager
+    def stage(self, name: str, size: int = 0) -> typing.Iterator[None]:
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add(
+                name,
+                time.perf_counter() - wall,
+                time.process_time() - cpu,
+                size,
+            )
+
+    def iterate(self, name: str, it: typing.Iterable[T]) -> typing.Iterator[T]:
+        """Yields from `it`, accounting the time to get each item to `name`"""
+        it = iter(it)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.add(
+                    name, time.perf_counter() - wall, time.process_time() - cpu
+                )
+            yield item
+
+    def page(self, name: str, seconds: float, source: str | bytes):
+        """Records the time to convert a page, keeping the `top` slowest. The
+        source may be given raw, to be decoded only if it is kept."""
+        with self.lock:
+            entry = (seconds, len(self.pages), name, source)
+            if len(self.pages) < self.top:
+                heapq.heappush(self.pages, entry)
+            elif self.pages and seconds > self.pages[0][0]:
+                heapq.heapreplace(self.pages, entry)
+
+    def slowest_pages(self) -> list[dict]:
+        """The slowest pages, with the rule of the pipeline costing the most
+        on each. The rules are timed again on the page here, which tells what
+        is slow about the page with the single-pass engine as well."""
+        out = []
+
+        for seconds, _, name, source in sorted(self.pages, reverse=True):
+            if isinstance(source, bytes):
+                # Not `pukiwiki.decode`, which would count its errors again
+                source = source.decode(
+                    pukiwiki.get_encoding(), errors="backslashreplace"
+                )
+
+            rule, rule_seconds = costliest_rule(source)
+            out.append(
+                {
+                    "name": name,
+                    "seconds": seconds,
+                    "characters": len(source),
+                    "costliest_rule": rule,
+                    "rule_seconds": rule_seconds,
+                }
+            )
+
+        return out
+
+    def report(self, **info) -> dict:
+        return {
+            **info,
+            "wall_seconds": time.perf_counter() - self.start_wall,
+            "cpu_seconds": time.process_time() - self.start_cpu,
+            **rusage(),
+            "stages": {
+                name: stats.json() for name, stats in self.stages.items()
+            },
+            "slowest_pages": self.slowest_pages(),
+        }
+
+    def save(self, path: str, **info):
+        with open(path, "w") as f:
+            json.dump(self.report(**info), f, indent=2, ensure_ascii=False)
+
+
+def rusage() -> dict:
+    """The peak memory of the process and the CPU time and peak memory of its
+    children, which are left out where `resource` is missing, as on
+    Windows"""
+    try:
+        import resource
+    except ImportError:
+        return {}
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return {
+        "peak_rss_bytes": max_rss_bytes(own.ru_maxrss),
+        "children": {
+            "cpu_seconds": children.ru_utime + children.ru_stime,
+            "peak_rss_bytes": max_rss_bytes(children.ru_maxrss),
+        },
+    }
+
+
+def max_rss_bytes(maxrss: int) -> int:
+    # Linux reports kilobytes, and macOS bytes
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def costliest_rule(source: str) -> tuple[str, float]:
+    name, slowest = "", 0.0
+
+    s = source
+    for rule in pukiwiki.PIPELINE_RULES:
+        start = time.perf_counter()
+        s = rule(s)
+        seconds = time.perf_counter() - start
+
+        if seconds >= slowest:
+            name, slowest = rule.__name__, seconds
+
+    return name, slowest
+
+
+def stage(
+    profiler: Profiler | None, name: str, size: int = 0
+) -> typing.ContextManager[None]:
+    """`Profiler.stage`, or nothing without a profiler"""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name, size)
+
+
+def iterate(
+    profiler: Profiler | None, name: str, it: typing.Iterable[T]
+) -> typing.Iterable[T]:
+    if profiler is None:
+        return it
+    return profiler.iterate(name, it)
+
+
+def convert_page(
+    content: bytes,
+    engine: str = pukiwiki.DEFAULT_ENGINE,
+    profiler: Profiler | None = None,
+    name: str = "",
+) -> tuple[str, str | None]:
+    """`pukiwiki.convert_page` accounting its steps to `profiler`"""
+    if profiler is None:
+        return pukiwiki.convert_page(content, engine)
+
+    with profiler.stage(STAGE_DECODE, len(content)):
+        original = pukiwiki.decode(content)
+
+    start = time.perf_counter()
+    with profiler.stage(STAGE_CONVERT, len(content)):
+        body = pukiwiki.convert(original, engine)
+        date = pukiwiki.get_date(original)
+    profiler.page(name, time.perf_counter() - start, original)
+
+    return body, date
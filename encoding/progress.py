@@ -0,0 +1,96 @@
+import sys
+import time
+import typing
+
+from encoding.size import format_size
+
+# Seconds between updates of the progress line
+DEFAULT_INTERVAL = 0.5
+
+
+class Progress:
+    """Reports the progress of reading a dump on one line, at most every
+    `interval` seconds. Throughput and ETA are based on the bytes consumed
+    from `reader`, or the bytes of the pages when the dump is not read through
+    one. Skipped members are counted and summarized by `finish`.
+
+    Nothing but the summary is printed when `stream` is not a terminal."""
+
+    def __init__(
+        self,
+        reader=None,
+        interval: float = DEFAULT_INTERVAL,
+        stream: typing.TextIO = sys.stderr,
+    ):
+        self.reader = reader
+        self.interval = interval
+        self.stream = stream
+        self.tty = stream.isatty()
+
+        self.pages = 0
+        self.size = 0
+        self.skipped: dict[str, int] = {}
+
+        self.start = time.monotonic()
+        self.last = 0.0
+        self.shown = False
+
+    def update(self, size: int = 0):
+        self.pages += 1
+        self.size += size
+        self.show()
+
+    def skip(self, reason: str):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        self.show()
+
+    def consumed(self) -> tuple[int, int | None]:
+        if self.reader is not None:
+            return self.reader.consumed, self.reader.total
+        return self.size, None
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        consumed, total = self.consumed()
+        rate = consumed / elapsed
+
+        s = f"{self.pages} pages, {format_size(consumed)}"
+        if total:
+            percent = consumed * 100 // total
+            s += f" / {format_size(total)} ({percent}%)"
+        s += f", {format_size(rate)}/s"
+
+        if total and rate > 0:
+            eta = int((total - consumed) / rate)
+            s += f", ETA {eta // 60}:{eta % 60:02}"
+
+        return s
+
+    def show(self, force: bool = False):
+        if not self.tty:
+            return
+
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+
+        self.stream.write(f"\33[2K\r{self.line()}")
+        self.stream.flush()
+        self.shown = True
+
+    def finish(self):
+        self.show(force=True)
+        if self.shown:
+            self.stream.write("\n")
+
+        elapsed = time.monotonic() - self.start
+        summary = f"Read {self.pages} pages in {elapsed:.1f}s"
+
+        if self.skipped:
+            reasons = ", ".join(
+                f"{reason}: {n}" for reason, n in self.skipped.items()
+            )
+            summary += f", skipped {sum(self.skipped.values())} ({reasons})"
+
+        print(summary, file=self.stream)
@@ -0,0 +1,37 @@
+import math
+
+_UNITS = {
+    "": 1,
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+    "T": 1024**4,
+}
+
+
+def parse_size(text: str) -> int:
+    """Parses a size such as `1048576`, `512K`, `64M` or `2G` into bytes"""
+    s = text.strip().upper()
+    s = s.removesuffix("IB").removesuffix("B")
+
+    unit = s[-1:] if s[-1:] in _UNITS else ""
+    number = s[: len(s) - len(unit)]
+
+    try:
+        size = float(number) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(f"invalid size: {text!r}")
+
+    if not math.isfinite(size) or size < 0:
+        raise ValueError(f"invalid size: {text!r}")
+
+    return int(size)
+
+
+def format_size(size: int | float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} TiB"
@@ -21,6 +21,7 @@
             pandoc-py
             python310
             python310Packages.black
+            python310Packages.orjson
           ];
         };
       });
@@ -1,43 +1,298 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
 
+import pukiwiki
+from pukiwiki.charset import ENCODING_AUTO, ENCODINGS
+from encoding import cache, checkpoint, pipeline, profile
+from encoding.size import parse_size
 from encoding.growi import cmd as growi_cmd
 from encoding.html import cmd as html_cmd
 
 
+def dump_source(path: str):
+    if os.path.isdir(path):
+        try:
+            return pukiwiki.DataDirectory(path)
+        except RuntimeError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+    return argparse.FileType("rb")(path)
+
+
+def set_encoding_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--encoding",
+        dest="encoding",
+        choices=[ENCODING_AUTO] + ENCODINGS,
+        default=ENCODING_AUTO,
+        help="encoding of the page names and contents in the dump. 'auto'"
+        " detects it from the first pages, which needs a seekable dump, and"
+        f" falls back to '{pukiwiki.DEFAULT_ENCODING}'. Default to"
+        f" '{ENCODING_AUTO}'.",
+    )
+
+
+def set_common_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-e",
+        "--engine",
+        dest="engine",
+        choices=list(pukiwiki.ENGINES),
+        default=pukiwiki.DEFAULT_ENGINE,
+        help="engine to convert Pukiwiki notation into Markdown. Default to"
+        f" '{pukiwiki.DEFAULT_ENGINE}'.",
+    )
+
+    parser.add_argument(
+        "--page",
+        dest="pages",
+        metavar="NAME",
+        action="append",
+        default=None,
+        help="export only the page NAME, with its old versions and"
+        " attachments. It may be given several times. The pages are read"
+        " through the index beside the dump, which is built first if it is"
+        " missing or outdated.",
+    )
+
+    parser.add_argument(
+        "--cache",
+        dest="cache_dir",
+        metavar="DIR",
+        type=str,
+        default=None,
+        help="directory to cache converted pages in across runs. Disabled by"
+        " default.",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=parse_size,
+        default=cache.DEFAULT_MAX_SIZE,
+        help="maximum size of the cache, such as '512M'. The least recently"
+        " used pages are evicted beyond it. Default to 1G.",
+    )
+
+    parser.add_argument(
+        "--resolve-links",
+        dest="resolve_links",
+        action="store_true",
+        help="read the names of all pages in a first pass, and rewrite"
+        " internal links such as [[Page]] and [[alias>Page]] into links to"
+        " the exported pages. Unresolved targets are reported. The dump"
+        " cannot be read from stdin then.",
+    )
+
+    parser.add_argument(
+        "--attachments",
+        dest="attachments",
+        action="store_true",
+        help="also export the files attached to pages in attach/ of the dump,"
+        " storing identical files once, and rewrite &ref() into links to"
+        " them.",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="write a JSON report of the time, CPU and bytes of each stage,"
+        " the peak memory and the slowest pages to FILE.",
+    )
+
+    parser.add_argument(
+        "--profile-top",
+        dest="profile_top",
+        metavar="N",
+        type=int,
+        default=profile.DEFAULT_TOP,
+        help="number of the slowest pages in the --profile report. Default to"
+        f" {profile.DEFAULT_TOP}.",
+    )
+
+    parser.add_argument(
+        "--pipelined",
+        dest="pipelined",
+        action="store_true",
+        help="read the dump, convert pages and write the output in separate"
+        " threads connected by bounded queues, and report how full the"
+        " queues were.",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        dest="queue_size",
+        metavar="N",
+        type=int,
+        default=pipeline.DEFAULT_QUEUE_SIZE,
+        help="number of pages each queue of --pipelined holds. Default to"
+        f" {pipeline.DEFAULT_QUEUE_SIZE}.",
+    )
+
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint_dir",
+        metavar="DIR",
+        type=str,
+        default=None,
+        help="save the progress into DIR periodically, and resume from it"
+        " when run again with the same arguments. It is removed once the"
+        " export finishes. The dump has to be a file or a data directory.",
+    )
+
+    parser.add_argument(
+        "--checkpoint-interval",
+        dest="checkpoint_interval",
+        metavar="N",
+        type=int,
+        default=checkpoint.DEFAULT_INTERVAL,
+        help="number of pages between two checkpoints. Default to"
+        f" {checkpoint.DEFAULT_INTERVAL}.",
+    )
+
+
+def set_index_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--span",
+        dest="span",
+        metavar="SIZE",
+        type=parse_size,
+        default=pukiwiki.DEFAULT_SPAN,
+        help="bytes of the decompressed dump between two seek points of a"
+        " gzip dump, such as '4M'. Reading a page decompresses half of it on"
+        " average. Default to 1M.",
+    )
+
+    parser.set_defaults(func=build_index)
+
+
+def build_index(parsed_args: argparse.Namespace):
+    dump = parsed_args.pukiwiki_dump
+    index = pukiwiki.build_dump_index(dump, parsed_args.span)
+
+    print(index.report())
+    print(f"Index written to {pukiwiki.index_path(dump.name)}")
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Convert Pukiwiki formatted text data into Growi"
         "importable zipped file."
     )
 
+    encoding_parser = argparse.ArgumentParser(add_help=False)
+    set_encoding_args(encoding_parser)
+
+    common_parser = argparse.ArgumentParser(
+        add_help=False, parents=[encoding_parser]
+    )
+    set_common_args(common_parser)
+
     subparsers = parser.add_subparsers(required=True)
 
-    growi_subparser = subparsers.add_parser("growi")
+    growi_subparser = subparsers.add_parser("growi", parents=[common_parser])
     growi_cmd.set_args(growi_subparser)
 
-    html_subparser = subparsers.add_parser("html")
+    html_subparser = subparsers.add_parser("html", parents=[common_parser])
     html_cmd.set_args(html_subparser)
 
+    index_subparser = subparsers.add_parser("index", parents=[encoding_parser])
+    set_index_args(index_subparser)
+
     parser.add_argument(
         "pukiwiki_dump",
         metavar="DUMP_FILE",
-        type=argparse.FileType("rb"),
-        help="pukiwiki dump file (tar.gz)",
+        type=dump_source,
+        help="pukiwiki dump file (tar, tar.gz, tar.bz2 or tar.xz), '-' to"
+        " read it from stdin, or the data directory of a Pukiwiki server"
+        " containing wiki/",
     )
 
     parser.set_defaults(func=growi_cmd.main)
 
     parsed_args = parser.parse_args()
 
+    dump = parsed_args.pukiwiki_dump
+    if parsed_args.func is build_index or getattr(parsed_args, "pages", None):
+        if isinstance(dump, pukiwiki.DataDirectory) or not dump.seekable():
+            parser.error("only dump files can be indexed")
+        if getattr(parsed_args, "incremental", False):
+            parser.error("--page cannot be used with --incremental")
+
+    if parsed_args.func is build_index:
+        return parsed_args
+
+    if parsed_args.resolve_links and not isinstance(
+        dump, pukiwiki.DataDirectory
+    ):
+        if not dump.seekable():
+            parser.error("--resolve-links cannot read the dump from stdin")
+
+    if parsed_args.checkpoint_dir is not None:
+        check_checkpoint_args(parser, parsed_args)
+
     return parsed_args
 
 
+def check_checkpoint_args(
+    parser: argparse.ArgumentParser, parsed_args: argparse.Namespace
+):
+    """A resumed export has to read the pages in the same order, to give
+    them the same IDs"""
+    dump = parsed_args.pukiwiki_dump
+    if not isinstance(dump, pukiwiki.DataDirectory) and not dump.seekable():
+        parser.error("--checkpoint cannot read the dump from stdin")
+    if parsed_args.pipelined:
+        parser.error("--checkpoint cannot be used with --pipelined")
+    if getattr(parsed_args, "jobs", 1) > 1:
+        parser.error("--checkpoint cannot be used with -j")
+    if getattr(parsed_args, "incremental", False):
+        parser.error("--checkpoint cannot be used with --incremental")
+    if parsed_args.pages:
+        parser.error("--checkpoint cannot be used with --page")
+
+
+def set_encoding(parsed_args: argparse.Namespace) -> str:
+    encoding = parsed_args.encoding
+    if encoding == ENCODING_AUTO:
+        detected = pukiwiki.detect_dump_encoding(parsed_args.pukiwiki_dump)
+        if detected is None:
+            encoding = pukiwiki.DEFAULT_ENCODING
+            print(f"Cannot detect the encoding of stdin, reading {encoding}")
+        else:
+            encoding = detected
+            print(f"Detected encoding: {encoding}")
+
+    pukiwiki.set_encoding(encoding)
+    return encoding
+
+
+def open_pages(parsed_args: argparse.Namespace) -> pukiwiki.IndexedDump:
+    """The dump reading only the pages of --page, through its index"""
+    dump = parsed_args.pukiwiki_dump
+    index = pukiwiki.load_dump_index(dump)
+    if index is None:
+        index = pukiwiki.build_dump_index(dump)
+        print(index.report())
+
+    entries = pukiwiki.select_pages(index, parsed_args.pages)
+    return pukiwiki.IndexedDump(dump, index, entries)
+
+
 def main():
     args = parse_args()
+    encoding = set_encoding(args)
+    if getattr(args, "pages", None):
+        args.pukiwiki_dump = open_pages(args)
     args.func(args)
 
+    print(pukiwiki.decode_errors.report(encoding))
+
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,129 @@
+import csv
 import html
 import os
 import re
+import stat
 import tarfile
+import timeit
+import typing
 import urllib.parse
 
+from pukiwiki.attach import attachment_name, is_attachment
+from pukiwiki.charset import DecodeErrors, ENCODING_EUC_JP, detect_encoding
+from pukiwiki.datadir import DataDirectory, DataEntry
+from pukiwiki.dumpindex import (
+    DEFAULT_SPAN,
+    DumpIndex,
+    IndexEntry,
+    IndexedDump,
+    index_path,
+)
+
 _pat_author = re.compile(r'^#author\("(.*)","(.*)","(.*)"\)\n?')
+_pat_hash = re.compile(r" \[#[0-9a-z]+\]$")
+_pat_link = re.compile(r"(?<=\[\[)(.+?)(?=\]\])")
+_pat_bullet = re.compile(r"^(\s*)-([^ ])")
+_pat_bullet_eol = re.compile(r"\s*-")
+_pat_heading = re.compile(r"^(#+)([^ #])")
+_pat_hex = re.compile(r"(?:[0-9A-Fa-f]{2})*")
+_pat_table_row = re.compile(r"^\|(.*)\|([hHfFcC]?)$")
+_pat_cell_format = re.compile(
+    r"^(?:(LEFT|CENTER|RIGHT)|(?:BG)?COLOR\([^)]*\)|SIZE\([^)]*\)):"
+)
+_pat_br = re.compile(r"&br;?")
+_pat_block_ref = re.compile(r"^#ref\((.*)\)[ \t]*$")
 two_chars = re.compile("..?")
 
-DEFAULT_ENCODING = "euc_jp"
+DEFAULT_ENCODING = ENCODING_EUC_JP
+
+# Encoding of the dump being exported, set once per run with `set_encoding`
+_encoding = DEFAULT_ENCODING
+
+# Pages read so far which had undecodable bytes, in this process
+decode_errors = DecodeErrors()
+
+# Wiki pages read to detect the encoding of a dump, and the bytes of each
+SAMPLE_PAGES = 16
+SAMPLE_SIZE = 64 * 1024
+# Members looked at for them, as attachments may come first
+SAMPLE_MEMBERS = 1000
+
+# Bump this when the conversion rules change, to invalidate cached output
+CONVERTER_VERSION = "4"
+
+ENGINE_PIPELINE = "pipeline"
+ENGINE_SINGLE_PASS = "single-pass"
+ENGINE_BLOCKS = "blocks"
+DEFAULT_ENGINE = ENGINE_BLOCKS
+
+BLOCK_PARAGRAPH = "paragraph"
+BLOCK_HEADING = "heading"
+BLOCK_LIST = "list"
+BLOCK_PRE = "pre"
+BLOCK_FENCE = "fence"
+BLOCK_TABLE = "table"
+BLOCK_CSV_TABLE = "csv-table"
+
+_MARKDOWN_ALIGNMENTS = {
+    None: "---",
+    "LEFT": ":---",
+    "CENTER": ":---:",
+    "RIGHT": "---:",
+}
+
+
+# A dump is a tar file, a data directory of a PukiWiki server, or a tar file
+# read through its index. All are iterated for their members and read with
+# `extractfile`, and the last two read any member without reading the others.
+MemberDump = DataDirectory | IndexedDump
+Dump = tarfile.TarFile | MemberDump
+DumpMember = tarfile.TarInfo | DataEntry | IndexEntry
+
+
+class CountingReader:
+    """Wraps a binary file and counts the bytes read from it, so that progress
+    can be told from the position in a compressed or piped dump"""
+
+    def __init__(self, file: typing.IO[bytes]):
+        self.file = file
+        self.consumed = 0
+        self.total = file_size(file)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.consumed += len(data)
+        return data
+
+
+def file_size(file: typing.IO[bytes]) -> int | None:
+    """Returns the size of a regular file, or None for pipes and such"""
+    try:
+        st = os.fstat(file.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    if not stat.S_ISREG(st.st_mode):
+        return None
 
+    return st.st_size
 
-def open_tar(file):
-    tar = tarfile.TarFile(fileobj=file, encoding=DEFAULT_ENCODING)
+
+def open_tar(file: typing.IO[bytes] | CountingReader) -> tarfile.TarFile:
+    """Opens a dump as a stream, so that it is read exactly once and can come
+    from a pipe. Compression by gzip, bzip2 or xz is detected."""
+    tar = tarfile.open(fileobj=file, mode="r|*", encoding=_encoding)
     return tar
 
 
+def open_dump(
+    source: typing.IO[bytes] | CountingReader | MemberDump,
+) -> Dump:
+    if isinstance(source, MemberDump):
+        return source
+
+    return open_tar(source)
+
+
 def get_date(src) -> str | None:
     m = re.match(_pat_author, src)
 
@@ -51,12 +160,14 @@ def delete_toc(src):
 def convert_link(src: str):
     # Replace the alias notation
     replaced = src.replace(">", ":")
+    return _convert_link_notation(replaced)
+
+
+def _convert_link_notation(replaced: str):
     out = replaced
 
     # Start iteration from the tail of the string as the matching index will shift as we replace the substrings
-    for match in reversed(
-        list(re.finditer(r"(?<=\[\[)(.+)(?=\]\])", replaced))
-    ):
+    for match in reversed(list(_pat_link.finditer(replaced))):
         group = match.group()
         parts = group.split(":", maxsplit=1)
 
@@ -131,6 +242,14 @@ def convert_lsx(src):
     return s
 
 
+def convert_block_ref(src):
+    """Turns the block form of `ref` into the inline one, which
+    `pukiwiki.attach.RefResolver` rewrites"""
+    s = _sub(_pat_block_ref.pattern, r"&ref(\1);", src)
+
+    return s
+
+
 def convert_headings(src):
     """Because other notations also use `#`, this conversion must be run at the
     last"""
@@ -143,41 +262,33 @@ def convert_headings(src):
 
 
 def convert_codeblock(src: str):
-    lines = src.split("\n")
-
-    start, end = None, None
-    starts = []
-    ends = []
+    out = []
+    start = None
 
-    for i, line in enumerate(lines):
+    for line in src.split("\n"):
         # We find a code block
         if line.startswith(" "):
-            # trim space
-            lines[i] = line[1:]
-
-            # If the first line of code block
+            # Open it before its first line, and trim space
             if start is None:
-                start = i
-
-            # Continue reading code block
-            elif line.startswith(" ") and start is not None:
-                continue
+                start = len(out)
+                out.append("```")
+            out.append(line[1:])
 
         # End reading code block
-        elif not line.startswith(" ") and start is not None:
-            starts.append(start)
-            ends.append(i)
-            start, end = None, None
+        elif start is not None:
+            out.append("```")
+            start = None
+
+            out.append(line)
         else:
-            continue
+            out.append(line)
 
-    # Iterate from end of the list.
-    # Because we are inserting new elements and alder indeices will be destroyed.
-    for start, end in list(zip(starts, ends))[::-1]:
-        lines.insert(end, "```")
-        lines.insert(start, "```")
+    # A code block reaching the end of the text is never closed, and then it
+    # is not opened either.
+    if start is not None:
+        del out[start]
 
-    return "\n".join(lines)
+    return "\n".join(out)
 
 
 def sanitize_html(src):
@@ -185,35 +296,377 @@ def sanitize_html(src):
     return s
 
 
-def convert(src):
-    funcs = [
-        delete_author,
-        delete_hash,
-        delete_toc,
-        convert_link,
-        convert_bullets,
-        convert_br,
-        convert_pre,
-        convert_strike,
-        convert_strong,
-        convert_emphasis,
-        convert_lsx,
-        convert_headings,
-        convert_codeblock,
-        sanitize_html,
-    ]
-
+PIPELINE_RULES = [
+    delete_author,
+    delete_hash,
+    delete_toc,
+    convert_link,
+    convert_bullets,
+    convert_br,
+    convert_pre,
+    convert_strike,
+    convert_strong,
+    convert_emphasis,
+    convert_lsx,
+    convert_block_ref,
+    convert_headings,
+    convert_codeblock,
+    sanitize_html,
+]
+
+
+def convert_pipeline(src):
     s = src
-    for f in funcs:
+    for f in PIPELINE_RULES:
         s = f(s)
 
     return s
 
 
+def _convert_line(line: str, has_newline: bool) -> str:
+    """Apply every line-local rule of `convert_pipeline` to one line, in the
+    same order. `has_newline` tells whether the line is followed by a newline
+    in the source, as some patterns of the pipeline consume it."""
+    if line.endswith("]"):
+        line = _pat_hash.sub("", line)
+
+    if line.startswith("#contents"):
+        line = line[9:]
+
+    line = line.replace(">", ":")
+    if "[[" in line:
+        line = _convert_link_notation(line)
+
+    if line.startswith("---"):
+        line = "        -" + line[3:]
+    elif line.startswith("--"):
+        line = "    -" + line[2:]
+
+    if "-" in line:
+        replaced = _pat_bullet.sub(r"\1- \2", line)
+        if replaced != line:
+            line = replaced
+        elif has_newline and _pat_bullet_eol.fullmatch(line):
+            line = line + " "
+
+    line = line.replace("&br", "  ")
+
+    if line.startswith("#pre"):
+        line = "```" + line[4:].lstrip("{")
+    elif line.startswith("}"):
+        line = "```" + line.lstrip("}")
+
+    line = line.replace("%%", "~~")
+    line = line.replace("''", "**")
+    line = line.replace("'''", "*")
+
+    if line.startswith("#lsx"):
+        line = "$lsx()" + line[4:]
+
+    if line.startswith("#ref("):
+        line = _pat_block_ref.sub(r"&ref(\1);", line)
+
+    if line.startswith("***"):
+        line = "###" + line[3:]
+    elif line.startswith("**"):
+        line = "##" + line[2:]
+    elif line.startswith("*"):
+        line = "#" + line[1:]
+
+    if line.startswith("#"):
+        replaced = _pat_heading.sub(r"\1 \2", line)
+        if replaced != line:
+            line = replaced
+        elif has_newline and line.strip("#") == "":
+            line = line + " "
+
+    return line
+
+
+def _split_lines(src: str) -> list[str]:
+    """Splits a page into lines without its `#author` line, which the
+    pipeline deletes with the newline following it"""
+    lines = src.split("\n")
+
+    m = _pat_author.match(lines[0])
+    if m is not None:
+        if m.end() == len(lines[0]) and len(lines) > 1:
+            del lines[0]
+        else:
+            lines[0] = lines[0][m.end() :]
+
+    return lines
+
+
+def convert_single_pass(src: str) -> str:
+    """Produce the same output as `convert_pipeline` in a single pass over the
+    lines of `src`, keeping the code block state while walking them."""
+    lines = _split_lines(src)
+
+    out = []
+    last = len(lines) - 1
+    block_start = None
+
+    for i, line in enumerate(lines):
+        line = _convert_line(line, i < last)
+
+        if line.startswith(" "):
+            line = line[1:]
+            if block_start is None:
+                block_start = len(out)
+                out.append("```")
+        elif block_start is not None:
+            out.append("```")
+            block_start = None
+
+        out.append(html.escape(line))
+
+    # A code block reaching the end of the text is never closed, and then it
+    # is not opened either.
+    if block_start is not None:
+        del out[block_start]
+
+    return "\n".join(out)
+
+
+class Block:
+    """Consecutive lines of a page forming a block of one kind. Lines are
+    converted by `_convert_line` already, except the raw rows of tables."""
+
+    __slots__ = ("kind", "lines", "columns")
+
+    def __init__(self, kind: str, columns: int = 0):
+        self.kind = kind
+        self.lines: list[str] = []
+        self.columns = columns
+
+
+def _line_kind(line: str) -> str:
+    if line.startswith("```"):
+        return BLOCK_FENCE
+    if line.startswith(" "):
+        return BLOCK_PRE
+    if line.startswith("#"):
+        return BLOCK_HEADING
+    if line.startswith("-"):
+        return BLOCK_LIST
+    return BLOCK_PARAGRAPH
+
+
+def _table_row(line: str) -> tuple[str, int] | None:
+    """Returns the kind of table and the number of cells of a row"""
+    if line.startswith("|"):
+        m = _pat_table_row.match(line)
+        if m is not None:
+            return BLOCK_TABLE, m.group(1).count("|") + 1
+    elif line.startswith(","):
+        return BLOCK_CSV_TABLE, 0
+
+    return None
+
+
+def parse_blocks(src: str) -> list[Block]:
+    """Groups the lines of a page into blocks in one pass. Tables are kept
+    apart from other lines, which get the line rules of `convert_single_pass`
+    so that the blocks read the same as its output."""
+    lines = _split_lines(src)
+
+    blocks: list[Block] = []
+    block = None
+    last = len(lines) - 1
+    fenced = False
+
+    for i, line in enumerate(lines):
+        row = None if fenced else _table_row(line)
+
+        if row is not None:
+            kind, columns = row
+            if block is None or block.kind != kind or block.columns != columns:
+                block = Block(kind, columns)
+                blocks.append(block)
+
+            block.lines.append(line)
+            continue
+
+        line = _convert_line(line, i < last)
+        kind = _line_kind(line)
+
+        # Rows of a code block are not a table
+        if kind == BLOCK_FENCE:
+            fenced = not fenced
+
+        # Headings stand alone
+        if block is None or block.kind != kind or kind == BLOCK_HEADING:
+            block = Block(kind)
+            blocks.append(block)
+
+        block.lines.append(line)
+
+    return blocks
+
+
+def _convert_cell(text: str) -> tuple[str, str | None]:
+    """Returns the Markdown of a table cell and its alignment"""
+    align = None
+    while (m := _pat_cell_format.match(text)) is not None:
+        align = m.group(1) or align
+        text = text[m.end() :]
+
+    # Cells merged into their neighbours, which Markdown cannot express
+    if text in ("~", ">", "=="):
+        return "", align
+
+    text = text.removeprefix("~").strip()
+    if "[[" in text:
+        # Only the aliases of links, unlike `convert_link`
+        text = _pat_link.sub(lambda m: m.group().replace(">", ":"), text)
+        text = _convert_link_notation(text)
+
+    text = text.replace("%%", "~~")
+    text = text.replace("'''", "*")
+    text = text.replace("''", "**")
+
+    # A line break is the only HTML which may stay in a cell
+    parts = [html.escape(part) for part in _pat_br.split(text)]
+    return "<br>".join(parts), align
+
+
+def _table_markdown(block: Block) -> list[str]:
+    header = None
+    rows = []
+    footers = []
+    aligns: list[str | None] = []
+
+    for line in block.lines:
+        if block.kind == BLOCK_CSV_TABLE:
+            cells = next(csv.reader([line[1:]], skipinitialspace=True))
+            kind = ""
+        else:
+            m = _pat_table_row.match(line)
+            if m is None:
+                continue
+            cells = m.group(1).split("|")
+            kind = m.group(2).lower()
+
+        converted = [_convert_cell(cell) for cell in cells]
+
+        if len(aligns) < len(converted):
+            aligns += [None] * (len(converted) - len(aligns))
+        for i, (_, align) in enumerate(converted):
+            if align is not None and (kind == "c" or aligns[i] is None):
+                aligns[i] = align
+
+        # Format rows only set the alignment of the columns
+        if kind == "c":
+            continue
+
+        texts = [text for text, _ in converted]
+        if kind == "h" and header is None:
+            header = texts
+        elif kind == "f":
+            footers.append(texts)
+        else:
+            rows.append(texts)
+
+    columns = len(aligns)
+    if columns == 0:
+        return []
+
+    def markdown_row(cells: list[str]) -> str:
+        cells = cells + [""] * (columns - len(cells))
+        return "| " + " | ".join(cells) + " |"
+
+    # Markdown tables need a header, which may be empty
+    out = [markdown_row(header or [])]
+    out.append("|" + "|".join(_MARKDOWN_ALIGNMENTS[a] for a in aligns) + "|")
+    out += [markdown_row(cells) for cells in rows + footers]
+    return out
+
+
+def render_blocks(blocks: list[Block]) -> str:
+    out: list[str] = []
+    last = len(blocks) - 1
+
+    for i, block in enumerate(blocks):
+        if block.kind in (BLOCK_TABLE, BLOCK_CSV_TABLE):
+            table = _table_markdown(block)
+
+            # Separate tables from the text around them
+            if out and out[-1] != "":
+                out.append("")
+            out += table
+            if i < last:
+                out.append("")
+
+        elif block.kind == BLOCK_PRE:
+            # A code block reaching the end of the text is never closed, and
+            # then it is not opened either, as in `convert_single_pass`.
+            closed = i < last
+
+            if closed:
+                out.append("```")
+            out += [html.escape(line[1:]) for line in block.lines]
+            if closed:
+                out.append("```")
+
+        else:
+            out += [html.escape(line) for line in block.lines]
+
+    return "\n".join(out)
+
+
+def convert_blocks(src: str) -> str:
+    """`convert_single_pass` through a block structure, which adds tables.
+    Pages without tables are converted the same."""
+    return render_blocks(parse_blocks(src))
+
+
+ENGINES = {
+    ENGINE_PIPELINE: convert_pipeline,
+    ENGINE_SINGLE_PASS: convert_single_pass,
+    ENGINE_BLOCKS: convert_blocks,
+}
+
+
+def convert(src, engine: str = DEFAULT_ENGINE):
+    f = ENGINES[engine]
+    return f(src)
+
+
+def set_encoding(encoding: str):
+    """Sets the encoding of page names and contents for the whole run. Worker
+    processes have to set it as well."""
+    global _encoding
+    _encoding = encoding
+
+
+def get_encoding() -> str:
+    return _encoding
+
+
 def decode(
-    content: bytes, encoding=DEFAULT_ENCODING, errors="backslashreplace"
+    content: bytes, encoding: str | None = None, errors="backslashreplace"
 ) -> str:
-    return content.decode(encoding, errors=errors)
+    """Decodes a page in the encoding of the dump, unless `encoding` is given.
+    Pages are decoded strictly first, and those with undecodable bytes are
+    counted in `decode_errors` and decoded again with `errors`."""
+    encoding = encoding or _encoding
+    try:
+        return content.decode(encoding)
+    except UnicodeDecodeError:
+        decode_errors.add()
+        return content.decode(encoding, errors=errors)
+
+
+def convert_page(
+    content: bytes, engine: str = DEFAULT_ENGINE
+) -> tuple[str, str | None]:
+    """Returns the converted body and the date of a raw page"""
+    original = decode(content)
+    body = convert(original, engine)
+    date = get_date(original)
+
+    return body, date
 
 
 def to_url_encode(s: str) -> str:
@@ -224,15 +677,75 @@ def to_url_encode(s: str) -> str:
 
 
 def decode_path(path: str) -> str:
+    # Names in dumps are hex encoded, so decode them directly. Anything else
+    # goes the way of URL decoding, which keeps invalid sequences as is.
+    if _pat_hex.fullmatch(path):
+        raw = bytes.fromhex(path)
+        return raw.decode(_encoding, errors="replace")
+
     url_encoded = to_url_encode(path)
-    decoded = urllib.parse.unquote(url_encoded, encoding=DEFAULT_ENCODING)
+    decoded = urllib.parse.unquote(url_encoded, encoding=_encoding)
     return decoded
 
 
-def normalize_path(path: str, prefix: str = "") -> str:
+def page_name(path: str) -> str:
+    """Returns the decoded page name of a member path such as
+    `wiki/466F6F.txt`"""
     path = os.path.basename(path)
     path, _ = os.path.splitext(path)
-    path = decode_path(path)
+    name = decode_path(path)
+    return name
+
+
+class NameIndex:
+    """Decoded names of the members of a dump, computed once per run.
+
+    `name` memoizes the decoding of member paths, and wiki pages accepted by
+    `is_wiki_page` are indexed by their name, so that other stages can look
+    them up in O(1)."""
+
+    def __init__(self):
+        self.names: dict[str, str] = {}
+        self.pages: dict[str, str] = {}
+        self.parents: set[str] = set()
+
+    def name(self, path: str) -> str:
+        name = self.names.get(path)
+        if name is None:
+            name = page_name(path)
+            self.names[path] = name
+        return name
+
+    def add(self, path: str):
+        name = self.name(path)
+        self.pages[name] = path
+
+        parent = os.path.dirname(name)
+        while parent != "" and parent not in self.parents:
+            self.parents.add(parent)
+            parent = os.path.dirname(parent)
+
+    def lookup(self, name: str) -> str | None:
+        """Returns the member path of a wiki page"""
+        return self.pages.get(name)
+
+    def has_children(self, name: str) -> bool:
+        return name in self.parents
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.pages
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+
+def normalize_path(
+    path: str, prefix: str = "", index: NameIndex | None = None
+) -> str:
+    if index is not None:
+        path = index.name(path)
+    else:
+        path = page_name(path)
 
     if prefix != "":
         path = os.path.join(prefix, path)
@@ -240,16 +753,154 @@ def normalize_path(path: str, prefix: str = "") -> str:
     return path
 
 
-def is_wiki_page(tarinfo: tarfile.TarInfo) -> bool:
+def is_wiki_page(tarinfo: DumpMember, index: NameIndex | None = None) -> bool:
+    """With `index`, accepted pages are added to it"""
     is_wiki_prefix = tarinfo.path.startswith(
         "wiki/"
     ) or tarinfo.path.startswith("/wiki/")
 
-    path = normalize_path(tarinfo.path)
+    if not is_wiki_prefix:
+        return False
+
+    path = normalize_path(tarinfo.path, index=index)
     name = os.path.split(path)[-1]
     is_special_page = name.startswith(":")
 
-    return is_wiki_prefix and not is_special_page
+    if is_special_page:
+        return False
+
+    if index is not None:
+        index.add(tarinfo.path)
+
+    return True
+
+
+def scan_names(
+    source: typing.IO[bytes] | MemberDump, index: NameIndex | None = None
+) -> NameIndex:
+    """Indexes the names of all wiki pages in a first pass over a dump.
+
+    Only the headers of an uncompressed tar are read, skipping over the page
+    contents. The file is rewound afterwards, so it has to be seekable."""
+    if index is None:
+        index = NameIndex()
+
+    if isinstance(source, MemberDump):
+        entries: typing.Iterable[DumpMember] = source
+        if isinstance(source, IndexedDump):
+            # All pages of the dump, not only the ones it reads
+            entries = source.index.entries
+        for entry in entries:
+            is_wiki_page(entry, index)
+        return index
+
+    if not source.seekable():
+        raise RuntimeError("the dump has to be a seekable file")
+
+    start = source.tell()
+    try:
+        with tarfile.open(
+            fileobj=source, mode="r:*", encoding=_encoding
+        ) as tar:
+            for tarinfo in tar:
+                if tarinfo.isfile():
+                    is_wiki_page(tarinfo, index)
+    finally:
+        source.seek(start)
+
+    return index
+
+
+def sample_pages(
+    source: typing.IO[bytes] | DataDirectory,
+) -> typing.Iterator[bytes]:
+    """Yields the raw names and the beginning of the contents of the first
+    wiki pages of a dump, without decoding them"""
+    if isinstance(source, DataDirectory):
+        members: typing.Iterable[DumpMember] = source
+        dump: Dump = source
+    else:
+        dump = tarfile.open(fileobj=source, mode="r:*")
+        members = dump
+
+    pages = 0
+    for i, member in enumerate(members):
+        if pages >= SAMPLE_PAGES or i >= SAMPLE_MEMBERS:
+            break
+
+        path = member.path.removeprefix("/")
+        stem, _ = os.path.splitext(os.path.basename(path))
+        if not path.startswith("wiki/") or not _pat_hex.fullmatch(stem):
+            continue
+
+        f = dump.extractfile(member)
+        if f is None:
+            continue
+
+        pages += 1
+        yield bytes.fromhex(stem)
+        yield f.read(SAMPLE_SIZE)
+
+
+def detect_dump_encoding(
+    source: typing.IO[bytes] | DataDirectory,
+) -> str | None:
+    """Detects the encoding of a dump from its first pages. The file is
+    rewound afterwards, so None is returned if it is not seekable."""
+    if isinstance(source, DataDirectory):
+        return detect_encoding(sample_pages(source), DEFAULT_ENCODING)
+
+    if not source.seekable():
+        return None
+
+    start = source.tell()
+    try:
+        return detect_encoding(sample_pages(source), DEFAULT_ENCODING)
+    finally:
+        source.seek(start)
+
+
+def load_dump_index(file: typing.IO[bytes]) -> DumpIndex | None:
+    """The index saved beside a dump file, unless it is missing or outdated"""
+    return DumpIndex.load(index_path(file.name), file, _encoding)
+
+
+def build_dump_index(
+    file: typing.IO[bytes], span: int = DEFAULT_SPAN
+) -> DumpIndex:
+    """Indexes a dump file with the names in the encoding of the dump, and
+    saves the index beside it. The file is rewound afterwards."""
+    start = file.tell()
+    try:
+        index = DumpIndex.build(file, _encoding, span)
+    finally:
+        file.seek(start)
+
+    index.save(index_path(file.name))
+    return index
+
+
+def member_page(member: DumpMember) -> str:
+    """The name of the page a wiki page, backup or attachment is of"""
+    if is_attachment(member):
+        return attachment_name(member.path, decode_path)[0]
+    return page_name(member.path)
+
+
+def select_pages(
+    index: DumpIndex, names: typing.Iterable[str]
+) -> list[IndexEntry]:
+    """The members of the given pages in an indexed dump, which are their
+    wiki page, backup and attachments"""
+    names = set(names)
+    entries = [entry for entry in index.entries if member_page(entry) in names]
+
+    found = {page_name(e.path) for e in entries if is_wiki_page(e)}
+    missing = names - found
+    if missing:
+        raise RuntimeError(f"no such pages in the dump: {sorted(missing)}")
+
+    return entries
 
 
 def _run_convert_test():
@@ -348,6 +999,80 @@ def _run_date_test():
         print("=== end ===")
 
 
+_ENGINE_TEST_TEXT = r"""#author("2018-11-08T16:04:27+09:00","","")
+*Heading [#a1b2c3]
+#contents
+-item with [[alias>https://example.com/]] and [[Internal]]
+--''strong'' and %%strike%%&br
+---deep
+ indented code <tag>
+ & more
+#pre{{
+code
+}}
+#lsx
+**
+-
+"""
+
+
+def _run_engine_test():
+    want = convert_pipeline(_ENGINE_TEST_TEXT)
+
+    for name, f in ENGINES.items():
+        got = f(_ENGINE_TEST_TEXT)
+        if want == got:
+            print("ok")
+        else:
+            print("failed", name)
+            print("=== want ===")
+            print(want)
+            print("=== got ===")
+            print(got)
+            print("=== end ===")
+
+
+def _run_table_test():
+    text = """|~Name|~Value|h
+|LEFT:|RIGHT:|c
+|''a''|[[b>https://example.com/]]|
+|c|>|
+,x,"y, z"
+"""
+    want = """| Name | Value |
+|:---|---:|
+| **a** | [b](https://example.com/) |
+| c |  |
+
+|  |  |
+|---|---|
+| x | y, z |
+
+"""
+
+    got = convert_blocks(text)
+    if want == got:
+        print("ok")
+    else:
+        print("failed")
+        print("=== want ===")
+        print(want)
+        print("=== got ===")
+        print(got)
+        print("=== end ===")
+
+
+def _run_engine_benchmark(repeat: int = 1000, number: int = 5):
+    src = _ENGINE_TEST_TEXT + _ENGINE_TEST_TEXT.split("\n", 1)[1] * repeat
+
+    for name, f in ENGINES.items():
+        t = timeit.timeit(lambda: f(src), number=number) / number
+        print(f"{name:12} {len(src) / t / 1024 / 1024:8.2f} MiB/s")
+
+
 if __name__ == "__main__":
     _run_convert_test()
     _run_date_test()
+    _run_engine_test()
+    _run_table_test()
+    _run_engine_benchmark()
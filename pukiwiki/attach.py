@@ -0,0 +1,138 @@
+import html
+import os
+import posixpath
+import re
+from typing import Callable
+
+from pukiwiki.links import url_path
+
+ATTACH_DIR = "attach"
+
+# `convert` escapes the `&` of `&ref(...);`
+_pat_ref = re.compile(r"&amp;ref\((.*?)\);")
+
+_pat_size = re.compile(r"\d+x\d+|\d+%")
+
+# Options of the ref plugin, which are not a page name or a title
+_REF_OPTIONS = {
+    "left",
+    "center",
+    "right",
+    "wrap",
+    "nowrap",
+    "around",
+    "noicon",
+    "nolink",
+    "noimg",
+    "zoom",
+}
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".svg", ".webp"}
+
+
+def is_attachment(member) -> bool:
+    """Attachments are stored as `attach/<page>_<file>` with both names hex
+    encoded. Old versions and download counters have a suffix."""
+    path = member.path.removeprefix("/")
+    if not path.startswith(f"{ATTACH_DIR}/"):
+        return False
+
+    base = posixpath.basename(path)
+    return "_" in base and "." not in base
+
+
+def attachment_name(
+    path: str, decode: Callable[[str], str]
+) -> tuple[str, str]:
+    """Returns the page and file name of an attachment, given the function
+    decoding hex encoded names"""
+    page, file = posixpath.basename(path).split("_", 1)
+    return decode(page), decode(file)
+
+
+def is_image(file: str) -> bool:
+    _, ext = os.path.splitext(file)
+    return ext.lower() in IMAGE_SUFFIXES
+
+
+def is_ref_option(arg: str) -> bool:
+    return arg.lower() in _REF_OPTIONS or _pat_size.fullmatch(arg) is not None
+
+
+class RefResolver:
+    """Rewrites the `&ref(file);` references to attachments, which `convert`
+    leaves in its output, into Markdown images or links.
+
+    `url` returns the destination of an attachment, given the path of the
+    referencing page and the page and file name of the attachment, or None if
+    there is no such attachment. A page name in the second argument is only
+    told from a title when it is in `names`."""
+
+    def __init__(self, names, url: Callable[[str, str, str], str | None]):
+        self.names = names
+        self.url = url
+
+        self.resolved = 0
+        self.unresolved: dict[str, int] = {}
+
+    def resolve(
+        self, name: str, markdown: str, path: str | None = None
+    ) -> str:
+        """`path` is the path of the page in the output, if it is not its
+        name"""
+        if "&amp;ref(" not in markdown:
+            return markdown
+
+        def replace(m: re.Match) -> str:
+            return self.replace(name, path or name, m.group(1)) or m.group(0)
+
+        return _pat_ref.sub(replace, markdown)
+
+    def replace(self, name: str, path: str, text: str) -> str | None:
+        args = [arg.strip() for arg in html.unescape(text).split(",")]
+        page, file, title = self.parse(name, args)
+
+        if "://" in file:
+            return f"![{title or file}]({file})"
+
+        url = self.url(path, page, file)
+        if url is None:
+            key = posixpath.join(page, file)
+            self.unresolved[key] = self.unresolved.get(key, 0) + 1
+            return None
+
+        self.resolved += 1
+
+        url = url_path(url)
+        if is_image(file):
+            return f"![{title or file}]({url})"
+        return f"[{title or file}]({url})"
+
+    def parse(self, name: str, args: list[str]) -> tuple[str, str, str]:
+        """Returns the page, file name and title of the arguments of a ref"""
+        first, rest = args[0], args[1:]
+
+        page = name
+        file = first
+        if "://" not in first and "/" in first:
+            page, file = first.rsplit("/", 1)
+            if page.startswith("./") or page.startswith("../"):
+                page = posixpath.normpath(posixpath.join(name, page))
+        elif rest and rest[0] in self.names:
+            page = rest.pop(0)
+
+        title = ",".join(arg for arg in rest if not is_ref_option(arg))
+        return page, file, title
+
+    def report(self, limit: int = 10) -> str:
+        unresolved = sum(self.unresolved.values())
+        s = f"Refs: {self.resolved} resolved, {unresolved} unresolved"
+
+        if unresolved > 0:
+            targets = sorted(
+                self.unresolved.items(), key=lambda t: t[1], reverse=True
+            )
+            top = ", ".join(f"{t} ({n})" for t, n in targets[:limit])
+            s += f"\nUnresolved attachments: {top}"
+
+        return s
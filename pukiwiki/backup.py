@@ -0,0 +1,61 @@
+import gzip
+import os
+import re
+import typing
+from typing import Iterator
+
+BACKUP_DIR = "backup"
+
+# Backups are gzipped, or plain text when PukiWiki runs without zlib
+BACKUP_SUFFIXES = (".gz", ".txt")
+
+# Each version starts with this line, holding the time the version was
+# written and, since PukiWiki 1.5, the time it was backed up
+_pat_splitter = re.compile(rb"^>{10} (\d+)(?: \d+)?\s*$")
+
+
+def is_backup(member) -> bool:
+    path = member.path.removeprefix("/")
+    if not path.startswith(f"{BACKUP_DIR}/"):
+        return False
+
+    _, ext = os.path.splitext(path)
+    return ext in BACKUP_SUFFIXES
+
+
+def split_versions(
+    lines: typing.Iterable[bytes],
+) -> Iterator[tuple[int, bytes]]:
+    """Splits the lines of a backup into its versions, oldest first, as pairs
+    of the Unix time and the raw content of a version. Only one version is
+    held at a time."""
+    time = None
+    version: list[bytes] = []
+
+    for line in lines:
+        m = _pat_splitter.match(line) if line.startswith(b">") else None
+        if m is None:
+            if time is not None:
+                version.append(line)
+            continue
+
+        if time is not None:
+            yield time, b"".join(version)
+
+        time = int(m.group(1))
+        version = []
+
+    if time is not None:
+        yield time, b"".join(version)
+
+
+def read_versions(
+    path: str, file: typing.IO[bytes]
+) -> Iterator[tuple[int, bytes]]:
+    """Yields the versions of a backup file, decompressing it as a stream"""
+    if path.endswith(".gz"):
+        file = gzip.GzipFile(fileobj=file, mode="rb")
+
+    # Files of a data directory are memory mapped, which only reads lines
+    # through `readline`
+    yield from split_versions(iter(file.readline, b""))
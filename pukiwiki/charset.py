@@ -0,0 +1,45 @@
+from typing import Iterable
+
+# PukiWiki writes pages in EUC-JP, and in UTF-8 with its UTF-8 builds
+ENCODING_EUC_JP = "euc_jp"
+ENCODING_UTF8 = "utf-8"
+ENCODINGS = [ENCODING_EUC_JP, ENCODING_UTF8]
+
+ENCODING_AUTO = "auto"
+
+
+def detect_encoding(
+    samples: Iterable[bytes], default: str = ENCODING_EUC_JP
+) -> str:
+    """Tells the encoding of a dump from raw page names and contents. Text in
+    EUC-JP is almost never valid UTF-8, so the samples are UTF-8 if all of
+    them are. Samples in ASCII tell nothing, and give `default`."""
+    non_ascii = False
+
+    for sample in samples:
+        if sample.isascii():
+            continue
+        non_ascii = True
+
+        try:
+            sample.decode(ENCODING_UTF8)
+        except UnicodeDecodeError:
+            return ENCODING_EUC_JP
+
+    return ENCODING_UTF8 if non_ascii else default
+
+
+class DecodeErrors:
+    """Counts the pages having bytes which are not valid in the encoding of
+    the dump. Such bytes are kept as escapes such as `\\xff`."""
+
+    def __init__(self):
+        self.pages = 0
+
+    def add(self, pages: int = 1):
+        self.pages += pages
+
+    def report(self, encoding: str) -> str:
+        return (
+            f"Encoding: {encoding}, {self.pages} pages with undecodable bytes"
+        )
@@ -0,0 +1,71 @@
+import io
+import mmap
+import os
+from typing import Iterator
+
+# Directories which `index.php?cmd=dump` puts into a dump
+DUMP_DIRS = ["wiki", "attach", "backup"]
+
+_WIKI_DIR = "wiki"
+
+
+class DataEntry:
+    """A file in a PukiWiki data directory. It has the attributes of
+    `tarfile.TarInfo` which the exporters use, and its path is relative to the
+    data directory like in a dump."""
+
+    __slots__ = ("path", "name", "fullpath", "size")
+
+    def __init__(self, path: str, fullpath: str, size: int):
+        self.path = path
+        self.name = path
+        self.fullpath = fullpath
+        self.size = size
+
+    def isfile(self) -> bool:
+        return True
+
+
+class DataDirectory:
+    """Reads pages directly from the data directory of a PukiWiki server, as
+    an alternative to a tar dump. Either the directory containing `wiki/` or
+    `wiki/` itself may be given."""
+
+    def __init__(self, path: str):
+        path = os.path.abspath(path)
+
+        if not os.path.isdir(os.path.join(path, _WIKI_DIR)):
+            if os.path.basename(path) == _WIKI_DIR:
+                path = os.path.dirname(path)
+            else:
+                raise RuntimeError(f"no {_WIKI_DIR}/ directory in {path}")
+
+        self.root = path
+
+    def __iter__(self) -> Iterator[DataEntry]:
+        for d in DUMP_DIRS:
+            if os.path.isdir(os.path.join(self.root, d)):
+                yield from self.scan(d)
+
+    def scan(self, relative: str) -> Iterator[DataEntry]:
+        with os.scandir(os.path.join(self.root, relative)) as it:
+            # Sort for an output independent of the file system order
+            entries = sorted(it, key=lambda e: e.name)
+
+        for entry in entries:
+            path = f"{relative}/{entry.name}"
+
+            if entry.is_dir(follow_symlinks=False):
+                yield from self.scan(path)
+            elif entry.is_file():
+                size = entry.stat().st_size
+                yield DataEntry(path, entry.path, size)
+
+    def extractfile(self, member: DataEntry) -> mmap.mmap | io.BytesIO:
+        """Returns the content of a file mapped into memory"""
+        with open(member.fullpath, "rb") as f:
+            # Empty files cannot be mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
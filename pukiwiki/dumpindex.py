@@ -0,0 +1,238 @@
+import base64
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import tarfile
+import typing
+import zlib
+from typing import Iterable, Iterator
+
+from pukiwiki.zran import GzipIndexer, SeekPoint, load_libz, read_at
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index"
+
+# Bytes of the decompressed dump between two seek points. Reading a member
+# decompresses half of it on average.
+DEFAULT_SPAN = 1024 * 1024
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_BZIP2 = "bzip2"
+COMPRESSION_XZ = "xz"
+
+_MAGICS = {
+    b"\x1f\x8b": COMPRESSION_GZIP,
+    b"BZh": COMPRESSION_BZIP2,
+    b"\xfd7zXZ\x00": COMPRESSION_XZ,
+}
+
+_DECOMPRESSORS: dict[str, typing.Callable[[typing.IO[bytes]], typing.Any]] = {
+    COMPRESSION_GZIP: lambda f: gzip.GzipFile(fileobj=f),
+    COMPRESSION_BZIP2: bz2.BZ2File,
+    COMPRESSION_XZ: lzma.LZMAFile,
+}
+
+
+def detect_compression(file: typing.IO[bytes]) -> str | None:
+    """Tells the compression of a seekable dump from its first bytes"""
+    start = file.tell()
+    head = file.read(6)
+    file.seek(start)
+
+    for magic, compression in _MAGICS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def index_path(dump_path: str) -> str:
+    """Indexes are saved beside their dump"""
+    return dump_path + INDEX_SUFFIX
+
+
+def fingerprint(file: typing.IO[bytes]) -> dict:
+    st = os.fstat(file.fileno())
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+class IndexEntry:
+    """A member of an indexed dump. It has the attributes of
+    `tarfile.TarInfo` which the exporters use, and the offset of its data in
+    the uncompressed tar."""
+
+    __slots__ = ("path", "name", "offset", "size")
+
+    def __init__(self, path: str, offset: int, size: int):
+        self.path = path
+        self.name = path
+        self.offset = offset
+        self.size = size
+
+    def isfile(self) -> bool:
+        return True
+
+
+class DumpIndex:
+    """Where the files of a dump are, to read any of them without reading the
+    dump up to it.
+
+    Files are recorded by their path, as decoded in the encoding of the dump,
+    with the offset and size of their data in the uncompressed tar. Gzip
+    dumps also have seek points every `span` bytes, from which inflate is
+    resumed to read a file. Other compressed dumps are decompressed from the
+    start to read a file."""
+
+    def __init__(
+        self,
+        fingerprint: dict,
+        encoding: str,
+        compression: str | None,
+        entries: list[IndexEntry],
+        points: list[SeekPoint],
+    ):
+        self.fingerprint = fingerprint
+        self.encoding = encoding
+        self.compression = compression
+        self.entries = entries
+        self.points = points
+
+    @classmethod
+    def build(
+        cls,
+        file: typing.IO[bytes],
+        encoding: str,
+        span: int = DEFAULT_SPAN,
+    ) -> "DumpIndex":
+        """Indexes a seekable dump from its current position in one pass.
+        Only the headers of an uncompressed tar are read."""
+        compression = detect_compression(file)
+
+        indexer = None
+        if compression is None:
+            tar = tarfile.open(fileobj=file, mode="r:", encoding=encoding)
+        elif compression == COMPRESSION_GZIP and (libz := load_libz()):
+            indexer = GzipIndexer(file, span, libz)
+            tar = tarfile.open(fileobj=indexer, mode="r|", encoding=encoding)
+        else:
+            tar = tarfile.open(fileobj=file, mode="r|*", encoding=encoding)
+
+        entries = []
+        try:
+            with tar:
+                for member in tar:
+                    if member.isfile():
+                        entries.append(
+                            IndexEntry(
+                                member.path, member.offset_data, member.size
+                            )
+                        )
+        finally:
+            if indexer is not None:
+                indexer.close()
+
+        points = indexer.points if indexer is not None else []
+        return cls(fingerprint(file), encoding, compression, entries, points)
+
+    @classmethod
+    def load(
+        cls, path: str, file: typing.IO[bytes], encoding: str
+    ) -> "DumpIndex | None":
+        """The index saved at `path`, unless it is missing or does not match
+        the dump and its encoding"""
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            d = json.load(f)
+
+        if (
+            d.get("version") != INDEX_VERSION
+            or d["fingerprint"] != fingerprint(file)
+            or d["encoding"] != encoding
+        ):
+            return None
+
+        entries = [IndexEntry(*entry) for entry in d["members"]]
+        points = [
+            SeekPoint(
+                out, offset, bits, zlib.decompress(base64.b64decode(window))
+            )
+            for out, offset, bits, window in d["points"]
+        ]
+        return cls(
+            d["fingerprint"], encoding, d["compression"], entries, points
+        )
+
+    def save(self, path: str):
+        d = {
+            "version": INDEX_VERSION,
+            "fingerprint": self.fingerprint,
+            "encoding": self.encoding,
+            "compression": self.compression,
+            "members": [
+                [entry.path, entry.offset, entry.size]
+                for entry in self.entries
+            ],
+            "points": [
+                [p.out, p.offset, p.bits, encode_window(p.window)]
+                for p in self.points
+            ],
+        }
+
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(d, f)
+        os.replace(tmp, path)
+
+    def read(self, file: typing.IO[bytes], entry: IndexEntry) -> bytes:
+        if self.compression is None:
+            file.seek(entry.offset)
+            return file.read(entry.size)
+
+        if self.points:
+            data = read_at(file, self.points, entry.offset, entry.size)
+            if data is not None:
+                return data
+
+        file.seek(0)
+        with _DECOMPRESSORS[self.compression](file) as f:
+            f.seek(entry.offset)
+            return f.read(entry.size)
+
+    def report(self) -> str:
+        s = f"Index: {len(self.entries)} files"
+        if self.compression is not None:
+            s += f", {self.compression} with {len(self.points)} seek points"
+        return s
+
+
+def encode_window(window: bytes) -> str:
+    return base64.b64encode(zlib.compress(window)).decode()
+
+
+class IndexedDump:
+    """Reads the files of a dump through its index, as an alternative to
+    reading it as a tar stream. Only `entries` are listed, which are all of
+    the files of the dump by default.
+
+    Each instance seeks in its own file, so that worker processes read from
+    a dump by opening it again."""
+
+    def __init__(
+        self,
+        file: typing.IO[bytes],
+        index: DumpIndex,
+        entries: Iterable[IndexEntry] | None = None,
+    ):
+        self.file = file
+        self.index = index
+        self.entries = list(entries if entries is not None else index.entries)
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        return iter(self.entries)
+
+    def extractfile(self, member: IndexEntry) -> io.BytesIO:
+        return io.BytesIO(self.index.read(self.file, member))
@@ -0,0 +1,87 @@
+import html
+import posixpath
+import re
+from typing import Callable
+
+_pat_internal_link = re.compile(r"\[\[(.+?)\]\]")
+
+# Characters which would end a Markdown link destination
+_URL_ESCAPES = str.maketrans({" ": "%20", "(": "%28", ")": "%29"})
+
+
+def url_path(path: str) -> str:
+    return path.translate(_URL_ESCAPES)
+
+
+class LinkResolver:
+    """Rewrites the internal `[[Page]]` and `[[alias>Page]]` links which
+    `convert` leaves in its output, by looking up their targets in the names
+    of all pages of the dump.
+
+    `url` returns the link destination for a target page, given the names of
+    the linking page and the target page."""
+
+    def __init__(self, names, url: Callable[[str, str], str]):
+        self.names = names
+        self.url = url
+
+        self.resolved = 0
+        self.unresolved: dict[str, int] = {}
+
+    def resolve(self, name: str, markdown: str) -> str:
+        if "[[" not in markdown:
+            return markdown
+
+        def replace(m: re.Match) -> str:
+            return self.replace(name, m.group(1)) or m.group(0)
+
+        return _pat_internal_link.sub(replace, markdown)
+
+    def replace(self, name: str, text: str) -> str | None:
+        # `convert` turned `>` of aliases into `:` and escaped the HTML
+        alias = text
+        target = self.find(name, html.unescape(text))
+
+        if target is None and ":" in text:
+            alias, rest = text.split(":", 1)
+            target = self.find(name, html.unescape(rest))
+
+        if target is None:
+            key = html.unescape(text)
+            self.unresolved[key] = self.unresolved.get(key, 0) + 1
+            return None
+
+        self.resolved += 1
+
+        page, anchor = target
+        url = url_path(self.url(name, page)) + anchor
+        return f"[{alias}]({url})"
+
+    def find(self, name: str, text: str) -> tuple[str, str] | None:
+        """Returns the page name and the anchor a link text points to"""
+        page, sep, anchor = text.partition("#")
+        anchor = sep + anchor
+
+        if page == "":
+            return (name, anchor) if anchor else None
+
+        if page.startswith("./") or page.startswith("../"):
+            page = posixpath.normpath(posixpath.join(name, page))
+
+        if page not in self.names:
+            return None
+
+        return page, anchor
+
+    def report(self, limit: int = 10) -> str:
+        unresolved = sum(self.unresolved.values())
+        s = f"Links: {self.resolved} resolved, {unresolved} unresolved"
+
+        if unresolved > 0:
+            targets = sorted(
+                self.unresolved.items(), key=lambda t: t[1], reverse=True
+            )
+            top = ", ".join(f"{t} ({n})" for t, n in targets[:limit])
+            s += f"\nUnresolved link targets: {top}"
+
+        return s
@@ -0,0 +1,295 @@
+import bisect
+import ctypes
+import ctypes.util
+import typing
+import zlib
+
+# Size of the history deflate refers back to, which inflate needs to resume
+WINDOW_SIZE = 32 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# windowBits of inflateInit2 for gzip streams
+_GZIP_WBITS = 15 + 32
+
+_Z_OK = 0
+_Z_STREAM_END = 1
+_Z_BUF_ERROR = -5
+
+# Makes inflate return at the end of each deflate block
+_Z_BLOCK = 5
+
+# Flags of data_type when inflate returns with Z_BLOCK. The lowest 3 bits are
+# the number of bits of the last byte read which are not used yet.
+_END_OF_BLOCK = 128
+_LAST_BLOCK = 64
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ("next_in", ctypes.c_void_p),
+        ("avail_in", ctypes.c_uint),
+        ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p),
+        ("avail_out", ctypes.c_uint),
+        ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p),
+        ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p),
+        ("zfree", ctypes.c_void_p),
+        ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int),
+        ("adler", ctypes.c_ulong),
+        ("reserved", ctypes.c_ulong),
+    ]
+
+
+_libz: ctypes.CDLL | None = None
+
+
+def load_libz() -> ctypes.CDLL | None:
+    """The zlib library, whose inflate can stop between deflate blocks unlike
+    the `zlib` module. None if it cannot be loaded."""
+    global _libz
+    if _libz is not None:
+        return _libz
+
+    name = ctypes.util.find_library("z")
+    if name is None:
+        return None
+    try:
+        lib = ctypes.CDLL(name)
+    except OSError:
+        return None
+
+    stream = ctypes.POINTER(_ZStream)
+    lib.zlibVersion.restype = ctypes.c_char_p
+    lib.inflateInit2_.argtypes = [
+        stream,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+    ]
+    lib.inflate.argtypes = [stream, ctypes.c_int]
+    lib.inflateReset.argtypes = [stream]
+    lib.inflateEnd.argtypes = [stream]
+
+    _libz = lib
+    return lib
+
+
+class SeekPoint:
+    """A deflate block boundary in a gzip file: the offset of its output, the
+    offset of the byte it starts in with the bits of that byte which precede
+    it, and the output before it which the block may refer back to"""
+
+    __slots__ = ("out", "offset", "bits", "window")
+
+    def __init__(self, out: int, offset: int, bits: int, window: bytes):
+        self.out = out
+        self.offset = offset
+        self.bits = bits
+        self.window = window
+
+
+class GzipIndexer:
+    """Decompresses a gzip file as it is read, like `gzip.GzipFile`, and
+    records a seek point at the first block boundary after every `span`
+    bytes of output, as zlib's examples/zran.c does.
+
+    Each gzip member also gets a point right after its header, where inflate
+    returns before the first block. Inflate resumed from a point stops at
+    the end of its member, and data running into the next member is read on
+    from that point."""
+
+    def __init__(self, file: typing.IO[bytes], span: int, libz: ctypes.CDLL):
+        self.file = file
+        self.span = span
+        self.libz = libz
+        self.points: list[SeekPoint] = []
+
+        self.stream = _ZStream()
+        ret = libz.inflateInit2_(
+            ctypes.byref(self.stream),
+            _GZIP_WBITS,
+            libz.zlibVersion(),
+            ctypes.sizeof(_ZStream),
+        )
+        if ret != _Z_OK:
+            raise RuntimeError(f"cannot initialize inflate: {ret}")
+
+        self.input = ctypes.create_string_buffer(_CHUNK_SIZE)
+        self.output = ctypes.create_string_buffer(_CHUNK_SIZE)
+
+        self.buffer = bytearray()
+        self.window = b""
+        self.total_in = 0
+        self.total_out = 0
+        self.last: int | None = None
+
+        self.ended = False
+        self.eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            self.step()
+
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def fill(self) -> bool:
+        """Reads more input once inflate has used all of it"""
+        stream = self.stream
+        if stream.avail_in > 0:
+            return True
+
+        data = self.file.read(_CHUNK_SIZE)
+        if not data:
+            return False
+
+        ctypes.memmove(self.input, data, len(data))
+        stream.next_in = ctypes.addressof(self.input)
+        stream.avail_in = len(data)
+        return True
+
+    def step(self):
+        stream = self.stream
+        if not self.fill():
+            if not self.ended:
+                raise RuntimeError("the gzip dump is truncated")
+            self.eof = True
+            return
+
+        if self.ended:
+            # Another gzip member may follow, or padding which ends the file
+            start = ctypes.string_at(stream.next_in, min(2, stream.avail_in))
+            if not _GZIP_MAGIC.startswith(start):
+                self.eof = True
+                return
+            self.libz.inflateReset(ctypes.byref(stream))
+            self.ended = False
+            self.last = None
+
+        stream.next_out = ctypes.addressof(self.output)
+        stream.avail_out = _CHUNK_SIZE
+
+        avail_in = stream.avail_in
+        ret = self.libz.inflate(ctypes.byref(stream), _Z_BLOCK)
+        if ret not in (_Z_OK, _Z_STREAM_END, _Z_BUF_ERROR):
+            message = (stream.msg or b"").decode(errors="replace")
+            raise RuntimeError(f"corrupt gzip dump: {message}")
+
+        self.total_in += avail_in - stream.avail_in
+        produced = _CHUNK_SIZE - stream.avail_out
+        if produced > 0:
+            out = ctypes.string_at(self.output, produced)
+            self.buffer += out
+            self.window = (self.window + out)[-WINDOW_SIZE:]
+            self.total_out += produced
+
+        if ret == _Z_STREAM_END:
+            self.ended = True
+            return
+
+        flags = stream.data_type
+        if (
+            flags & _END_OF_BLOCK
+            and not flags & _LAST_BLOCK
+            and (self.last is None or self.total_out - self.last >= self.span)
+        ):
+            self.points.append(
+                SeekPoint(
+                    self.total_out, self.total_in, flags & 7, self.window
+                )
+            )
+            self.last = self.total_out
+
+    def close(self):
+        self.libz.inflateEnd(ctypes.byref(self.stream))
+
+
+class _BitShifter:
+    """Drops the first `bits` bits of a stream read in chunks. Deflate reads
+    bytes from their lowest bit, so the stream is shifted as a little-endian
+    number."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.carry = b""
+
+    def shift(self, chunk: bytes) -> bytes:
+        data = self.carry + chunk
+        self.carry = data[-1:]
+        n = int.from_bytes(data, "little") >> self.bits
+        return n.to_bytes(len(data), "little")[:-1]
+
+    def flush(self) -> bytes:
+        """The bits left of the last byte"""
+        carry, self.carry = self.carry, b""
+        return bytes([carry[0] >> self.bits]) if carry else b""
+
+
+def read_at(
+    file: typing.IO[bytes], points: list[SeekPoint], offset: int, size: int
+) -> bytes | None:
+    """Reads `size` bytes at `offset` of the output of a gzip file, resuming
+    inflate at the last seek point before it, and at the start of the next
+    gzip members if the data runs into them. None if a member ends without a
+    point after it, as in an index of another file."""
+    i = bisect.bisect_right(points, offset, key=lambda p: p.out) - 1
+    if i < 0:
+        return None
+
+    out = bytearray()
+    while True:
+        point = points[i]
+        out += inflate_member(
+            file, point, offset + len(out) - point.out, size - len(out)
+        )
+        if len(out) >= size:
+            return bytes(out[:size])
+
+        i += 1
+        if i == len(points) or points[i].out != offset + len(out):
+            return None
+
+
+def inflate_member(
+    file: typing.IO[bytes], point: SeekPoint, skip: int, size: int
+) -> bytes:
+    """Inflates up to `size` bytes after the first `skip` bytes from a seek
+    point, until the end of its gzip member. Only the `zlib` module is
+    needed, as the bits preceding the point are shifted out of the input."""
+    shifter = None
+    start = point.offset
+    if point.bits > 0:
+        shifter = _BitShifter(8 - point.bits)
+        start -= 1
+
+    if point.window:
+        inflater = zlib.decompressobj(-15, zdict=point.window)
+    else:
+        inflater = zlib.decompressobj(-15)
+
+    file.seek(start)
+    out = bytearray()
+    while len(out) < size and not inflater.eof:
+        chunk = file.read(_CHUNK_SIZE)
+        if shifter is not None:
+            chunk = shifter.shift(chunk) if chunk else shifter.flush()
+        if not chunk:
+            break
+
+        data = inflater.decompress(chunk)
+        if skip > 0:
+            n = min(skip, len(data))
+            data = data[n:]
+            skip -= n
+        out += data
+
+    return bytes(out[:size])